@@ -18,13 +18,12 @@ from src.datasets import process_kitti_labels
 from src.datasets import kitti_collate_fn
 from src.datasets import KittiDataset, KittiMOTDataset # Dataloader
 from src.utils import utils, Boxes
-from src.tools import train_test
+from src.tools import train_test, track_eval
 # from src.pytorch_nms import nms as NMS
 
 
 from torchvision import datasets as dset
 import torchvision
-from torch.utils import tensorboard
 
 import time
 
@@ -36,7 +35,7 @@ print("\n--- Setting up the training/testing \n")
 
 ap = argparse.ArgumentParser()
 ap.add_argument("-name", "--experiment_comment", required = True, help="Comments for the experiment")
-ap.add_argument("-mode", "--mode",required = True, choices=['train', 'test'])
+ap.add_argument("-mode", "--mode",required = True, choices=['train', 'test', 'track_eval'])
 ap.add_argument("-weights", "--weights",default = None)
 ap.add_argument("-resume", "--resume", default = False)
 ap.add_argument("-epoch", "--epoch")
@@ -110,14 +109,20 @@ lr_scheduler = optim.lr_scheduler.MultiStepLR(optimizer, milestones = cfg.TRAIN.
                 gamma=cfg.TRAIN.LR_DECAY, last_epoch=-1)
 
 if checkpoint:
-    model.load_state_dict(checkpoint['model_state_dict'], strict=False)
-    optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
-    lr_scheduler.load_state_dict(checkpoint['lr_scheduler'])
+    # Weights whose shape changed (e.g. a different ROI_HEADS.BOX_HEAD) are left at their initialization
+    model_state = model.state_dict()
+    state_dict = {k: v for k, v in checkpoint['model_state_dict'].items()
+                    if k not in model_state or v.shape == model_state[k].shape}
+    skipped = sorted(set(checkpoint['model_state_dict']) - set(state_dict))
+    if skipped:
+        print("    :Not loading weights with a different shape: {} \n".format(", ".join(skipped)))
+    model.load_state_dict(state_dict, strict=False)
+    if not skipped:
+        optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
+        lr_scheduler.load_state_dict(checkpoint['lr_scheduler'])
 
 
 model.train() if mode=="train" else model.eval()
-
-tb_writer = tensorboard.SummaryWriter(graph_dir)
 #-----------------------------------------------#
 
 
@@ -168,7 +173,7 @@ elif mode=="validation":
     test_loader = torch.utils.data.DataLoader(val_dataset, batch_size=1,
                 shuffle=cfg.TRAIN.DSET_SHUFFLE, collate_fn = kitti_collate_fn, drop_last=True)
 
-else:
+elif mode=="test":
     print("--- Loading Test Dataset \n ")
 
     dataset = KittiMOTDataset(dataset_path, transform = transform, cfg = cfg) #---- Dataloader
@@ -189,8 +194,12 @@ epochs = cfg.TRAIN.EPOCHS
 
 if mode=="train":
     print("Starting the training in 3.   2.   1.   Go \n")
-    train_test.train(model, train_loader, val_loader, optimizer, epochs, tb_writer, lr_scheduler, device, model_save_dir, cfg)
+    train_test.train(model, train_loader, val_loader, optimizer, epochs, graph_dir, lr_scheduler, device, model_save_dir, cfg)
 
 if mode=='test':
     print("Starting the inference in 3.   2.   1.   Go \n")
     train_test.test(model, test_loader, device, results_dir)
+
+if mode=='track_eval':
+    print("Tracking all the sequences in 3.   2.   1.   Go \n")
+    track_eval.evaluate(model, dataset_path, transform, device, results_dir, cfg)
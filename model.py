@@ -1,12 +1,23 @@
 import torch
 import numpy as np
 from src.architecture import FasterRCNN
+from src.config.defaults import conf_params
+
+
+def upgrade_cfg(cfg):
+    """
+    Config stored in a checkpoint, with the keys added after it was saved set to their defaults.
+    """
+    upgraded = conf_params.clone()
+    upgraded.set_new_allowed(True)
+    upgraded.merge_from_other_cfg(cfg)
+    return upgraded
 
 
 def create_model(checkpoint_path):
     # print("Using Model {}".format(checkpoint_path))
     checkpoint = torch.load(checkpoint_path)
-    cfg = checkpoint['cfg']
+    cfg = upgrade_cfg(checkpoint['cfg'])
 
     device = torch.device("cuda") if (torch.cuda.is_available() and cfg.USE_CUDA) else torch.device("cpu")
     print("Using the device for training: {} \n".format(device))
@@ -7,7 +7,6 @@ from os.path import isfile, join
 import torch
 import numpy as np
 import time
-import matplotlib.pyplot as plt
 
 import rospy
 import cv2
@@ -15,13 +14,18 @@ import cv2
 from src.utils import utils
 from src.eval.detection_map import DetectionMAP
 from src.config import Cfg as cfg
-from src.tracker.track import MultiObjTracker
+from src.tracker.track import build_tracker
+from src.tracker.keyframe import build_keyframe_scheduler
+from src.detection.crop_refiner import build_crop_refiner
 from src.utils import Instances
 from src.utils import Boxes
 from src.utils import utils
 from src.utils import projection
+from src.utils.msg_builder import instances_to_msg
+from src.utils.track_log import TrackLogWriter
+from src.utils.renderer import RasterRenderer
 
-from sensor_msgs.msg import Image
+from sensor_msgs.msg import Image, CompressedImage
 from visualization_msgs.msg import Marker, MarkerArray
 from cv_bridge import CvBridge, CvBridgeError
 from denso.msg import BoundingBox2D, Classification2D, Variance2D, Instances as Instances_msg
@@ -40,15 +44,32 @@ class model_inference(object):
         rospy.loginfo("Model weights path: %s", checkpoint_path)
 
         self.model = create_model(checkpoint_path)
-        self.tracker = MultiObjTracker(max_age=1)
+        self.tracker = build_tracker(cfg, max_age=1)
+        # Sized from the incoming images, see `keyframe_scheduler`
+        self.keyframes = None
+        # None when the frames between keyframes only extrapolate the tracks
+        self.refiner = build_crop_refiner(self.model, cfg)
+        self.last_stamp = None
         self.is_training = False
         self.cv_bridge = CvBridge()
+        # Calibration of the sequence, read once
+        self.calibration = projection.get_calibration(rospy.get_param('~calibration', projection.DEFAULT_CALIB))
+        # Sized from the incoming images, see `render`
+        self.renderer = None
         self.img_transform = utils.image_transform(cfg)
 
         self.output_image_pub = rospy.Publisher("/output_img", Image, queue_size=30)
+        # Optional JPEG copy of the debug image, for remote viewing
+        self.compressed_image_pub = None
+        if rospy.get_param('~compressed_image', False):
+            self.compressed_image_pub = rospy.Publisher("/output_img/compressed", CompressedImage, queue_size=30)
+        self.jpeg_quality = int(rospy.get_param('~jpeg_quality', 80))
+        # The debug image is rendered every image_decimation frames at most
+        self.image_decimation = max(int(rospy.get_param('~image_decimation', 1)), 1)
         self.detected_boxes = rospy.Publisher("/detected_boxes", Instances_msg, queue_size=30)
         self.visualization_markers = rospy.Publisher("/visualization_array", MarkerArray, queue_size=30)
-        self.output = []
+        # Tracks of every frame, streamed to <track_log>.<index>.trk, see src/utils/track_log.py
+        self.track_log = TrackLogWriter(rospy.get_param('~track_log', 'track_log'))
         self.frame = 0
         rospy.loginfo("Model is built and ready to be used")
 
@@ -66,49 +87,102 @@ class model_inference(object):
         in_image = in_image.unsqueeze(0).to("cuda")
         
         with torch.no_grad():
-            _, instances, _, _ = self.model(in_image, is_training=self.is_training)
+            # Kalman time step from the image timestamps, in nominal frame periods (dropped or late frames give dt > 1)
+            now = stamp.to_sec()
+            dt = 1. if self.last_stamp is None else max(now - self.last_stamp, 0.) * cfg.TRACKING.FRAME_RATE
+            self.last_stamp = now
+
+            # The tracks are predicted before the detection, so that the confirmed ones can seed the proposals
+            self.tracker.predict(dt)
+            keyframes = self.keyframe_scheduler(ros_img.shape[1])
+            detect = keyframes is None or keyframes.should_detect(
+                now, self.tracker.track_boxes(), self.tracker.track_variances())
+
+            if detect:
+                seed_boxes = [Boxes(torch.from_numpy(self.tracker.confirmed_boxes()).float())] if cfg.TRACKING.SEED_PROPOSALS else None
+                _, instances, _, _ = self.model(in_image, is_training=self.is_training, seed_boxes=seed_boxes)
+
+                for instance in instances:
+                    detections = instance.to_numpy(["pred_boxes", "pred_variance"])
+                    self.tracker.update(detections["pred_boxes"], detections["pred_variance"])
+                if keyframes is not None:
+                    keyframes.keyframe(now)
+            elif self.refiner is not None:
+                refined = self.refiner(in_image, torch.from_numpy(self.tracker.track_boxes())).to_numpy(
+                    ["pred_boxes", "pred_variance", "box_index"])
+                self.tracker.update_tracks(refined["box_index"], refined["pred_boxes"], refined["pred_variance"])
+
+            track_boxes, track_variances = self.tracker.track_boxes(), self.tracker.track_variances()
+            updated_instances = Instances((1242,375), pred_boxes=Boxes(torch.from_numpy(track_boxes)), pred_variance=torch.from_numpy(track_variances))
+            self.track_log.write(self.frame, now, self.tracker.track_ids(), track_boxes, track_variances)
+
+            if detect:
+                print("Proposals: %d, Seeds: %d, Detection: %d, Tracked: %d"%(self.model.detector.num_proposals_kept[0], self.model.detector.num_seeds[0], len(instances[0]), len(updated_instances)))
+            else:
+                print("Extrapolated (dt = %.2f), Refined: %d, Tracked: %d"%(dt, len(refined["box_index"]) if self.refiner is not None else 0, len(updated_instances)))
+
+            # Each output is only built when someone is subscribed to it: a headless run stops here
+            publish_image = self.frame % self.image_decimation == 0 and (
+                self.output_image_pub.get_num_connections() > 0 or
+                (self.compressed_image_pub is not None and self.compressed_image_pub.get_num_connections() > 0))
+            publish_markers = self.visualization_markers.get_num_connections() > 0
+
+            if self.detected_boxes.get_num_connections() > 0:
+                self.detected_boxes.publish(instances_to_msg(Instances_msg, updated_instances.to_numpy(), stamp=stamp))
+
+            if publish_image or publish_markers:
+                ground_points, ground_variance = projection.ground_project(updated_instances, calibration=self.calibration,
+                                                                           mode=cfg.TRACKING.GROUND_PROJECTION)
+
+            if publish_image:
+                # The same projection is drawn, before the variance filter. The incoming rgb8 image is drawn as is
+                output_img = self.render(ros_img, updated_instances, (ground_points, ground_variance))
+                self.publish_image(output_img, stamp)
+
+            if publish_markers:
+                #Filter detections with large variance
+                idx = np.asarray(np.amax(ground_variance, axis=1) < 10.0)
+                ground_boxes = self.markers_from_instances(ground_points[idx], ground_variance[idx], stamp)
+                self.visualization_markers.publish(ground_boxes)
 
-            instances[0].toList()
 
-            for instance in instances:
-                self.tracker.predict()
-                self.tracker.update(instance.pred_boxes, instance.pred_variance)
-
-            updated_instances = Instances((1242,375), pred_boxes=Boxes(torch.tensor([x.mean[:4] for x in self.tracker.tracks])), pred_variance=torch.tensor([x.get_diag_var()[:4] for x in self.tracker.tracks]))
-            self.output.append([x.mean[:4] for x in self.tracker.tracks]+[x.get_diag_var()[:4] for x in self.tracker.tracks])
-                
-            print("Detection: %d, Tracked: %d"%(len(instances[0]), len(updated_instances)))
-            ground_points, ground_variance = projection.ground_project(updated_instances)
-
-            #Filter detections with large variance
-            idx = np.asarray(np.amax(ground_variance, axis=1) < 10.0)
-            # print(idx)
-            ground_points = ground_points[idx]
-            ground_variance = ground_variance[idx]
+        rospy.loginfo("Published %s", self.frame)
+        self.frame +=1
 
-            updated_instances.toList()
-            
-            in_image = torch.squeeze(in_image, 0)
-            output_img = utils.single_disk_logger(in_image, updated_instances, None, image_path=path)
 
-        # for img in output_imgs:
-            output_img = self.cv_bridge.cv2_to_imgmsg(output_img, encoding="rgb8")
-            output_img.header.stamp = stamp
+    def keyframe_scheduler(self, image_width):
+        """The keyframe scheduler for images of `image_width` (border trigger), re-created
+        when the width changes. None when the detector runs on every frame."""
+        if self.keyframes is None or self.keyframes.image_width != image_width:
+            self.keyframes = build_keyframe_scheduler(cfg, image_width)
+        return self.keyframes
 
-            instances = Instances_msg()
-            instances.detections = [BoundingBox2D(*x) for x in updated_instances.pred_boxes]
-            instances.variances = [Variance2D(*x) for x in updated_instances.pred_variance]
 
-            ground_boxes = self.markers_from_instances(ground_points, ground_variance, stamp)
+    def render(self, image, instances, projection):
+        """Draw with a renderer of the size of `image`, re-created when the size changes
+        (the KITTI sequences have slightly different image sizes)."""
+        image_size = tuple(image.shape[:2])
+        if self.renderer is None or self.renderer.image_size != image_size:
+            self.renderer = RasterRenderer(cfg.INPUT.LABELS_TO_TRAIN, image_size)
+        return self.renderer.render(image, instances, projection)
 
-            self.output_image_pub.publish(output_img)
-            self.detected_boxes.publish(instances)
-            self.visualization_markers.publish(ground_boxes)
-            rospy.loginfo("Markers: %s", ground_boxes)
 
+    def publish_image(self, output_img, stamp):
+        """Publish the rendered (H, W, 3) rgb8 image on the raw and compressed topics that have subscribers."""
+        if self.output_image_pub.get_num_connections() > 0:
+            msg = self.cv_bridge.cv2_to_imgmsg(np.ascontiguousarray(output_img), encoding="rgb8")
+            msg.header.stamp = stamp
+            self.output_image_pub.publish(msg)
 
-        rospy.loginfo("Published %s", self.frame)
-        self.frame +=1
+        if self.compressed_image_pub is not None and self.compressed_image_pub.get_num_connections() > 0:
+            ok, jpeg = cv2.imencode(".jpg", cv2.cvtColor(output_img, cv2.COLOR_RGB2BGR),
+                                    [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality])
+            if ok:
+                msg = CompressedImage()
+                msg.header.stamp = stamp
+                msg.format = "jpeg"
+                msg.data = jpeg.tobytes()
+                self.compressed_image_pub.publish(msg)
 
 
     def markers_from_instances(self, points, variances, stamp):
@@ -148,10 +222,11 @@ def main(args):
 
     rospy.init_node('model')
     model_infer = model_inference()
-    sub = rospy.Subscriber("/image_raw", Image, model_infer.single_img_inference)
+    # Only the latest image is queued: a slow frame drops the ones behind it instead of adding latency,
+    # the Kalman time step accounts for the dropped frames
+    sub = rospy.Subscriber("/image_raw", Image, model_infer.single_img_inference, queue_size=1, buff_size=2**24)
     rospy.spin()
-    if rospy.is_shutdown():
-        np.savetxt('data.csv', np.array(model_infer.output), delimiter=',')
+    model_infer.track_log.close()
 
 
 if __name__ == '__main__':
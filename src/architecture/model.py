@@ -12,7 +12,7 @@ from src.rpn import RPN
 from src.detection import Detector
 # from src.NMS import batched_nms
 import torch.nn.functional as F
-from src.utils import utils
+from src.utils import utils, set_check_mode, flush_checks
 
 class FasterRCNN(nn.Module):
 	"""docstring for generalized_faster_rcnn"""
@@ -23,18 +23,23 @@ class FasterRCNN(nn.Module):
 		# print(self.backbone)
 		self.rpn = RPN(self.cfg, self.backbone.out_channels)
 		self.detector = Detector(self.cfg, self.backbone.stride, self.backbone.out_channels)
+		set_check_mode(self.cfg.CHECK_MODE)
 
 
-	def forward(self, image, gt_target=None, is_training=False):
+	def forward(self, image, gt_target=None, is_training=False, return_detections=None, seed_boxes=None):
 		"""
 		Args:
 			image: 	   Tensor[N,H,W,C], N is batch_size
 			gt_target: Tensor[Instances], each instance has attribute 'gt_boxes' and 'gt_classes'
+			return_detections: bool, also run detection inference in training. Defaults to cfg.TRAIN.LOG_DETECTIONS
+			seed_boxes: List[Boxes], length N, inference only. Boxes added to the proposals of every image, e.g. the predicted
+						boxes of the confirmed tracks. If there is at least one seed, the RPN keeps
+						cfg.TRACKING.SEEDED_PRE_NMS_TOPK/SEEDED_POST_NMS_TOPK proposals
 		
 		Returns:
-			rpn_proposals:  List[Instances], length of list is N. Each instance of the list have attribute 'proposal_boxes' and 'objectness_logits'
+			rpn_proposals:  RaggedInstances, behaves as a List[Instances] of length N. Each instance of the list have attribute 'proposal_boxes' and 'objectness_logits'
 			rpn_losses: 	Dict, the dict have two losses - classification_loss and regression loss  
-			prediction:		List[Instances], length of list is N. Each instance stores the topk most confidence detections. 
+			prediction:		List[Instances], length of list is N. Each instance stores the topk most confidence detections. Empty list in training unless return_detections.
 							It has attributes - 'pred_boxes', 'scores' , 'pred_sigma', 'pred_classes'
 			detection_loss: Dict, classfication loss and bounding box loss
 
@@ -44,9 +49,17 @@ class FasterRCNN(nn.Module):
 		
 		feature_map = self.backbone(image) # feature_map : [N, self.backbone_net.out_channels, H, W]
 
-		rpn_proposals, rpn_losses = self.rpn(feature_map, gt_target, image_size, is_training) # topK proposals sorted in decreasing order of objectness score and losses: []
+		if seed_boxes is not None and not is_training and any(len(boxes) > 0 for boxes in seed_boxes):
+			# Tracked objects come as seeds, the RPN only has to find the new ones. Without any seed
+			# (startup, no confirmed track) the full RPN budget is kept to find the objects
+			topk = dict(pre_nms_topk=self.cfg.TRACKING.SEEDED_PRE_NMS_TOPK, post_nms_topk=self.cfg.TRACKING.SEEDED_POST_NMS_TOPK)
+		else:
+			seed_boxes, topk = None, {}
+
+		rpn_proposals, rpn_losses = self.rpn(feature_map, gt_target, image_size, is_training, **topk) # topK proposals sorted in decreasing order of objectness score and losses: []
 		
-		detections, detection_loss = self.detector(feature_map, rpn_proposals, gt_target, is_training)
+		detections, detection_loss = self.detector(feature_map, rpn_proposals, gt_target, is_training, return_detections, seed_boxes)
+		flush_checks() # single sync for the deferred checks of this pass, no-op otherwise
 
 		return rpn_proposals, detections, rpn_losses, detection_loss 
 
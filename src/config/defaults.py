@@ -22,6 +22,9 @@ conf_params.PATH.LOGS = "/network/home/bansaldi/Denso-OD/logs"
 ##### Whether to use cuda or not #####
 conf_params.USE_CUDA = True ## 
 
+##### Runtime validation of tensors, see src/utils/checks.py #####
+conf_params.CHECK_MODE = 'debug' # choices = ['debug', 'deferred', 'off']. 'off' removes the host syncs of the checks, for deployment
+
 ###### Reproducibility in randomization ######
 conf_params.RANDOMIZATION = CN()
 conf_params.RANDOMIZATION.SEED = 5
@@ -43,6 +46,7 @@ conf_params.TRAIN.LR_DECAY = 0.5 ## Decay learning rate by this factor every cer
 conf_params.TRAIN.LR_DECAY_EPOCHS = 15 	## Epochs after which we should act upon learning rate
 conf_params.TRAIN.SAVE_MODEL_EPOCHS = 5 ## save model at every certain epochs
 conf_params.TRAIN.DATASET_DIVIDE = 0.9 ## This fraction of dataset is for training, rest for testing.
+conf_params.TRAIN.LOG_DETECTIONS = False ## Run detection inference on the logged training iterations and the first validation batch, and send the first image to tensorboard
 
 """
 For Testing
@@ -114,6 +118,8 @@ conf_params.RPN.ACTIVATION_ALPHA = 1
 conf_params.RPN.LOSS_WEIGHT = 1.0
 conf_params.RPN.BATCH_SIZE_PER_IMAGE = 256
 conf_params.RPN.NMS_THRESH = 0.7
+### choices = ['torchvision', 'grid', 'fast', 'cluster', 'matrix'], see src/nms/engine.py
+conf_params.RPN.NMS_BACKEND = 'torchvision'
 conf_params.RPN.POSITIVE_FRACTION = 0.5
 conf_params.RPN.MIN_SIZE_PROPOSAL = 5
 conf_params.RPN.PRE_NMS_TOPK_TRAIN = 12000
@@ -135,12 +141,16 @@ conf_params.ROI_HEADS.BATCH_SIZE_PER_IMAGE = 512
 conf_params.ROI_HEADS.POSITIVE_FRACTION = 0.25
 conf_params.ROI_HEADS.SCORE_THRESH_TEST = 0.6
 conf_params.ROI_HEADS.NMS_THRESH_TEST = 0.5
+conf_params.ROI_HEADS.NMS_BACKEND = 'torchvision' # Same choices as RPN.NMS_BACKEND
 conf_params.ROI_HEADS.PROPOSAL_APPEND_GT = True
 conf_params.ROI_HEADS.IOU_THRESHOLDS = [0.5]
 conf_params.ROI_HEADS.IOU_LABELS = [0, 1]
 # conf_params.ROI_HEADS.POOLER_TYPE = "ROIPool"
 conf_params.ROI_HEADS.POOLER_TYPE = "ROIAlign"
+conf_params.ROI_HEADS.BOX_HEAD = 'FC' # choices = ['FC', 'LIGHT']
 conf_params.ROI_HEADS.FC_DIM = 1024
+conf_params.ROI_HEADS.FC_RANK = (0, 0) # Rank of the factorized fc1, fc2 layers, 0 for full rank. Set by src/tools/compress_box_head.py
+conf_params.ROI_HEADS.DROPOUT_RATE = 0.0 # Dropout after fc1 and fc2. Has to be > 0 when MC_DROPOUT is used.
 conf_params.ROI_HEADS.CLS_AGNOSTIC_BBOX_REG = True
 conf_params.ROI_HEADS.SMOOTH_L1_BETA = 0.0
 conf_params.ROI_HEADS.POOLER_RESOLUTION = 14 # After this there is MaxPool2D, so final resolution is 7x7
@@ -148,3 +158,65 @@ conf_params.ROI_HEADS.POOLER_SAMPLING_RATIO = 0
 conf_params.ROI_HEADS.BBOX_REG_WEIGHTS = (10.0, 10.0, 10.0, 10.0)
 # conf_params.ROI_HEADS.BBOX_REG_WEIGHTS = (10.0, 10.0, 5.0, 5.0)
 
+## Box head used when BOX_HEAD = 'LIGHT': AvgPool to POOLED_SIZE and 1x1 conv to REDUCED_CHANNELS before fc1
+conf_params.ROI_HEADS.LIGHT_HEAD = CN()
+conf_params.ROI_HEADS.LIGHT_HEAD.REDUCED_CHANNELS = 128
+conf_params.ROI_HEADS.LIGHT_HEAD.POOLED_SIZE = 4 # 0 keeps the 7x7 resolution
+
+## Per frame budget of proposals sent to the box head at inference, see src/detection/proposal_utils.py
+conf_params.ROI_HEADS.PROPOSAL_BUDGET = CN()
+conf_params.ROI_HEADS.PROPOSAL_BUDGET.MODE = 'none' # choices = ['none', 'mass', 'logit', 'knee']
+conf_params.ROI_HEADS.PROPOSAL_BUDGET.MIN_PROPOSALS = 50
+conf_params.ROI_HEADS.PROPOSAL_BUDGET.MAX_PROPOSALS = 1000
+conf_params.ROI_HEADS.PROPOSAL_BUDGET.MASS_FRACTION = 0.9
+conf_params.ROI_HEADS.PROPOSAL_BUDGET.MIN_LOGIT = 0.0
+conf_params.ROI_HEADS.PROPOSAL_BUDGET.KNEE_SCALE = 2.0 # Fit with test_functionality/detection/proposal_budget_eval.py
+
+## BayesOD style Monte-Carlo dropout sampling of the box head at inference
+conf_params.ROI_HEADS.MC_DROPOUT = CN()
+conf_params.ROI_HEADS.MC_DROPOUT.ENABLED = False
+conf_params.ROI_HEADS.MC_DROPOUT.NUM_SAMPLES = 10
+conf_params.ROI_HEADS.MC_DROPOUT.DIRICHLET_PRIOR = 0.0 # Prior count per class, 1/(NUM_CLASSES+1) is the non-informative prior
+
+
+"""
+For Tracking
+"""
+conf_params.TRACKING = CN()
+conf_params.TRACKING.KALMAN_FILTER = 'decoupled' # choices = ['decoupled', 'full'], see src/tracker/kalman_filter.py
+conf_params.TRACKING.ASSOCIATION = 'iou' # choices = ['iou', 'gated']. 'gated' gates with the Mahalanobis distance using the predicted variances, compare with src/tools/track_eval.py --association
+conf_params.TRACKING.IOU_WEIGHT = 0.5 # Weight of 1 - IoU in the gated cost, the normalized Mahalanobis distance gets 1 - IOU_WEIGHT
+conf_params.TRACKING.GATED_MAX_COST = 0.4 # Pairs with a larger gated cost are not matched. Below IOU_WEIGHT, so that pairs without overlap are rejected
+conf_params.TRACKING.SPARSE_ASSOCIATION = True # Solve the association per connected component of the feasible pairs, see src/tracker/sparse_assignment.py
+conf_params.TRACKING.ASSOCIATION_WORKERS = 0 # Threads for the components, 0 for sequential
+conf_params.TRACKING.SEED_PROPOSALS = False # Add the predicted boxes of the confirmed tracks to the proposals of the next frame (model_node)
+conf_params.TRACKING.SEEDED_PRE_NMS_TOPK = 2000 # RPN proposals kept before NMS when there is at least one seed, instead of RPN.PRE_NMS_TOPK_TEST
+conf_params.TRACKING.SEEDED_POST_NMS_TOPK = 300 # RPN proposals kept after NMS when there is at least one seed, instead of RPN.POST_NMS_TOPK_TEST
+conf_params.TRACKING.GROUND_PROJECTION = 'unscented' # choices = ['unscented', 'linear', 'sampling'], propagation of the box uncertainty to the ground plane (model_node), see src/utils/projection.py
+conf_params.TRACKING.FRAME_RATE = 10.0 # Nominal frame rate (Hz), the Kalman filter time step is the time between two images times the frame rate
+## Keyframe detection (model_node): the detector only runs on keyframes, the tracks are extrapolated in between, see src/tracker/keyframe.py
+conf_params.TRACKING.KEYFRAME = CN()
+conf_params.TRACKING.KEYFRAME.ENABLED = False
+conf_params.TRACKING.KEYFRAME.MAX_INTERVAL = 3 # Frames between two keyframes at most
+conf_params.TRACKING.KEYFRAME.MAX_STALENESS = 0.5 # Seconds between two keyframes at most
+conf_params.TRACKING.KEYFRAME.STD_RATIO = 0.2 # Detect when the std of a track coordinate exceeds this fraction of its box height
+conf_params.TRACKING.KEYFRAME.BORDER_MARGIN = 20.0 # Detect when a track is this close (pixels) to the left/right border, negative to disable
+## Re-detection of the tracks in crops around their predicted boxes on the frames between keyframes, see src/detection/crop_refiner.py
+conf_params.TRACKING.CROP_REFINE = CN()
+conf_params.TRACKING.CROP_REFINE.ENABLED = False
+conf_params.TRACKING.CROP_REFINE.CROP_SIZE = 192 # Side (pixels) of the crops given to the backbone
+conf_params.TRACKING.CROP_REFINE.PADDING = 0.5 # Context around a box, fraction of its largest side on every side
+conf_params.TRACKING.CROP_REFINE.SCORE_THRESH = 0.3 # Minimum foreground probability of a re-detection
+conf_params.TRACKING.CROP_REFINE.BATCH_SIZE = 32 # Crops per backbone pass
+## Offline evaluation over all the sequences, see src/tools/track_eval.py
+conf_params.TRACKING.EVAL_WORKERS = 4 # Tracker processes
+conf_params.TRACKING.EVAL_BATCH_SIZE = 8 # Frames per detection batch
+conf_params.TRACKING.EVAL_IOU = 0.5 # IoU of a true positive track
+
+"""
+For Logging, see src/utils/async_logger.py
+"""
+conf_params.LOGGING = CN()
+conf_params.LOGGING.WORKERS = 2 # Processes rendering and saving the detection figures
+conf_params.LOGGING.QUEUE_SIZE = 64 # Pending records at most, per queue
+conf_params.LOGGING.POLICY = 'drop' # choices = ['drop', 'block']. What to do with a record when the queue is full: drop it, or wait (backpressure)
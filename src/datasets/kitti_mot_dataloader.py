@@ -12,7 +12,7 @@ import time
 class KittiMOTDataset(Dataset):
     """Kitti Dataset Reader."""
 
-    def __init__(self, root_dir,track="0001", transform=None, cfg = None):
+    def __init__(self, root_dir,track="0001", transform=None, cfg = None, all_frames=False):
         """
         Args:
             root_dir (string): Path to the dataset.
@@ -21,10 +21,15 @@ class KittiMOTDataset(Dataset):
                 on a sample.
 
             cfg: config file
+
+            all_frames (bool): keep the frames of any image size and all of them.
+                By default only the 1242x375 frames are kept, at most
+                cfg.TRAIN.DATASET_LENGTH of them.
         """
 
         self.cfg = cfg
         self.transform = transform
+        self.all_frames = all_frames
 
         ## has all the annotations
         '''
@@ -51,7 +56,7 @@ class KittiMOTDataset(Dataset):
             class_list = []
             track_list = []
             img_size = Image.open(name).size
-            if img_size == (1242,375) and i<self.cfg.TRAIN.DATASET_LENGTH:
+            if self.all_frames or (img_size == (1242,375) and i<self.cfg.TRAIN.DATASET_LENGTH):
                 for j,obj in enumerate(object_rows):
                     obj = obj.split()
                     if i==int(obj[0]):
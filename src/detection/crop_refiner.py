@@ -0,0 +1,131 @@
+"""
+Re-detection of tracked objects in crops around their predicted boxes, a cheap
+measurement for the frames between two full-frame detections.
+"""
+
+import torch
+from torchvision.ops import roi_align
+
+from .fast_rcnn import FastRCNNOutputs
+from ..utils import Boxes, Instances, RaggedInstances
+
+
+class CropRefiner(object):
+    """
+    Refine a set of boxes, e.g. the Kalman predictions of the tracks, with the
+    backbone and the box head of a `FasterRCNN`.
+
+    A square region around every box, padded by `padding` times its largest
+    side, is cropped from the image and resized to `crop_size` x `crop_size`
+    (one `roi_align` for all the boxes), so every object is seen at about the
+    same reduced resolution. The crops go through the backbone in batches, and
+    the box head regresses the box from the predicted box itself as the only
+    proposal of its crop. The cost grows with the number of boxes, not with the
+    image area, and there is no RPN and no NMS.
+    """
+
+    def __init__(self, model, crop_size=192, padding=0.5, score_thresh=0.3, batch_size=32):
+        """
+        Args:
+            model (FasterRCNN): the detector, its backbone and detector (ROI heads) are used.
+            crop_size (int): side of the crops fed to the backbone, in pixels.
+            padding (float): context around a box, as a fraction of its largest side on every side.
+            score_thresh (float): minimum foreground probability of a refined box,
+                the others are dropped (the object was not found in its crop).
+            batch_size (int): crops per backbone pass.
+        """
+        self.backbone = model.backbone
+        self.detector = model.detector
+        self.crop_size = crop_size
+        self.padding = padding
+        self.score_thresh = score_thresh
+        self.batch_size = batch_size
+
+    def crop_regions(self, boxes):
+        """
+        Args:
+            boxes (Tensor): (N, 4) boxes (x1, y1, x2, y2) in image coordinates.
+
+        Returns:
+            Tensor: (N, 4) square regions around the boxes, not clipped to the image.
+            Tensor: (N,) scale from image to crop coordinates of every region.
+        """
+        centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+        side = (boxes[:, 2:] - boxes[:, :2]).max(dim=1)[0].clamp(min=1.0) * (1 + 2 * self.padding)
+        regions = torch.cat([centers - side[:, None] / 2, centers + side[:, None] / 2], dim=1)
+        return regions, self.crop_size / side
+
+    @torch.no_grad()
+    def __call__(self, image, boxes):
+        """
+        Args:
+            image (Tensor): (1, C, H, W) transformed image, as given to the model.
+            boxes (Tensor): (N, 4) boxes to refine, in image coordinates.
+
+        Returns:
+            Instances: the refined boxes whose score passes `score_thresh`, with fields
+                "pred_boxes", "pred_variance", "scores", "pred_classes" (as the detector)
+                and "box_index", the row in `boxes` of every refined box.
+        """
+        image_size = tuple(image.shape[-2:])
+        device = image.device
+        boxes = boxes.to(device=device, dtype=torch.float32).reshape(-1, 4)
+        if len(boxes) == 0:
+            return Instances(image_size, pred_boxes=Boxes(boxes), pred_variance=boxes.clone(),
+                             scores=boxes.new_zeros(0), pred_classes=torch.zeros(0, dtype=torch.long, device=device),
+                             box_index=torch.zeros(0, dtype=torch.long, device=device))
+
+        regions, scales = self.crop_regions(boxes)
+        # The boxes in crop coordinates are the proposals
+        crop_boxes = (boxes - regions[:, :2].repeat(1, 2)) * scales[:, None]
+        crop_size = (self.crop_size, self.crop_size)
+
+        logits, deltas, delta_variance = [], [], []
+        for start in range(0, len(boxes), self.batch_size):
+            end = min(start + self.batch_size, len(boxes))
+            batch_index = torch.zeros(end - start, 1, device=device)
+            crops = roi_align(image, torch.cat([batch_index, regions[start:end]], dim=1), crop_size,
+                              spatial_scale=1.0, sampling_ratio=2, aligned=True)
+            features = self.backbone(crops)
+
+            # One proposal per crop, in the pooler format (crop index, x1, y1, x2, y2)
+            rois = torch.cat([torch.arange(end - start, device=device, dtype=torch.float32)[:, None],
+                              crop_boxes[start:end]], dim=1)
+            outputs = self.detector.box_predictor(self.detector.box_pooler(features, rois))
+            logits.append(outputs[0])
+            deltas.append(outputs[1])
+            delta_variance.append(outputs[2])
+
+        proposals = RaggedInstances.from_instances([Instances(crop_size, proposal_boxes=Boxes(crop_boxes))])
+        outputs = FastRCNNOutputs(self.detector.box2box_transform, torch.cat(logits), torch.cat(deltas),
+                                  torch.cat(delta_variance), proposals, self.detector.smooth_l1_beta)
+        probs = outputs.predict_probs()[0]
+        pred_boxes = outputs.predict_boxes()[0].view(len(boxes), -1, 4)
+        pred_variance = outputs.predict_variance()[0].view(len(boxes), -1, 4)
+
+        # Most likely foreground class, background is the last column
+        scores, classes = probs[:, :-1].max(dim=1)
+        reg_index = classes if pred_boxes.shape[1] > 1 else torch.zeros_like(classes)
+        rows = torch.arange(len(boxes), device=device)
+        pred_boxes, pred_variance = pred_boxes[rows, reg_index], pred_variance[rows, reg_index]
+
+        # Back to image coordinates
+        pred_boxes = pred_boxes / scales[:, None] + regions[:, :2].repeat(1, 2)
+        pred_variance = pred_variance / torch.square(scales)[:, None]
+
+        keep = scores >= self.score_thresh
+        pred_boxes = Boxes(pred_boxes[keep])
+        pred_boxes.clip(image_size)
+        return Instances(image_size, pred_boxes=pred_boxes, pred_variance=pred_variance[keep],
+                         scores=scores[keep], pred_classes=classes[keep], box_index=rows[keep])
+
+
+def build_crop_refiner(model, cfg):
+    """
+    Returns:
+        CropRefiner: the refiner of cfg.TRACKING.CROP_REFINE, or None if it is disabled.
+    """
+    refine = cfg.TRACKING.CROP_REFINE
+    if not refine.ENABLED:
+        return None
+    return CropRefiner(model, refine.CROP_SIZE, refine.PADDING, refine.SCORE_THRESH, refine.BATCH_SIZE)
@@ -4,10 +4,11 @@ import torch.nn as nn
 
 
 from .poolers import ROIPooler
-from .fast_rcnn import FastRCNNOutputLayers, FastRCNNOutputs
-from .proposal_utils import add_ground_truth_to_proposals
+from .fast_rcnn import FastRCNNOutputLayers, FastRCNNOutputs, build_box_predictor, fast_rcnn_mc_inference
+from .proposal_utils import add_ground_truth_to_proposals, add_seed_proposals, apply_proposal_budget
 
-from ..utils import Boxes, Matcher, Box2BoxXYXYTransform, subsample_labels, pairwise_iou
+from ..utils import Boxes, RaggedInstances, Matcher, Box2BoxXYXYTransform, subsample_labels, subsample_labels_batched, pairwise_iou, batched_pairwise_iou
+from ..nms import build_nms_engine
 
 class ROIHeads(torch.nn.Module):
     """
@@ -44,6 +45,8 @@ class ROIHeads(torch.nn.Module):
         # Box2BoxTransform for bounding box regression
         self.box2box_transform = Box2BoxXYXYTransform(weights=cfg.ROI_HEADS.BBOX_REG_WEIGHTS)
 
+        self.nms_engine = build_nms_engine(cfg.ROI_HEADS.NMS_BACKEND)
+
     def _sample_proposals(self, matched_idxs, matched_labels, gt_classes):
         """
         Based on the matching between N proposals and M groundtruth,
@@ -93,9 +96,9 @@ class ROIHeads(torch.nn.Module):
             See :meth:`ROIHeads.forward`
 
         Returns:
-            list[Instances]:
-                length `N` list of `Instances`s containing the proposals
-                sampled for training. Each `Instances` has the following fields:
+            RaggedInstances:
+                the proposals of the `N` images sampled for training, usable as a
+                list of `Instances`. It has the following fields:
                 - proposal_boxes: the proposal boxes
                 - gt_boxes: the ground-truth box that the proposal is assigned to
                   (this is only meaningful if the proposal has a label > 0; if label = 0
@@ -115,48 +118,73 @@ class ROIHeads(torch.nn.Module):
         # examples from the start of training. For RPN, this augmentation improves
         # convergence and empirically improves box AP on COCO by about 0.5
         # points (under one tested configuration).
+        proposals = RaggedInstances.from_instances(proposals)
         if self.proposal_append_gt:
             proposals = add_ground_truth_to_proposals(gt_boxes, proposals)
 
-        proposals_with_gt = []
-
-        num_fg_samples = []
-        num_bg_samples = []
-
-        for proposals_per_image, targets_per_image in zip(proposals, targets):
-            has_gt = len(targets_per_image) > 0
-            
-            match_quality_matrix = pairwise_iou(
-                targets_per_image.gt_boxes, proposals_per_image.proposal_boxes
-            )
-
-            #matched_idxs: index of the gt with which the prediction got matched to
-            #matched_labels: denotes if proposal is positive/negative/ignored - Here every proposal is either marked positive or negative, none is ignored
-            matched_idxs, matched_labels = self.proposal_matcher(match_quality_matrix) 
-            
-            sampled_idxs, gt_classes = self._sample_proposals(
-                matched_idxs, matched_labels, targets_per_image.gt_classes
-            )
-
-            # Set target attributes of the sampled proposals:
-            proposals_per_image = proposals_per_image[sampled_idxs] #vector of length roi_batch_size
-            proposals_per_image.gt_classes = gt_classes
-
-            # We index all the attributes of targets that start with "gt_"
-            # and have not been added to proposals yet (="gt_classes").
-
-            sampled_targets = matched_idxs[sampled_idxs]
-            # NOTE: here the indexing waste some compute, because heads
-            # like masks, keypoints, etc, will filter the proposals again,
-            # (by foreground/background, or number of keypoints in the image, etc)
-            # so we essentially index the data twice.
-            for (trg_name, trg_value) in targets_per_image.get_fields().items():
-                if trg_name.startswith("gt_") and not proposals_per_image.has(trg_name):
-                    proposals_per_image.set(trg_name, trg_value[sampled_targets])
-
-            num_bg_samples.append((gt_classes == self.num_classes).sum().item())
-            num_fg_samples.append(gt_classes.numel() - num_bg_samples[-1])
-            proposals_with_gt.append(proposals_per_image)
+        # All images are matched and sampled at once on padded tensors. The only host
+        # side values are the numbers of proposals and gt boxes, so nothing syncs.
+        num_images = len(proposals)
+        num_proposals = proposals.num_instances
+        num_gt = [len(t) for t in targets]
+        # At least one (padding) gt column so that images without gt get background labels
+        max_proposals, max_gt = max(num_proposals), max(num_gt + [1])
+        device = proposals.device
+        offsets = torch.as_tensor(proposals.offsets[:-1], device=device)
+
+        # Scatter the flat proposals into the padded N x P layout
+        batch_indices = proposals.batch_indices
+        position = torch.arange(proposals.num_total(), device=device) - offsets[batch_indices]
+        proposal_boxes = torch.zeros(num_images, max_proposals, 4, device=device)
+        proposal_boxes[batch_indices, position] = proposals.proposal_boxes.tensor
+
+        gt_boxes_padded = torch.zeros(num_images, max_gt, 4, device=device)
+        gt_classes_padded = torch.full((num_images, max_gt), self.num_classes, dtype=torch.int64, device=device)
+        for i, targets_per_image in enumerate(targets):
+            gt_boxes_padded[i, :num_gt[i]] = targets_per_image.gt_boxes.tensor
+            gt_classes_padded[i, :num_gt[i]] = targets_per_image.gt_classes
+
+        proposal_mask = torch.arange(max_proposals, device=device)[None, :] < torch.as_tensor(num_proposals, device=device)[:, None]
+
+        # N x G x P. Padding boxes are all-zero, so every pair involving one has an IoU of 0
+        match_quality_matrix = batched_pairwise_iou(gt_boxes_padded, proposal_boxes)
+
+        #matched_idxs: index of the gt with which the prediction got matched to
+        #matched_labels: denotes if proposal is positive/negative/ignored - Here every proposal is either marked positive or negative, none is ignored
+        matched_idxs, matched_labels = self.proposal_matcher(match_quality_matrix)
+
+        # Label unmatched proposals (0 label from matcher) as background (label=num_classes)
+        # and ignored proposals (-1 label) as -1
+        gt_classes = gt_classes_padded.gather(1, matched_idxs)
+        gt_classes[matched_labels == 0] = self.num_classes
+        gt_classes[(matched_labels == -1) | ~proposal_mask] = -1
+
+        sampled_idxs, sampled_mask = subsample_labels_batched(
+            gt_classes, self.batch_size_per_image, self.positive_sample_fraction, self.num_classes, proposal_mask
+        )
+        # Filler rows (only when an image has too few usable proposals) are ignored by the losses
+        sampled_classes = gt_classes.gather(1, sampled_idxs).masked_fill_(~sampled_mask, -1)
+        sampled_targets = matched_idxs.gather(1, sampled_idxs)
+
+        # (row, col) of the sampled entries of every image in the N x S sampling output
+        num_sampled = [min(sampled_idxs.shape[1], n) for n in num_proposals]
+        counts = torch.as_tensor(num_sampled, device=device)
+        rows = torch.repeat_interleave(torch.arange(num_images, device=device), counts)
+        cols = torch.arange(sum(num_sampled), device=device) - (torch.cumsum(counts, dim=0) - counts)[rows]
+
+        # Set target attributes of the sampled proposals:
+        proposals_with_gt = proposals.index(offsets[rows] + sampled_idxs[rows, cols], num_sampled)
+        proposals_with_gt.gt_classes = sampled_classes[rows, cols]
+        proposals_with_gt.gt_boxes = Boxes(gt_boxes_padded[rows, sampled_targets[rows, cols]])
+
+        # We index all the other attributes of targets that start with "gt_"
+        # and have not been added to proposals yet.
+        if min(num_gt) > 0:
+            targets = RaggedInstances.from_instances(targets)
+            target_offsets = torch.as_tensor(targets.offsets[:-1], device=device)
+            for (trg_name, trg_value) in targets.get_fields().items():
+                if trg_name.startswith("gt_") and not proposals_with_gt.has(trg_name):
+                    proposals_with_gt.set(trg_name, trg_value[target_offsets[rows] + sampled_targets[rows, cols]])
 
         return proposals_with_gt
 
@@ -218,22 +246,47 @@ class Detector(ROIHeads):
             pooler_type=pooler_type,
         )
 
-        input_shape = in_channels*7*7
+        # Pooled features are [M, C, 7, 7] (ROIAlign at POOLER_RESOLUTION followed by a 2x2 MaxPool)
+        input_shape = (in_channels, 7, 7)
 
-        self.box_predictor = FastRCNNOutputLayers(cfg,
+        self.box_predictor = build_box_predictor(cfg,
            input_shape , self.num_classes, self.cls_agnostic_bbox_reg
         )
 
-    def forward(self, features, proposals, targets=None, is_training=True):
+        # fmt: off
+        self.mc_dropout_enabled = cfg.ROI_HEADS.MC_DROPOUT.ENABLED
+        self.mc_num_samples     = cfg.ROI_HEADS.MC_DROPOUT.NUM_SAMPLES
+        self.dirichlet_prior    = cfg.ROI_HEADS.MC_DROPOUT.DIRICHLET_PRIOR
+        # fmt: on
+        if self.mc_dropout_enabled and cfg.ROI_HEADS.DROPOUT_RATE <= 0:
+            raise ValueError("MC dropout sampling needs ROI_HEADS.DROPOUT_RATE > 0")
+
+        budget = cfg.ROI_HEADS.PROPOSAL_BUDGET
+        self.proposal_budget = dict(
+            mode=budget.MODE,
+            min_proposals=budget.MIN_PROPOSALS,
+            max_proposals=budget.MAX_PROPOSALS,
+            mass_fraction=budget.MASS_FRACTION,
+            min_logit=budget.MIN_LOGIT,
+            knee_scale=budget.KNEE_SCALE,
+        )
+        # Number of proposals sent to the box head for each image of the last inference batch
+        self.num_proposals_kept = []
+        # Number of seed boxes added to the proposals of each image of the last inference batch
+        self.num_seeds = []
+        # Run inference in training steps as well, only needed to log detections
+        self.log_detections = cfg.TRAIN.LOG_DETECTIONS
+
+    def forward(self, features, proposals, targets=None, is_training=True, return_detections=None, seed_boxes=None):
         """
         Args:
             features (dict[str: Tensor]): input data as a mapping from feature
                 map name to tensor. Axis 0 represents the number of images `N` in
                 the input data; axes 1-3 are channels, height, and width, which may
                 vary between feature maps (e.g., if a feature pyramid is used).
-            proposals (list[Instances]): length `N` list of `Instances`s. The i-th
-                `Instances` contains object proposals for the i-th input image,
-                with fields "proposal_boxes" and "objectness_logits".
+            proposals (RaggedInstances or list[Instances]): object proposals of the `N`
+                input images, with fields "proposal_boxes" and "objectness_logits".
+                A list is concatenated into a RaggedInstances once.
             targets (list[Instances], optional): length `N` list of `Instances`s. The i-th
                 `Instances` contains the ground-truth per-instance annotations
                 for the i-th input image.  Specify `targets` during training only.
@@ -242,22 +295,42 @@ class Detector(ROIHeads):
                 - gt_classes: the label for each instance with a category ranging in [0, #class].
                 - gt_masks: PolygonMasks or BitMasks, the ground-truth masks of each instance.
                 - gt_keypoints: NxKx3, the groud-truth keypoints for each instance.
+            return_detections (bool, optional): also run inference during training, e.g.
+                for logging. Defaults to cfg.TRAIN.LOG_DETECTIONS.
+            seed_boxes (list[Boxes], optional): length `N` list of boxes added to the
+                proposals of every image at inference, after the proposal budget,
+                e.g. the predicted boxes of the confirmed tracks of a tracker.
 
         Returns:
             results (list[Instances]): length `N` list of `Instances`s containing the
-                detected instances. Returned during inference only; may be []
-                during training.
+                detected instances. Returned during inference, and during training
+                only if `return_detections`; [] otherwise.
             losses (dict[str: Tensor]): mapping from a named loss to a tensor
                 storing the loss. Used during training only.
         """
+        if return_detections is None:
+            return_detections = self.log_detections
 
+        proposals = RaggedInstances.from_instances(proposals)
         if is_training:
             proposals = self.label_and_sample_proposals(proposals, targets)
+        elif self.proposal_budget["mode"] != "none":
+            proposals, self.num_proposals_kept = apply_proposal_budget(proposals, **self.proposal_budget)
+        else:
+            self.num_proposals_kept = list(proposals.num_instances)
+        if not is_training and seed_boxes is not None:
+            proposals = add_seed_proposals(seed_boxes, proposals)
+            self.num_seeds = [len(p) - k for p, k in zip(proposals.num_instances, self.num_proposals_kept)]
+        else:
+            self.num_seeds = [0] * len(proposals)
         
         # del targets
 
         # Tensor of [M, C, 7 ,7] - M is the total number of proposals over all the images in the batch, C is the number of channels from feature map
-        box_features = self.box_pooler(features, [x.proposal_boxes for x in proposals]) 
+        box_features = self.box_pooler(features, proposals.pooler_format("proposal_boxes"))
+
+        if not is_training and self.mc_dropout_enabled:
+            return self.mc_dropout_inference(box_features, proposals), {}
         
         # pred_class_logits: Tensor[M, num_classes+1], pred_bbox_deltas: Tensor[M, 4], pred_delta_variance: Tensor[M, 4]
         pred_class_logits, pred_bbox_deltas, pred_delta_variance = self.box_predictor(box_features)
@@ -274,19 +347,48 @@ class Detector(ROIHeads):
 
         if is_training:
             losses = outputs.losses()
-            pred_instances, _ = outputs.inference(
-                self.test_score_thresh, self.test_nms_thresh, self.test_detections_per_img
-            )
+            pred_instances = []
+            if return_detections:
+                with torch.no_grad():
+                    pred_instances, _ = outputs.inference(
+                        self.test_score_thresh, self.test_nms_thresh, self.test_detections_per_img, self.nms_engine
+                    )
             return pred_instances, losses
 
         else:
             # During inference cascaded prediction is used: the mask and keypoints heads are only
             # applied to the top scoring box detections.
             pred_instances, _ = outputs.inference(
-                self.test_score_thresh, self.test_nms_thresh, self.test_detections_per_img
+                self.test_score_thresh, self.test_nms_thresh, self.test_detections_per_img, self.nms_engine
             )
             return pred_instances, {}
 
+    def mc_dropout_inference(self, box_features, proposals):
+        """
+        Run the box head `self.mc_num_samples` times with dropout on the same pooled
+        features and summarise the samples as in BayesOD.
+
+        Returns:
+            list[Instances]: same as :meth:`forward`, with the additional fields
+                "pred_covariance" and "class_counts".
+        """
+        pred_class_logits, pred_bbox_deltas, pred_delta_variance = self.box_predictor.mc_forward(
+            box_features, self.mc_num_samples
+        )
+        pred_instances, _ = fast_rcnn_mc_inference(
+            self.box2box_transform,
+            pred_class_logits,
+            pred_bbox_deltas,
+            pred_delta_variance,
+            proposals,
+            self.test_score_thresh,
+            self.test_nms_thresh,
+            self.test_detections_per_img,
+            self.dirichlet_prior,
+            self.nms_engine,
+        )
+        return pred_instances
+
 
 class Res5ROIHeads(ROIHeads):
     """
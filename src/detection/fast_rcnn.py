@@ -5,8 +5,8 @@ import torch
 from torch import nn
 from torch.nn import functional as F
 
-from ..nms import batched_nms, bayes_od_clustering
-from ..utils import Boxes, Matcher, Box2BoxTransform, Instances
+from ..nms import batched_nms, bayes_od_clustering, compute_mean_covariance, dirichlet_counts
+from ..utils import Boxes, Matcher, Box2BoxTransform, Instances, RaggedInstances
 from ..loss import smooth_l1_loss
 
 logger = logging.getLogger(__name__)
@@ -36,6 +36,17 @@ Naming convention:
     gt_bbox_deltas: ground-truth box2box transform deltas
 """
 
+def low_rank_linear(in_features, out_features, rank=0):
+    """
+    A fully connected layer, factorized into two thin linear layers
+    (in_features -> rank -> out_features) when 0 < rank < min(in_features, out_features).
+    See `src/tools/compress_box_head.py` to obtain the factors from a trained layer.
+    """
+    if rank <= 0 or rank >= min(in_features, out_features):
+        return nn.Linear(in_features, out_features)
+    return nn.Sequential(nn.Linear(in_features, rank, bias=False), nn.Linear(rank, out_features))
+
+
 class FastRCNNOutputLayers(nn.Module):
     """
     Two linear layers for predicting Fast R-CNN outputs:
@@ -47,9 +58,11 @@ class FastRCNNOutputLayers(nn.Module):
         super(FastRCNNOutputLayers, self).__init__()
 
         fc_dim     = cfg.ROI_HEADS.FC_DIM
+        fc1_rank, fc2_rank = cfg.ROI_HEADS.FC_RANK
+        self.dropout_rate = cfg.ROI_HEADS.DROPOUT_RATE
 
-        self.fc1 = nn.Linear(np.prod(input_shape), fc_dim)
-        self.fc2 = nn.Linear(fc_dim, fc_dim)
+        self.fc1 = low_rank_linear(int(np.prod(input_shape)), fc_dim, fc1_rank)
+        self.fc2 = low_rank_linear(fc_dim, fc_dim, fc2_rank)
 
         self.cls_score = nn.Linear(fc_dim, num_classes + 1)
 
@@ -59,8 +72,11 @@ class FastRCNNOutputLayers(nn.Module):
         self.sigma_pred = nn.Linear(fc_dim, box_dim)
         
         for l in [self.fc1, self.fc2, self.cls_score, self.bbox_pred, self.sigma_pred]:
-            nn.init.normal_(l.weight, std=0.01)
-            nn.init.constant_(l.bias, 0)
+            for m in l.modules():
+                if isinstance(m, nn.Linear):
+                    nn.init.normal_(m.weight, std=0.01)
+                    if m.bias is not None:
+                        nn.init.constant_(m.bias, 0)
 
         nn.init.normal_(self.bbox_pred.weight, std=0.001)
         nn.init.constant_(self.sigma_pred.bias, 2)
@@ -79,11 +95,18 @@ class FastRCNNOutputLayers(nn.Module):
         return low + ((high - low) / (1 + torch.exp(-sharp * x)))
 
 
-    def forward(self, x):
+    def _fc1_features(self, x):
+        """
+        Deterministic part of the head, i.e. everything before the first dropout.
+        """
         if x.dim() > 2:
             x = torch.flatten(x, start_dim=1)
-        for layer in [self.fc1, self.fc2]:
-            x = F.relu(layer(x))
+        return F.relu(self.fc1(x))
+
+    def _predict(self, x, sample):
+        x = F.dropout(x, self.dropout_rate, training=sample)
+        x = F.relu(self.fc2(x))
+        x = F.dropout(x, self.dropout_rate, training=sample)
 
         scores = self.cls_score(x)
         bbox_deltas = self.bbox_pred(x)
@@ -92,7 +115,84 @@ class FastRCNNOutputLayers(nn.Module):
 
         return scores, bbox_deltas, variance
 
-def fast_rcnn_inference(boxes, scores, variance, image_shapes, score_thresh, nms_thresh, topk_per_image):
+    def forward(self, x):
+        return self._predict(self._fc1_features(x), self.training)
+
+    def mc_forward(self, x, num_samples):
+        """
+        Monte-Carlo dropout forward pass.
+
+        The input of `fc1` is not dropped out, so `fc1` (by far the largest layer) is
+        evaluated once and shared by all the samples. Only the layers after the first
+        dropout run `num_samples` times; the samples are stacked along a new leading
+        dimension so each of those layers is a single batched matrix product.
+
+        Args:
+            x (Tensor): pooled ROI features of shape (R, C, H, W) or (R, D).
+            num_samples (int): number of dropout samples M.
+
+        Returns:
+            scores (Tensor): (M, R, K + 1)
+            bbox_deltas (Tensor): (M, R, K * 4) or (M, R, 4)
+            variance (Tensor): (M, R, 4)
+        """
+        x = self._fc1_features(x)
+        x = x.unsqueeze(0).expand(num_samples, -1, -1)
+        return self._predict(x, True)
+
+
+class LightFastRCNNOutputLayers(FastRCNNOutputLayers):
+    """
+    Same outputs as :class:`FastRCNNOutputLayers`, but the pooled ROI features are
+    first average pooled to `LIGHT_HEAD.POOLED_SIZE` and reduced to
+    `LIGHT_HEAD.REDUCED_CHANNELS` channels by a 1x1 conv before `fc1`.
+
+    Both operations are linear, so pooling before the conv gives the same result as
+    pooling after it, at a fraction of the cost. With the defaults the per-ROI cost
+    of the head drops from ~52M to ~5M multiply-adds.
+    """
+
+    def __init__(self, cfg, input_shape, num_classes, cls_agnostic_bbox_reg, box_dim=4):
+        in_channels, height, width = input_shape
+        reduced_channels = cfg.ROI_HEADS.LIGHT_HEAD.REDUCED_CHANNELS
+        pooled_size = cfg.ROI_HEADS.LIGHT_HEAD.POOLED_SIZE
+        if pooled_size > 0:
+            height, width = pooled_size, pooled_size
+
+        super(LightFastRCNNOutputLayers, self).__init__(
+            cfg, (reduced_channels, height, width), num_classes, cls_agnostic_bbox_reg, box_dim
+        )
+
+        self.pool = nn.AdaptiveAvgPool2d(pooled_size) if pooled_size > 0 else nn.Identity()
+        self.reduce = nn.Conv2d(in_channels, reduced_channels, kernel_size=1)
+        nn.init.kaiming_normal_(self.reduce.weight, mode="fan_out", nonlinearity="relu")
+        nn.init.constant_(self.reduce.bias, 0)
+
+    def _fc1_features(self, x):
+        x = F.relu(self.reduce(self.pool(x)))
+        return super(LightFastRCNNOutputLayers, self)._fc1_features(x)
+
+
+BOX_HEADS = {
+    "FC": FastRCNNOutputLayers,
+    "LIGHT": LightFastRCNNOutputLayers,
+}
+
+
+def build_box_predictor(cfg, input_shape, num_classes, cls_agnostic_bbox_reg):
+    """
+    Build the box head registered under cfg.ROI_HEADS.BOX_HEAD in `BOX_HEADS`.
+
+    Args:
+        input_shape (tuple[int]): (C, H, W) of the pooled ROI features.
+    """
+    name = cfg.ROI_HEADS.BOX_HEAD
+    if name not in BOX_HEADS:
+        raise ValueError("Unknown box head: {}. Choose from {}".format(name, list(BOX_HEADS)))
+    return BOX_HEADS[name](cfg, input_shape, num_classes, cls_agnostic_bbox_reg)
+
+
+def fast_rcnn_inference(boxes, scores, variance, image_shapes, score_thresh, nms_thresh, topk_per_image, nms_engine=None):
     """
     Call `fast_rcnn_inference_single_image` for all images.
 
@@ -111,6 +211,7 @@ def fast_rcnn_inference(boxes, scores, variance, image_shapes, score_thresh, nms
         nms_thresh (float):  The threshold to use for box non-maximum suppression. Value in [0, 1].
         topk_per_image (int): The number of top scoring detections to return. Set < 0 to return
             all detections.
+        nms_engine (NMSEngine, optional): NMS backend. Defaults to `batched_nms`.
 
     Returns:
         instances: (list[Instances]): A list of N instances, one for each image in the batch,
@@ -120,7 +221,8 @@ def fast_rcnn_inference(boxes, scores, variance, image_shapes, score_thresh, nms
     """
     result_per_image = [
         fast_rcnn_inference_single_image(
-            boxes_per_image, scores_per_image, sigma_per_image, image_shape, score_thresh, nms_thresh, topk_per_image
+            boxes_per_image, scores_per_image, sigma_per_image, image_shape, score_thresh, nms_thresh, topk_per_image,
+            nms_engine
         )
         for scores_per_image, boxes_per_image, sigma_per_image, image_shape in zip(scores, boxes, variance, image_shapes)
     ]
@@ -128,7 +230,7 @@ def fast_rcnn_inference(boxes, scores, variance, image_shapes, score_thresh, nms
 
 
 def fast_rcnn_inference_single_image(
-    boxes, scores, variance, image_shape, score_thresh, nms_thresh, topk_per_image
+    boxes, scores, variance, image_shape, score_thresh, nms_thresh, topk_per_image, nms_engine=None
 ):
     """
     Single-image inference. Return bounding-box detection results by thresholding
@@ -164,7 +266,13 @@ def fast_rcnn_inference_single_image(
     scores = scores[filter_mask]
 
     # Apply per-class NMS
-    keep = batched_nms(boxes, scores, filter_inds[:, 1], nms_thresh)
+    if nms_engine is None:
+        keep = batched_nms(boxes, scores, filter_inds[:, 1], nms_thresh)
+    else:
+        keep, kept_scores = nms_engine(boxes, scores, filter_inds[:, 1], nms_thresh, max_output=topk_per_image,
+                                       return_scores=True)
+        # Same as scores for most engines, decayed by Matrix NMS
+        scores = scores.index_put((keep,), kept_scores)
 
     if topk_per_image >= 0:
         keep = keep[:topk_per_image]
@@ -186,6 +294,165 @@ def fast_rcnn_inference_single_image(
     return result, filter_inds[:, 0]
 
 
+def fast_rcnn_fused_inference(
+    box2box_transform, pred_class_logits, pred_bbox_deltas, pred_delta_variance, proposal_boxes,
+    num_preds_per_image, image_shapes, score_thresh, nms_thresh, topk_per_image, nms_engine=None
+):
+    """
+    Filter-first version of `fast_rcnn_inference` over the whole batch.
+
+    The (R, K) class probabilities are thresholded before anything is decoded, so
+    the boxes and variances are only computed, in a single fused pass, for the
+    (proposal, class) pairs that pass `score_thresh`. NMS runs once for the batch
+    with the image index folded into the class index.
+
+    Args:
+        box2box_transform (Box2BoxXYXYTransform): transform used to decode the deltas.
+        pred_class_logits (Tensor): (R, K + 1) class logits.
+        pred_bbox_deltas (Tensor): (R, K * 4) or (R, 4) box deltas.
+        pred_delta_variance (Tensor): (R, K * 4) or (R, 4) variance of the deltas.
+        proposal_boxes (Tensor): (R, 4) proposals of all images.
+        num_preds_per_image (list[int]): Ri for every image, summing to R.
+        image_shapes, score_thresh, nms_thresh, topk_per_image, nms_engine: same as
+            `fast_rcnn_inference`.
+
+    Returns:
+        Same as `fast_rcnn_inference`.
+    """
+    device = pred_class_logits.device
+    num_images = len(num_preds_per_image)
+    B = proposal_boxes.shape[1]
+
+    scores = F.softmax(pred_class_logits, dim=-1)[:, :-1]
+    K = scores.shape[1]
+
+    # R' x 2. First column contains indices of the R predictions;
+    # Second column contains indices of classes.
+    filter_inds = (scores > score_thresh).nonzero()
+    rows, classes = filter_inds[:, 0], filter_inds[:, 1]
+    scores = scores[rows, classes]
+
+    image_ids = torch.repeat_interleave(
+        torch.arange(num_images, device=device), torch.as_tensor(num_preds_per_image, device=device)
+    )[rows]
+
+    num_bbox_reg_classes = pred_bbox_deltas.shape[1] // B
+    reg_col = classes if num_bbox_reg_classes > 1 else torch.zeros_like(classes)
+    deltas = pred_bbox_deltas.view(-1, num_bbox_reg_classes, B)[rows, reg_col]
+    num_var_classes = pred_delta_variance.shape[1] // B
+    var_col = classes if num_var_classes > 1 else torch.zeros_like(classes)
+    delta_variance = pred_delta_variance.view(-1, num_var_classes, B)[rows, var_col]
+
+    boxes, variance = box2box_transform.apply_deltas_and_variance(deltas, delta_variance, proposal_boxes[rows])
+
+    # Clip every box to its own image, (height, width) of each surviving row
+    image_sizes = torch.as_tensor(image_shapes, dtype=boxes.dtype, device=device)[image_ids]
+    boxes = torch.min(boxes.clamp(min=0), image_sizes[:, [1, 0, 1, 0]])
+
+    # Batched NMS over (image, class) groups; keep is sorted by decreasing score
+    nms_idxs = image_ids * K + classes
+    if nms_engine is None:
+        keep = batched_nms(boxes, scores, nms_idxs, nms_thresh)
+    else:
+        keep, kept_scores = nms_engine(boxes, scores, nms_idxs, nms_thresh, return_scores=True)
+        # Same as scores for most engines, decayed by Matrix NMS
+        scores = scores.index_put((keep,), kept_scores)
+
+    # Regroup by image preserving the score order, then keep the topk of every image
+    kept_images = image_ids[keep]
+    keep = keep[torch.argsort(kept_images * len(keep) + torch.arange(len(keep), device=device))]
+    kept_images = image_ids[keep]
+    kept_per_image = torch.bincount(kept_images, minlength=num_images)
+    if topk_per_image >= 0:
+        first = torch.cumsum(kept_per_image, dim=0) - kept_per_image
+        rank = torch.arange(len(keep), device=device) - torch.repeat_interleave(first, kept_per_image)
+        keep = keep[rank < topk_per_image]
+        kept_per_image = kept_per_image.clamp(max=topk_per_image)
+
+    offsets = torch.as_tensor([0] + num_preds_per_image[:-1], device=device).cumsum(dim=0)
+    kept_per_image = kept_per_image.tolist()
+
+    instances, kept_indices = [], []
+    for i, (keep_i, image_shape) in enumerate(zip(keep.split(kept_per_image), image_shapes)):
+        result = Instances(image_shape)
+        result.pred_boxes = Boxes(boxes[keep_i])
+        result.scores = scores[keep_i]
+        result.pred_variance = variance[keep_i]
+        result.pred_classes = classes[keep_i]
+        instances.append(result)
+        kept_indices.append(rows[keep_i] - offsets[i])
+
+    return instances, kept_indices
+
+
+def fast_rcnn_mc_inference(
+    box2box_transform, pred_class_logits, pred_bbox_deltas, pred_delta_variance, proposals,
+    score_thresh, nms_thresh, topk_per_image, dirichlet_prior=0.0, nms_engine=None
+):
+    """
+    BayesOD style inference from M Monte-Carlo dropout samples of the box head.
+
+    The sampled deltas are decoded into boxes and summarised per proposal by their
+    sample mean and covariance (epistemic part) plus the mean predicted variance
+    (aleatoric part). Class scores are the posterior mean of a Dirichlet distribution
+    whose counts are the per-sample argmax votes.
+
+    Args:
+        pred_class_logits (Tensor): (M, R, K + 1) sampled class logits.
+        pred_bbox_deltas (Tensor): (M, R, K * 4) or (M, R, 4) sampled box deltas.
+        pred_delta_variance (Tensor): (M, R, 4) sampled delta variances.
+        proposals (RaggedInstances or list[Instances]): the N proposals the R rows come from.
+        score_thresh, nms_thresh, topk_per_image: same as `fast_rcnn_inference`.
+        dirichlet_prior (float): prior count added to every class.
+        nms_engine (NMSEngine, optional): NMS backend. Defaults to `batched_nms`.
+
+    Returns:
+        Same as `fast_rcnn_inference`. The instances have two extra fields,
+        "pred_covariance" (Ri x 4 x 4) and "class_counts" (Ri x K + 1).
+    """
+    proposals = RaggedInstances.from_instances(proposals)
+    num_samples, num_pred = pred_class_logits.shape[:2]
+    num_preds_per_image = proposals.num_instances
+    proposal_boxes = proposals.proposal_boxes.tensor
+    B = proposal_boxes.shape[1]
+    K = pred_bbox_deltas.shape[2] // B
+    if pred_delta_variance.shape[2] != K * B:
+        # sigma_pred is class-agnostic, share it between the class-specific boxes
+        pred_delta_variance = pred_delta_variance.repeat(1, 1, K)
+
+    expanded = proposal_boxes.unsqueeze(1).expand(num_pred, K, B).repeat(num_samples, 1, 1)
+    boxes = box2box_transform.apply_deltas(
+        pred_bbox_deltas.reshape(num_samples * num_pred * K, B), expanded.reshape(-1, B)
+    )
+    boxes_var = box2box_transform.apply_deltas_variance(
+        pred_delta_variance.reshape(num_samples * num_pred * K, B), expanded.reshape(-1, B)
+    )
+
+    means, covs = compute_mean_covariance(boxes.view(num_samples, num_pred * K, B))
+    covs = covs + torch.diag_embed(boxes_var.view(num_samples, num_pred * K, B).mean(dim=0))
+
+    class_counts = dirichlet_counts(F.softmax(pred_class_logits, dim=-1), dirichlet_prior)
+    scores = class_counts / class_counts.sum(dim=1, keepdim=True)
+
+    variance = torch.diagonal(covs, dim1=-2, dim2=-1).reshape(num_pred, K * B)
+    instances, kept_indices = fast_rcnn_inference(
+        means.view(num_pred, K * B).split(num_preds_per_image),
+        scores.split(num_preds_per_image),
+        variance.split(num_preds_per_image),
+        proposals.image_sizes,
+        score_thresh, nms_thresh, topk_per_image, nms_engine,
+    )
+
+    covs = covs.view(num_pred, K, B, B).split(num_preds_per_image)
+    class_counts = class_counts.split(num_preds_per_image)
+    for result, kept, covs_i, counts_i in zip(instances, kept_indices, covs, class_counts):
+        class_col = result.pred_classes if K > 1 else torch.zeros_like(kept)
+        result.pred_covariance = covs_i[kept, class_col]
+        result.class_counts = counts_i[kept]
+
+    return instances, kept_indices
+
+
 class FastRCNNOutputs(object):
     """
     A class that stores information about outputs of a Fast R-CNN head.
@@ -207,53 +474,62 @@ class FastRCNNOutputs(object):
                 B is the box dimension (4 or 5).
                 When B is 4, each row is [dx, dy, dw, dh (, ....)].
                 When B is 5, each row is [dx, dy, dw, dh, da (, ....)].
-            proposals (list[Instances]): A list of N Instances, where Instances i stores the
-                proposals for image i, in the field "proposal_boxes".
-                When training, each Instances must have ground-truth labels
-                stored in the field "gt_classes" and "gt_boxes".
+            proposals (RaggedInstances or list[Instances]): the proposals of the N images,
+                in the field "proposal_boxes". When training, they must have ground-truth
+                labels stored in the field "gt_classes" and "gt_boxes". The flat fields of
+                a RaggedInstances are used as they are, a list is concatenated once.
             smooth_l1_beta (float): The transition point between L1 and L2 loss in
                 the smooth L1 loss function. When set to 0, the loss becomes L1. When
                 set to +inf, the loss becomes constant 0.
         """
+        proposals = RaggedInstances.from_instances(proposals)
+
         self.box2box_transform = box2box_transform
-        self.num_preds_per_image = [len(p) for p in proposals]
+        self.num_preds_per_image = proposals.num_instances
         self.pred_class_logits = pred_class_logits
         self.pred_bbox_deltas = pred_bbox_deltas
         self.pred_delta_variance = pred_delta_variance
         self.smooth_l1_beta = smooth_l1_beta
 
-        box_type = type(proposals[0].proposal_boxes)
-        # cat(..., dim=0) concatenates over all images in the batch
-        self.proposals = box_type.cat([p.proposal_boxes for p in proposals])
+        # Flat over all images in the batch
+        self.proposals = proposals.proposal_boxes
         assert not self.proposals.tensor.requires_grad, "Proposals should not require gradients!"
-        self.image_shapes = [x.image_size for x in proposals]
+        self.image_shapes = proposals.image_sizes
 
         # The following fields should exist only when training.
-        if proposals[0].has("gt_boxes"):
-            self.gt_boxes = box_type.cat([p.gt_boxes for p in proposals])
-            assert proposals[0].has("gt_classes")
-            self.gt_classes = torch.cat([p.gt_classes for p in proposals], dim=0)
+        if proposals.has("gt_boxes"):
+            self.gt_boxes = proposals.gt_boxes
+            assert proposals.has("gt_classes")
+            self.gt_classes = proposals.gt_classes
+        self._regression_target_cache = None
 
     def softmax_cross_entropy_loss(self):
         """
         Compute the softmax cross entropy loss for box classification.
+        Rows with gt_classes = -1 (filler rows of the sampling) are ignored.
 
         Returns:
             scalar Tensor
         """
         # self._log_accuracy()
-        return F.cross_entropy(self.pred_class_logits, self.gt_classes, reduction="mean")
+        return F.cross_entropy(self.pred_class_logits, self.gt_classes, reduction="mean", ignore_index=-1)
 
-    def loss_attenuation(self):
+    def _regression_targets(self):
         """
-        Loss attenuation implementation
+        Targets of the box regression losses, computed once and shared by
+        :meth:`loss_attenuation`, :meth:`smooth_l1_loss` and :meth:`loss_calibration`.
+
         Returns:
-            scalar Tensor
+            fg_inds (Tensor): indices of the foreground rows.
+            gt_class_cols (Tensor): columns of `pred_bbox_deltas` to regress, (B,) for
+                class-agnostic regression or (len(fg_inds), B).
+            gt_bbox_deltas (Tensor): (len(fg_inds), B) regression targets of the foreground rows.
+            normalizer (Tensor): number of sampled rows R the losses are divided by.
         """
-        gt_bbox_deltas = self.box2box_transform.get_deltas(
-            self.proposals.tensor, self.gt_boxes.tensor
-        )
-        box_dim = gt_bbox_deltas.size(1)  # 4 or 5
+        if self._regression_target_cache is not None:
+            return self._regression_target_cache
+
+        box_dim = self.proposals.tensor.size(1)  # 4 or 5
         cls_agnostic_bbox_reg = self.pred_bbox_deltas.size(1) == box_dim
         device = self.pred_bbox_deltas.device
 
@@ -268,6 +544,10 @@ class FastRCNNOutputs(object):
         fg_inds = torch.nonzero((self.gt_classes >= 0) & (self.gt_classes < bg_class_ind)).squeeze(
             1
         )
+        # Only the foreground rows need regression targets
+        gt_bbox_deltas = self.box2box_transform.get_deltas(
+            self.proposals.tensor[fg_inds], self.gt_boxes.tensor[fg_inds]
+        )
         if cls_agnostic_bbox_reg:
             # pred_bbox_deltas only corresponds to foreground class for agnostic
             gt_class_cols = torch.arange(box_dim, device=device)
@@ -279,10 +559,25 @@ class FastRCNNOutputs(object):
             # we do not perform bounding box regression for background classes.
             gt_class_cols = box_dim * fg_gt_classes[:, None] + torch.arange(box_dim, device=device)
 
-        ### 
+        # The losses are normalized by the number of sampled regions (see smooth_l1_loss),
+        # filler rows with gt_classes = -1 do not count. Kept on the device, no sync.
+        normalizer = (self.gt_classes >= 0).sum().clamp(min=1)
+
+        self._regression_target_cache = (fg_inds, gt_class_cols, gt_bbox_deltas, normalizer)
+        return self._regression_target_cache
+
+    def loss_attenuation(self):
+        """
+        Loss attenuation implementation
+        Returns:
+            scalar Tensor
+        """
+        fg_inds, gt_class_cols, gt_bbox_deltas, normalizer = self._regression_targets()
 
         ## Computing the loss attenuation
-        loss_attenuation_final = ((self.pred_bbox_deltas[fg_inds[:, None], gt_class_cols] - gt_bbox_deltas[fg_inds])**2/(self.pred_delta_variance[fg_inds[:, None], gt_class_cols]) + 0.5*torch.log(self.pred_delta_variance[fg_inds[:, None], gt_class_cols])).sum()/self.gt_classes.numel()
+        pred_deltas = self.pred_bbox_deltas[fg_inds[:, None], gt_class_cols]
+        pred_variance = self.pred_delta_variance[fg_inds[:, None], gt_class_cols]
+        loss_attenuation_final = ((pred_deltas - gt_bbox_deltas)**2/pred_variance + 0.5*torch.log(pred_variance)).sum()/normalizer
 
         return loss_attenuation_final
 
@@ -293,38 +588,11 @@ class FastRCNNOutputs(object):
         Returns:
             scalar Tensor
         """
-        gt_bbox_deltas = self.box2box_transform.get_deltas(
-            self.proposals.tensor, self.gt_boxes.tensor
-        ) 
-        box_dim = gt_bbox_deltas.size(1)  # 4 or 5
-        cls_agnostic_bbox_reg = self.pred_bbox_deltas.size(1) == box_dim
-        device = self.pred_bbox_deltas.device
-
-        bg_class_ind = self.pred_class_logits.shape[1] - 1
-
-        # Box delta loss is only computed between the prediction for the gt class k
-        # (if 0 <= k < bg_class_ind) and the target; there is no loss defined on predictions
-        # for non-gt classes and background.
-        # Empty fg_inds produces a valid loss of zero as long as the size_average
-        # arg to smooth_l1_loss is False (otherwise it uses torch.mean internally
-        # and would produce a nan loss).
-        fg_inds = torch.nonzero((self.gt_classes >= 0) & (self.gt_classes < bg_class_ind)).squeeze(
-            1
-        )
-        if cls_agnostic_bbox_reg:
-            # pred_bbox_deltas only corresponds to foreground class for agnostic
-            gt_class_cols = torch.arange(box_dim, device=device)
-        else:
-            fg_gt_classes = self.gt_classes[fg_inds]
-            # pred_bbox_deltas for class k are located in columns [b * k : b * k + b],
-            # where b is the dimension of box representation (4 or 5)
-            # Note that compared to Detectron1,
-            # we do not perform bounding box regression for background classes.
-            gt_class_cols = box_dim * fg_gt_classes[:, None] + torch.arange(box_dim, device=device)
+        fg_inds, gt_class_cols, gt_bbox_deltas, normalizer = self._regression_targets()
 
         loss_box_reg = smooth_l1_loss(
             self.pred_bbox_deltas[fg_inds[:, None], gt_class_cols],
-            gt_bbox_deltas[fg_inds],
+            gt_bbox_deltas,
             self.smooth_l1_beta,
             reduction="sum",
         )
@@ -339,7 +607,7 @@ class FastRCNNOutputs(object):
         # example in minibatch (2). Normalizing by the total number of regions, R,
         # means that the single example in minibatch (1) and each of the 100 examples
         # in minibatch (2) are given equal influence.
-        loss_box_reg = loss_box_reg / self.gt_classes.numel()
+        loss_box_reg = loss_box_reg / normalizer
         return loss_box_reg
 
     def loss_calibration(self):
@@ -349,40 +617,13 @@ class FastRCNNOutputs(object):
         Returns:
             scalar Tensor
         """
-        gt_bbox_deltas = self.box2box_transform.get_deltas(
-            self.proposals.tensor, self.gt_boxes.tensor
-        )
-        box_dim = gt_bbox_deltas.size(1)  # 4 or 5
-        cls_agnostic_bbox_reg = self.pred_bbox_deltas.size(1) == box_dim
-        device = self.pred_bbox_deltas.device
-
-        bg_class_ind = self.pred_class_logits.shape[1] - 1
-
-        # Box delta loss is only computed between the prediction for the gt class k
-        # (if 0 <= k < bg_class_ind) and the target; there is no loss defined on predictions
-        # for non-gt classes and background.
-        # Empty fg_inds produces a valid loss of zero as long as the size_average
-        # arg to smooth_l1_loss is False (otherwise it uses torch.mean internally
-        # and would produce a nan loss).
-        fg_inds = torch.nonzero((self.gt_classes >= 0) & (self.gt_classes < bg_class_ind)).squeeze(
-            1
-        )
-        if cls_agnostic_bbox_reg:
-            # pred_bbox_deltas only corresponds to foreground class for agnostic
-            gt_class_cols = torch.arange(box_dim, device=device)
-        else:
-            fg_gt_classes = self.gt_classes[fg_inds]
-            # pred_bbox_deltas for class k are located in columns [b * k : b * k + b],
-            # where b is the dimension of box representation (4 or 5)
-            # Note that compared to Detectron1,
-            # we do not perform bounding box regression for background classes.
-            gt_class_cols = box_dim * fg_gt_classes[:, None] + torch.arange(box_dim, device=device)
-
-        ### 
+        fg_inds, gt_class_cols, gt_bbox_deltas, normalizer = self._regression_targets()
 
         ## Computing the loss attenuation
-        error_loss = (self.pred_delta_variance[fg_inds[:, None], gt_class_cols] - (self.pred_bbox_deltas.clone().detach()[fg_inds[:, None], gt_class_cols] - gt_bbox_deltas[fg_inds])**2).sum()
-        loss_cal_final = (((self.pred_bbox_deltas[fg_inds[:, None], gt_class_cols] - gt_bbox_deltas[fg_inds])**2/(self.pred_delta_variance[fg_inds[:, None], gt_class_cols]) + 0.5*torch.log(self.pred_delta_variance[fg_inds[:, None], gt_class_cols])).sum() + error_loss)/self.gt_classes.numel() 
+        pred_deltas = self.pred_bbox_deltas[fg_inds[:, None], gt_class_cols]
+        pred_variance = self.pred_delta_variance[fg_inds[:, None], gt_class_cols]
+        error_loss = (pred_variance - (pred_deltas.clone().detach() - gt_bbox_deltas)**2).sum()
+        loss_cal_final = (((pred_deltas - gt_bbox_deltas)**2/pred_variance + 0.5*torch.log(pred_variance)).sum() + error_loss)/normalizer
 
         return loss_cal_final
 
@@ -443,16 +684,34 @@ class FastRCNNOutputs(object):
         )
         return boxes_var.view(num_pred, K * B).split(self.num_preds_per_image, dim=0)
 
-    def inference(self, score_thresh, nms_thresh, topk_per_image):
+    def inference(self, score_thresh, nms_thresh, topk_per_image, nms_engine=None, fused=True):
         """
         Args:
             score_thresh (float): same as fast_rcnn_inference.
             nms_thresh (float): same as fast_rcnn_inference.
             topk_per_image (int): same as fast_rcnn_inference.
+            nms_engine (NMSEngine): same as fast_rcnn_inference.
+            fused (bool): threshold the scores first and decode only the surviving
+                rows (`fast_rcnn_fused_inference`). When False, decode all the rows
+                and run `fast_rcnn_inference` image by image.
         Returns:
             list[Instances]: same as fast_rcnn_inference.
             list[Tensor]: same as fast_rcnn_inference.
         """
+        if fused:
+            return fast_rcnn_fused_inference(
+                self.box2box_transform,
+                self.pred_class_logits,
+                self.pred_bbox_deltas,
+                self.pred_delta_variance,
+                self.proposals.tensor,
+                self.num_preds_per_image,
+                self.image_shapes,
+                score_thresh,
+                nms_thresh,
+                topk_per_image,
+                nms_engine,
+            )
 
         boxes = self.predict_boxes()
         scores = self.predict_probs()
@@ -460,6 +719,6 @@ class FastRCNNOutputs(object):
         image_shapes = self.image_shapes
 
         return fast_rcnn_inference(
-            boxes, scores, variance, image_shapes, score_thresh, nms_thresh, topk_per_image
+            boxes, scores, variance, image_shapes, score_thresh, nms_thresh, topk_per_image, nms_engine
         )
 
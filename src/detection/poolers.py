@@ -27,15 +27,15 @@ def convert_boxes_to_pooler_format(box_lists):
             (x0, y0, x1, y1) comes from.
     """
 
-    def fmt_box_list(box_tensor, batch_index):
-        repeated_index = torch.full(
-            (len(box_tensor), 1), batch_index, dtype=box_tensor.dtype, device=box_tensor.device
-        )
-        return torch.cat((repeated_index, box_tensor), dim=1)
-
-    pooler_fmt_boxes = torch.cat(
-        [fmt_box_list(box_list.tensor, i) for i, box_list in enumerate(box_lists)], dim=0
-    )
+    # Filled in place, slice by slice, instead of concatenating per-image tensors
+    first = box_lists[0].tensor
+    pooler_fmt_boxes = first.new_empty((sum(len(b) for b in box_lists), 5))
+    start = 0
+    for i, box_list in enumerate(box_lists):
+        end = start + len(box_list)
+        pooler_fmt_boxes[start:end, 0] = i
+        pooler_fmt_boxes[start:end, 1:] = box_list.tensor
+        start = end
 
     return pooler_fmt_boxes
 
@@ -88,15 +88,20 @@ class ROIPooler(nn.Module):
         Args:
             x (list[Tensor]): A list of feature maps with scales matching those used to
                 construct this module.
-            box_lists (list[Boxes]):
-                A list of N Boxes , where N is the number of images in the batch.
+            box_lists (list[Boxes] or Tensor):
+                A list of N Boxes , where N is the number of images in the batch,
+                or the boxes already in the (M, 5) pooler format, e.g. from
+                :meth:`RaggedInstances.pooler_format`.
 
         Returns:
             Tensor:
                 A tensor of shape (M, C, output_size/2, output_size/2) where M is the total number of
                 boxes aggregated over all N batch images and C is the number of channels in `x`.
         """
-        pooler_fmt_boxes = convert_boxes_to_pooler_format(box_lists)
+        if isinstance(box_lists, torch.Tensor):
+            pooler_fmt_boxes = box_lists
+        else:
+            pooler_fmt_boxes = convert_boxes_to_pooler_format(box_lists)
         output = self.level_poolers(x, pooler_fmt_boxes)
         output = self.max_pool(output)
 
@@ -2,7 +2,7 @@
 import math
 import torch
 
-from ..utils import Instances
+from ..utils import Instances, RaggedInstances
 
 
 def add_ground_truth_to_proposals(gt_boxes, proposals):
@@ -12,12 +12,12 @@ def add_ground_truth_to_proposals(gt_boxes, proposals):
     Args:
         gt_boxes(list[Boxes]): list of N elements. Element i is a Boxes
             representing the gound-truth for image i.
-        proposals (list[Instances]): list of N elements. Element i is a Instances
+        proposals (list[Instances] or RaggedInstances): list of N elements. Element i is a Instances
             representing the proposals for image i.
 
     Returns:
-        list[Instances]: list of N Instances. Each is the proposals for the image,
-            with field "proposal_boxes" and "objectness_logits".
+        list[Instances] or RaggedInstances: list of N Instances (same type as `proposals`).
+            Each is the proposals for the image, with field "proposal_boxes" and "objectness_logits".
     """
     assert gt_boxes is not None
 
@@ -25,12 +25,60 @@ def add_ground_truth_to_proposals(gt_boxes, proposals):
     if len(proposals) == 0:
         return proposals
 
+    if isinstance(proposals, RaggedInstances):
+        return append_boxes_to_proposals(gt_boxes, proposals)
+
     return [
         add_ground_truth_to_proposals_single_image(gt_boxes_i, proposals_i)
         for gt_boxes_i, proposals_i in zip(gt_boxes, proposals)
     ]
 
 
+def append_boxes_to_proposals(boxes, proposals):
+    """
+    Append boxes after the proposals of every image, with an objectness logit
+    corresponding to P(object) \approx 1.
+
+    Args:
+        boxes (list[Boxes]): list of N elements, the boxes to add to image i.
+        proposals (RaggedInstances): proposals of the N images.
+
+    Returns:
+        RaggedInstances: the proposals of every image followed by its boxes.
+    """
+    logit_value = math.log((1.0 - 1e-10) / (1 - (1.0 - 1e-10)))
+    device = proposals.device
+    new_proposals = RaggedInstances.from_instances([
+        Instances(image_size, proposal_boxes=boxes_i.to(device),
+                  objectness_logits=torch.full((len(boxes_i),), logit_value, device=device))
+        for boxes_i, image_size in zip(boxes, proposals.image_sizes)
+    ])
+    return proposals.append_per_image(new_proposals)
+
+
+def add_seed_proposals(seed_boxes, proposals):
+    """
+    Inject externally predicted boxes, e.g. the Kalman predictions of the confirmed
+    tracks of a tracker, as extra proposals at inference. They are clipped to the
+    image and empty boxes are dropped, so they can be appended after the RPN
+    proposals have been trimmed and are always sent to the box head.
+
+    Args:
+        seed_boxes (list[Boxes]): list of N elements, the seed boxes of image i.
+        proposals (RaggedInstances): proposals of the N images.
+
+    Returns:
+        RaggedInstances: the proposals of every image followed by its seeds.
+    """
+    assert len(proposals) == len(seed_boxes)
+    seeds = []
+    for boxes, image_size in zip(seed_boxes, proposals.image_sizes):
+        boxes = boxes.clone()
+        boxes.clip(image_size)
+        seeds.append(boxes[boxes.nonempty()])
+    return append_boxes_to_proposals(seeds, proposals)
+
+
 def add_ground_truth_to_proposals_single_image(gt_boxes, proposals):
     """
     Augment `proposals` with ground-truth boxes from `gt_boxes`.
@@ -55,3 +103,67 @@ def add_ground_truth_to_proposals_single_image(gt_boxes, proposals):
     new_proposals = Instances.cat([proposals, gt_proposal])
 
     return new_proposals
+
+
+def proposal_budget(objectness_logits, mode, min_proposals, max_proposals, mass_fraction=0.9,
+                    min_logit=0.0, knee_scale=1.0):
+    """
+    Number of proposals worth sending to the box head for one image.
+
+    Args:
+        objectness_logits (Tensor): objectness logits of the proposals of one image,
+            sorted in decreasing order.
+        mode (str): one of
+            - "none": keep all proposals (up to `max_proposals`).
+            - "mass": smallest k whose sigmoid objectness sums up to `mass_fraction`
+              of the total objectness mass.
+            - "logit": keep proposals with a logit of at least `min_logit`.
+            - "knee": knee point of the sorted objectness curve (point furthest below
+              the chord between its end points), times `knee_scale`. The scale is
+              fitted on the recall curve of the evaluation set.
+        min_proposals, max_proposals (int): bounds of the budget.
+
+    Returns:
+        int: the number of top proposals to keep.
+    """
+    num_proposals = len(objectness_logits)
+    if mode == "none" or num_proposals == 0:
+        k = num_proposals
+    elif mode == "mass":
+        cum_mass = torch.sigmoid(objectness_logits).cumsum(dim=0)
+        k = int(torch.searchsorted(cum_mass, mass_fraction * cum_mass[-1:]).item()) + 1
+    elif mode == "logit":
+        k = int((objectness_logits >= min_logit).sum().item())
+    elif mode == "knee":
+        probs = torch.sigmoid(objectness_logits)
+        span = (probs[0] - probs[-1]).clamp(min=1e-6)
+        y = (probs - probs[-1]) / span
+        x = torch.linspace(0, 1, num_proposals, device=probs.device)
+        k = int(math.ceil(knee_scale * (int(((1 - x) - y).argmax().item()) + 1)))
+    else:
+        raise ValueError("Unknown proposal budget mode: {}".format(mode))
+
+    return min(max(k, min_proposals), max_proposals, num_proposals)
+
+
+def apply_proposal_budget(proposals, mode, min_proposals, max_proposals, mass_fraction=0.9,
+                          min_logit=0.0, knee_scale=1.0):
+    """
+    Call `proposal_budget` for all images and keep the top proposals of each image.
+
+    Args:
+        proposals (list[Instances] or RaggedInstances): proposals sorted by decreasing "objectness_logits".
+        Others: see `proposal_budget`.
+
+    Returns:
+        list[Instances] or RaggedInstances: the trimmed proposals, same type as `proposals`.
+        list[int]: number of proposals kept for each image.
+    """
+    num_kept = [
+        proposal_budget(p.objectness_logits, mode, min_proposals, max_proposals, mass_fraction,
+                        min_logit, knee_scale)
+        for p in proposals
+    ]
+    if isinstance(proposals, RaggedInstances):
+        return proposals.head(num_kept), num_kept
+    return [p[:k] for p, k in zip(proposals, num_kept)], num_kept
@@ -126,6 +126,18 @@ class DetectionMAP:
             precisions = interpolated_precision
         return precisions, recalls
 
+    def compute_map(self, interpolated=True):
+        """
+        Mean average precision over all the classes
+        :param interpolated: will compute the interpolated curve
+        :return: mAP, list of the average precision of every class
+        """
+        average_precisions = []
+        for i in range(self.n_class):
+            precisions, recalls = self.compute_precision_recall_(i, interpolated)
+            average_precisions.append(self.compute_ap(precisions, recalls))
+        return sum(average_precisions)/len(average_precisions), average_precisions
+
     def plot_pr(self, ax, class_name, precisions, recalls, average_precision):
         ax.step(recalls, precisions, color='b', alpha=0.2,
                 where='post')
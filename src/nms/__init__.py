@@ -1 +1,3 @@
 from .nms import batched_nms, find_top_rpn_proposals, bayes_od_clustering
+from .bayes_od import compute_mean_covariance, dirichlet_counts
+from .engine import NMSEngine, TorchvisionNMS, GridNMS, MatrixNMS, build_nms_engine
@@ -0,0 +1,50 @@
+"""
+PyTorch counterparts of the sampling statistics used by BayesOD
+(see `bayesian_infer_bayesOD.py` for the original TensorFlow implementation).
+"""
+
+import torch
+
+
+def compute_mean_covariance(output_boxes):
+    """
+    Given the inference results from M runs of MC dropout,
+    computes the mean and covariance of every box.
+
+    Args:
+        output_boxes (Tensor): MxNx4 tensor containing inference results from M runs of MC dropout
+
+    Returns:
+        mean (Tensor): Nx4 tensor containing the per box mean
+        cov (Tensor): Nx4x4 tensor containing the per box covariance matrix
+    """
+    num_samples = output_boxes.shape[0]
+    mean = output_boxes.mean(dim=0)
+
+    centered = (output_boxes - mean).permute(1, 0, 2)  # N x M x 4
+    cov = torch.matmul(centered.transpose(1, 2), centered) / max(num_samples - 1, 1)
+
+    return mean, cov
+
+
+def dirichlet_counts(class_probs, prior_alpha=0.0):
+    """
+    Counts of the Dirichlet distribution over categories obtained from M samples
+    of the categorical distribution. Every sample votes for its most likely class.
+
+    Args:
+        class_probs (Tensor): MxNxC tensor of class probabilities of every sample.
+        prior_alpha (float): count added to every category. Use 1/C for the
+            non-informative prior of BayesOD, 0 for no prior.
+
+    Returns:
+        Tensor: NxC tensor of Dirichlet counts.
+    """
+    num_classes = class_probs.shape[-1]
+    votes = class_probs.argmax(dim=-1)  # M x N
+    counts = torch.zeros(
+        votes.shape[1], num_classes, dtype=class_probs.dtype, device=class_probs.device
+    )
+    counts.scatter_add_(1, votes.t(), torch.ones_like(votes.t(), dtype=class_probs.dtype))
+
+    return counts + prior_alpha
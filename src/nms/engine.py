@@ -0,0 +1,260 @@
+"""
+Interchangeable non-maximum suppression backends.
+
+Every engine is called like `batched_nms`:
+
+    keep = engine(boxes, scores, idxs, iou_threshold)
+
+and returns the indices of the kept boxes sorted in decreasing order of score.
+Boxes with different `idxs` never suppress each other. Engines that rescore the
+kept boxes (`rescores`, Matrix NMS) are called with `return_scores=True` so that
+the new scores reach the caller.
+"""
+
+import numpy as np
+import torch
+from torchvision.ops import boxes as box_ops
+
+from .nms import batched_nms
+
+
+def _offset_by_class(boxes, idxs):
+    """
+    Shift the boxes of every class by a class dependent offset so that boxes of
+    different classes do not overlap. Same trick as torchvision's batched_nms.
+    """
+    if boxes.numel() == 0:
+        return boxes
+    max_coordinate = boxes.max()
+    offsets = idxs.to(boxes) * (max_coordinate + 1)
+    return boxes + offsets[:, None]
+
+
+class NMSEngine(object):
+    """
+    Base class of the NMS backends. Subclasses implement :meth:`_nms`, which runs
+    class-agnostic NMS on boxes that are already separated by class.
+    """
+
+    # True if the scores returned with `return_scores` differ from the input scores
+    rescores = False
+
+    def __call__(self, boxes, scores, idxs, iou_threshold, max_output=-1, return_scores=False):
+        """
+        Args:
+            boxes (Tensor[N, 4]): boxes in (x1, y1, x2, y2) format.
+            scores (Tensor[N]): scores of the boxes.
+            idxs (Tensor[N]): class (or level) index of every box.
+            iou_threshold (float): boxes with IoU > iou_threshold are suppressed.
+            max_output (int): keep at most this many boxes. Set < 0 to keep all.
+                Backends that process boxes in score order stop early.
+            return_scores (bool): also return the scores of the kept boxes.
+
+        Returns:
+            Tensor[K]: int64 indices of the kept boxes, sorted by decreasing score.
+            Tensor[K]: if `return_scores`, their scores after NMS.
+        """
+        assert boxes.shape[-1] == 4
+        if boxes.numel() == 0:
+            keep = torch.empty((0,), dtype=torch.int64, device=boxes.device)
+            return (keep, scores[keep]) if return_scores else keep
+
+        keep, kept_scores = self._nms(_offset_by_class(boxes, idxs), scores, iou_threshold, max_output)
+        if max_output >= 0:
+            keep, kept_scores = keep[:max_output], kept_scores[:max_output]
+        return (keep, kept_scores) if return_scores else keep
+
+    def _nms(self, boxes, scores, iou_threshold, max_output):
+        """
+        Returns:
+            Tensor[K], Tensor[K]: the kept indices and their scores.
+        """
+        raise NotImplementedError()
+
+
+class TorchvisionNMS(NMSEngine):
+    """
+    The compiled torchvision kernel. This is the reference implementation.
+    """
+
+    def __call__(self, boxes, scores, idxs, iou_threshold, max_output=-1, return_scores=False):
+        keep = batched_nms(boxes, scores, idxs, iou_threshold)
+        if max_output >= 0:
+            keep = keep[:max_output]
+        return (keep, scores[keep]) if return_scores else keep
+
+
+class GridNMS(NMSEngine):
+    """
+    Greedy NMS on the host that only compares a box against the already kept
+    boxes registered in the grid cells it covers. Two boxes can only have a
+    positive IoU if they share a cell, so the result is the same as the exhaustive
+    greedy NMS, but the number of IoU evaluations grows with the local density of
+    boxes instead of the total number of boxes.
+    """
+
+    def __init__(self, cell_size=None):
+        """
+        Args:
+            cell_size (float, optional): side of the square grid cells in pixels.
+                Defaults to the median of the longer box side of the input.
+        """
+        self.cell_size = cell_size
+
+    def _nms(self, boxes, scores, iou_threshold, max_output):
+        device = boxes.device
+        boxes = boxes.detach().cpu().numpy().astype(np.float64)
+        scores = scores.detach().cpu().numpy()
+
+        x1, y1, x2, y2 = boxes.T
+        areas = (x2 - x1) * (y2 - y1)
+
+        cell_size = self.cell_size
+        if cell_size is None:
+            cell_size = max(float(np.median(np.maximum(x2 - x1, y2 - y1))), 1.0)
+        cx1 = np.floor(x1 / cell_size).astype(np.int64)
+        cy1 = np.floor(y1 / cell_size).astype(np.int64)
+        cx2 = np.floor(x2 / cell_size).astype(np.int64)
+        cy2 = np.floor(y2 / cell_size).astype(np.int64)
+
+        grid = {}
+        keep = []
+        for i in np.argsort(-scores, kind="stable"):
+            cells = [(gx, gy) for gx in range(cx1[i], cx2[i] + 1) for gy in range(cy1[i], cy2[i] + 1)]
+
+            candidates = [j for cell in cells for j in grid.get(cell, ())]
+            if candidates:
+                candidates = np.asarray(candidates)
+                w = np.minimum(x2[i], x2[candidates]) - np.maximum(x1[i], x1[candidates])
+                h = np.minimum(y2[i], y2[candidates]) - np.maximum(y1[i], y1[candidates])
+                inter = np.maximum(w, 0.0) * np.maximum(h, 0.0)
+                iou = inter / (areas[i] + areas[candidates] - inter)
+                if (iou > iou_threshold).any():
+                    continue
+
+            keep.append(i)
+            for cell in cells:
+                grid.setdefault(cell, []).append(i)
+            if 0 <= max_output <= len(keep):
+                break
+
+        keep = np.asarray(keep, dtype=np.int64)
+        return torch.as_tensor(keep, device=device), torch.as_tensor(scores[keep], device=device)
+
+
+class MatrixNMS(NMSEngine):
+    """
+    Fully vectorized NMS variants computed from the pairwise IoU matrix of the
+    score-sorted boxes.
+
+    * "fast": Fast NMS (YOLACT). A box is removed if any higher scoring box overlaps
+      it, even one that was itself removed. Single pass, suppresses slightly more
+      than greedy NMS.
+    * "cluster": Cluster NMS. Iterates Fast NMS using only the currently kept boxes
+      as suppressors until nothing changes; the fixed point is exactly the greedy
+      NMS result.
+    * "matrix": Matrix NMS (SOLOv2). Scores are decayed by the overlap with higher
+      scoring boxes. A box is removed if its decay is stronger than the decay of an
+      uncompensated overlap of `iou_threshold`, or if its decayed score drops below
+      `score_threshold`. The result is ranked by, and returned with, the decayed
+      scores, which should be probabilities.
+
+    The IoU matrix is evaluated in blocks of `block_size` rows to bound the memory.
+    """
+
+    def __init__(self, mode="cluster", kernel="linear", sigma=0.5, score_threshold=0.0, block_size=2048):
+        assert mode in ("fast", "cluster", "matrix"), mode
+        assert kernel in ("linear", "gaussian"), kernel
+        self.mode = mode
+        self.rescores = mode == "matrix"
+        self.kernel = kernel
+        self.sigma = sigma
+        self.score_threshold = score_threshold
+        self.block_size = block_size
+
+    def _iou_blocks(self, boxes):
+        """
+        Yield (start, block) where block[r, c] is the IoU between boxes start + r and c
+        if start + r < c, and 0 otherwise.
+        """
+        num_boxes = len(boxes)
+        cols = torch.arange(num_boxes, device=boxes.device)
+        for start in range(0, num_boxes, self.block_size):
+            rows = cols[start:start + self.block_size]
+            iou = box_ops.box_iou(boxes[rows], boxes)
+            yield start, iou.masked_fill_(rows[:, None] >= cols[None, :], 0.0)
+
+    def _decay(self, iou, compensate):
+        if self.kernel == "gaussian":
+            return torch.exp(-(iou ** 2 - compensate ** 2) / self.sigma)
+        return (1 - iou) / (1 - compensate).clamp(min=1e-6)
+
+    def _min_decay(self, iou_threshold):
+        """Decay of an overlap of `iou_threshold` with a box that is not suppressed itself."""
+        return float(self._decay(torch.tensor(float(iou_threshold)), torch.tensor(0.0)))
+
+    def _nms(self, boxes, scores, iou_threshold, max_output):
+        scores, order = scores.sort(descending=True)
+        boxes = boxes[order]
+        num_boxes = len(boxes)
+
+        if self.mode == "fast":
+            max_iou = boxes.new_zeros(num_boxes)
+            for _, iou in self._iou_blocks(boxes):
+                max_iou = torch.max(max_iou, iou.max(dim=0)[0])
+            keep = max_iou <= iou_threshold
+            return order[keep], scores[keep]
+
+        if self.mode == "cluster":
+            # A single block is computed once, larger inputs recompute their blocks at every iteration
+            suppress = None
+            if num_boxes <= self.block_size:
+                suppress = next(self._iou_blocks(boxes))[1] > iou_threshold
+            keep = torch.ones(num_boxes, dtype=torch.bool, device=boxes.device)
+            for _ in range(num_boxes):
+                if suppress is not None:
+                    new_keep = ~(suppress & keep[:, None]).any(dim=0)
+                else:
+                    suppressed = torch.zeros_like(keep)
+                    for start, iou in self._iou_blocks(boxes):
+                        suppressed |= ((iou > iou_threshold) & keep[start:start + len(iou), None]).any(dim=0)
+                    new_keep = ~suppressed
+                if torch.equal(new_keep, keep):
+                    break
+                keep = new_keep
+            return order[keep], scores[keep]
+
+        # Matrix NMS: compensate[i] is the largest IoU of box i with a higher scoring box
+        compensate = boxes.new_zeros(num_boxes)
+        for _, iou in self._iou_blocks(boxes):
+            compensate = torch.max(compensate, iou.max(dim=0)[0])
+
+        decay = boxes.new_ones(num_boxes)
+        for start, iou in self._iou_blocks(boxes):
+            # Masked pairs have iou = 0 and hence a decay >= 1, so they never win the min
+            block_decay = self._decay(iou, compensate[start:start + len(iou), None])
+            decay = torch.min(decay, block_decay.min(dim=0)[0])
+
+        decayed_scores = scores * decay
+        keep = (decay >= self._min_decay(iou_threshold)) & (decayed_scores >= self.score_threshold)
+        keep = torch.nonzero(keep).squeeze(1)
+        keep = keep[decayed_scores[keep].argsort(descending=True)]
+        return order[keep], decayed_scores[keep]
+
+
+NMS_BACKENDS = {
+    "torchvision": TorchvisionNMS,
+    "grid": GridNMS,
+    "fast": lambda: MatrixNMS(mode="fast"),
+    "cluster": lambda: MatrixNMS(mode="cluster"),
+    "matrix": lambda: MatrixNMS(mode="matrix"),
+}
+
+
+def build_nms_engine(name):
+    """
+    Build the NMS backend registered under `name` in `NMS_BACKENDS`.
+    """
+    if name not in NMS_BACKENDS:
+        raise ValueError("Unknown NMS backend: {}. Choose from {}".format(name, list(NMS_BACKENDS)))
+    return NMS_BACKENDS[name]()
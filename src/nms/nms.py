@@ -3,7 +3,7 @@ import torch
 import torchvision
 import torch.nn as nn
 from torch.autograd import Function
-from ..utils import Boxes, Instances
+from ..utils import Boxes, Instances, RaggedInstances
 from torchvision.ops import boxes as box_ops
 from torchvision.ops import nms as nms
 
@@ -16,6 +16,7 @@ def find_top_rpn_proposals(
     post_nms_topk,
     min_box_side_len,
     training,
+    nms_engine=None,
 ):
     """
     For each feature map, select the `pre_nms_topk` highest scoring proposals,
@@ -41,10 +42,12 @@ def find_top_rpn_proposals(
         training (bool): True if proposals are to be used in training, otherwise False.
             This arg exists only to support a legacy bug; look for the "NB: Legacy bug ..."
             comment.
+        nms_engine (NMSEngine, optional): NMS backend, see `engine.py`. Defaults to
+            `batched_nms`.
 
     Returns:
-        proposals (list[Instances]): list of N Instances. The i-th Instances
-            stores post_nms_topk object proposals for image i.
+        proposals (RaggedInstances): proposals of the N images. Image i has at most
+            post_nms_topk object proposals, sorted by the NMS backend.
     """
     num_images = len(image_sizes)
     device = proposals[0].device
@@ -66,7 +69,7 @@ def find_top_rpn_proposals(
 
 
     # 3. For each image, run a per-level NMS, and choose topk results.
-    results = []
+    result_boxes, result_logits = [], []
     # print(image_sizes)
     for n, image_size in enumerate(image_sizes):
         boxes = Boxes(topk_proposals[n])
@@ -74,24 +77,35 @@ def find_top_rpn_proposals(
         # Commenting the below because of an error
         boxes.clip(image_size) 
 
-        # filter empty boxes
+        # filter empty boxes. Indexing unconditionally costs one sync for the output size,
+        # checking first whether anything has to be removed would cost another one.
         keep = boxes.nonempty(threshold=min_box_side_len)
-        lvl = level_ids
-        # print(len(boxes))
-        if keep.sum().item() != len(boxes):
-            boxes, scores_per_img, lvl = boxes[keep], scores_per_img[keep], lvl[keep]
-
-        keep = batched_nms(boxes.tensor, scores_per_img, lvl, nms_thresh)
+        boxes, scores_per_img, lvl = boxes[keep], scores_per_img[keep], level_ids[keep]
+
+        if nms_engine is None:
+            keep = batched_nms(boxes.tensor, scores_per_img, lvl, nms_thresh)
+        elif nms_engine.rescores:
+            # The engine rescores probabilities, the proposals keep logits
+            keep, kept_probs = nms_engine(boxes.tensor, scores_per_img.sigmoid(), lvl, nms_thresh,
+                                          max_output=post_nms_topk, return_scores=True)
+            kept_probs = kept_probs.clamp(1e-6, 1 - 1e-6)
+            scores_per_img = scores_per_img.index_put((keep,), torch.log(kept_probs) - torch.log1p(-kept_probs))
+        else:
+            keep = nms_engine(boxes.tensor, scores_per_img, lvl, nms_thresh, max_output=post_nms_topk)
         # keep = nms(boxes.tensor, scores_per_img, nms_thresh)
 
         keep = keep[:post_nms_topk]
 
-        res = Instances(image_size)
-        res.proposal_boxes = boxes[keep]
-        res.objectness_logits = scores_per_img[keep]
-        results.append(res)
-    
-    return results
+        result_boxes.append(boxes.tensor[keep])
+        result_logits.append(scores_per_img[keep])
+
+    # Concatenated once, the per-image proposals are views of these tensors
+    return RaggedInstances(
+        image_sizes,
+        [len(k) for k in result_logits],
+        proposal_boxes=Boxes(torch.cat(result_boxes, dim=0)),
+        objectness_logits=torch.cat(result_logits, dim=0),
+    )
 
 #Detectron2 implementation
 def batched_nms(boxes, scores, idxs, iou_threshold):
@@ -10,7 +10,7 @@ from . import AnchorGenerator
 from . import RPNProcessing
 
 from ..utils import Boxes, Matcher, Box2BoxTransform
-from ..nms import find_top_rpn_proposals
+from ..nms import find_top_rpn_proposals, build_nms_engine
 
 class RPNHead(nn.Module):
     """docstring for RPN"""
@@ -84,8 +84,9 @@ class RPN(nn.Module):
         self.anchor_matcher = Matcher(cfg.RPN.IOU_THRESHOLDS, cfg.RPN.IOU_LABELS, allow_low_quality_matches=True)
         self.rpn_head = RPNHead(cfg, in_channels, self.num_anchors)
         self.anchors_generator = AnchorGenerator(cfg)
+        self.nms_engine = build_nms_engine(cfg.RPN.NMS_BACKEND)
 
-    def forward(self, features, gt_target=None, image_sizes=None, is_training=True):
+    def forward(self, features, gt_target=None, image_sizes=None, is_training=True, pre_nms_topk=None, post_nms_topk=None):
         """
         Args:
             images (ImageList): input images of length `N`
@@ -95,9 +96,11 @@ class RPN(nn.Module):
                 vary between feature maps (e.g., if a feature pyramid is used).
             gt_instances (list[Instances], optional): a length `N` list of `Instances`s.
                 Each `Instances` stores ground-truth instances for the corresponding image.
+            pre_nms_topk, post_nms_topk (int, optional): override the number of proposals
+                kept before and after NMS, e.g. when the detector is seeded with tracks.
 
         Returns:
-            proposals: list[Instances] or None
+            proposals: RaggedInstances, usable as list[Instances]
             loss: dict[Tensor]
         """
 
@@ -143,13 +146,16 @@ class RPN(nn.Module):
                 RPNProcessor.predict_objectness_logits(),
                 image_sizes,
                 self.nms_thresh,
-                self.pre_nms_topk[is_training],
-                self.post_nms_topk[is_training],
+                pre_nms_topk or self.pre_nms_topk[is_training],
+                post_nms_topk or self.post_nms_topk[is_training],
                 self.min_box_side_len,
                 is_training,
+                self.nms_engine,
             )
             
-            inds = [p.objectness_logits.sort(descending=True)[1] for p in proposals]
-            proposals = [p[ind] for p, ind in zip(proposals, inds)]
+            # Sort by decreasing objectness within every image, in one pass over the batch
+            order = proposals.objectness_logits.sort(descending=True)[1]
+            order = order[torch.sort(proposals.batch_indices[order], stable=True)[1]]
+            proposals = proposals.index(order, proposals.num_instances)
 
         return proposals, losses
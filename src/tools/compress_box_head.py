@@ -0,0 +1,189 @@
+'''
+Truncated-SVD compression of the fully connected layers of the box head.
+
+`fc1` (C*7*7 x FC_DIM) and `fc2` (FC_DIM x FC_DIM) are replaced by two thin
+linear layers each, W ~= (U_r sqrt(S_r)) (sqrt(S_r) V_r^T), and the ranks are
+stored in cfg.ROI_HEADS.FC_RANK, so the compressed checkpoint loads through
+`model.create_model` like any other checkpoint.
+
+For every rank the tool writes a checkpoint and prints a table of rank, box
+head parameters, box head latency and KITTI mAP. Optionally the compressed
+model is fine-tuned on KITTI before the evaluation.
+
+python -m src.tools.compress_box_head --model_path epoch_00050.model --ranks 64 128 256 --output_dir compressed
+'''
+
+import os
+import time
+import argparse
+import numpy as np
+import torch
+from torch import nn, optim
+
+from model import create_model
+from src.datasets import KittiDataset, kitti_collate_fn
+from src.eval.detection_map import DetectionMAP
+from src.utils import utils
+from src.tools import train_test
+
+
+def factorize_linear(linear, rank):
+    """
+    Best rank `rank` approximation of a `nn.Linear` as two linear layers.
+
+    Args:
+        linear (nn.Linear): layer with weight W of shape (out, in).
+        rank (int): rank of the approximation.
+
+    Returns:
+        nn.Module: `linear` itself if the rank does not reduce it, otherwise
+            nn.Sequential(nn.Linear(in, rank, bias=False), nn.Linear(rank, out)).
+    """
+    out_features, in_features = linear.weight.shape
+    if rank <= 0 or rank >= min(in_features, out_features):
+        return linear
+
+    with torch.no_grad():
+        U, S, Vh = torch.linalg.svd(linear.weight.double(), full_matrices=False)
+        sqrt_s = S[:rank].sqrt()
+
+        first = nn.Linear(in_features, rank, bias=False)
+        second = nn.Linear(rank, out_features)
+        first.weight.copy_((sqrt_s[:, None] * Vh[:rank]).to(linear.weight))
+        second.weight.copy_((U[:, :rank] * sqrt_s[None, :]).to(linear.weight))
+        second.bias.copy_(linear.bias)
+
+    return nn.Sequential(first, second).to(linear.weight.device)
+
+
+def compress_model(model, fc1_rank, fc2_rank):
+    """
+    Factorize fc1/fc2 of the box head of `model` in place and record the ranks in `model.cfg`.
+    """
+    box_predictor = model.detector.box_predictor
+    if not isinstance(box_predictor.fc1, nn.Linear) or not isinstance(box_predictor.fc2, nn.Linear):
+        raise ValueError("The box head of this model is already factorized")
+
+    box_predictor.fc1 = factorize_linear(box_predictor.fc1, fc1_rank)
+    box_predictor.fc2 = factorize_linear(box_predictor.fc2, fc2_rank)
+
+    model.cfg.defrost()
+    model.cfg.ROI_HEADS.FC_RANK = (
+        fc1_rank if isinstance(box_predictor.fc1, nn.Sequential) else 0,
+        fc2_rank if isinstance(box_predictor.fc2, nn.Sequential) else 0,
+    )
+    return model
+
+
+def box_head_parameters(model):
+    box_predictor = model.detector.box_predictor
+    return sum(p.numel() for l in [box_predictor.fc1, box_predictor.fc2] for p in l.parameters())
+
+
+def box_head_latency(model, num_rois, repeats=10):
+    """
+    Median time in ms of the box head on `num_rois` random pooled features.
+    """
+    model.eval()
+    device = next(model.parameters()).device
+    box_predictor = model.detector.box_predictor
+    if hasattr(box_predictor, "reduce"):
+        channels = box_predictor.reduce.in_channels
+    else:
+        channels = next(m for m in box_predictor.fc1.modules() if isinstance(m, nn.Linear)).in_features // 49
+    x = torch.randn(num_rois, channels, 7, 7, device=device)
+    times = []
+    with torch.no_grad():
+        for _ in range(repeats + 1):
+            if device.type == 'cuda':
+                torch.cuda.synchronize()
+            start = time.perf_counter()
+            model.detector.box_predictor(x)
+            if device.type == 'cuda':
+                torch.cuda.synchronize()
+            times.append(time.perf_counter() - start)
+    return 1000*np.median(times[1:])
+
+
+def evaluate_map(model, loader, num_images):
+    model.eval()
+    device = next(model.parameters()).device
+    mAP = DetectionMAP(model.cfg.INPUT.NUM_CLASSES)
+    with torch.no_grad():
+        for idx, batch_sample in enumerate(loader):
+            if idx >= num_images:
+                break
+            in_images = batch_sample['image'].to(device)
+            _, instances, _, _ = model(in_images, None, False)
+            for instance, target in zip(instances, batch_sample['target']):
+                mAP.evaluate(instance.pred_boxes.tensor.cpu().numpy(), instance.pred_classes.cpu().numpy(),
+                             instance.scores.cpu().numpy(), target.gt_boxes.tensor.numpy(),
+                             target.gt_classes.numpy())
+    return mAP.compute_map()[0]
+
+
+def finetune(model, train_loader, val_loader, epochs, log_dir, device):
+    cfg = model.cfg
+    model.train()
+    optimizer = optim.Adam(model.parameters(), lr=0.1*cfg.TRAIN.LR, weight_decay=0.01)
+    lr_scheduler = optim.lr_scheduler.MultiStepLR(optimizer, milestones=[epochs], gamma=cfg.TRAIN.LR_DECAY)
+    train_test.train(model, train_loader, val_loader, optimizer, epochs, log_dir, lr_scheduler, device, log_dir, cfg)
+    model.eval()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model_path", required=True, help="checkpoint to compress")
+    ap.add_argument("--ranks", type=int, nargs="+", required=True, help="ranks of fc1")
+    ap.add_argument("--fc2_ranks", type=int, nargs="+", default=None,
+                    help="ranks of fc2, one per fc1 rank. Defaults to the fc1 ranks, 0 keeps fc2 full")
+    ap.add_argument("--output_dir", required=True)
+    ap.add_argument("--finetune_epochs", type=int, default=0)
+    ap.add_argument("--num_eval_images", type=int, default=500)
+    ap.add_argument("--num_rois", type=int, default=1000, help="ROIs per timing run, POST_NMS_TOPK_TEST by default")
+    args = ap.parse_args()
+
+    fc2_ranks = args.fc2_ranks if args.fc2_ranks is not None else args.ranks
+    assert len(fc2_ranks) == len(args.ranks), "Give one fc2 rank per fc1 rank"
+    if not os.path.exists(args.output_dir):
+        os.makedirs(args.output_dir)
+
+    model = create_model(args.model_path)
+    cfg = model.cfg
+    device = next(model.parameters()).device
+
+    dataset = KittiDataset(cfg.PATH.DATASET, transform=utils.image_transform(cfg), cfg=cfg)
+    train_len = int(cfg.TRAIN.DATASET_DIVIDE*len(dataset))
+    train_dataset, val_dataset = torch.utils.data.random_split(
+        dataset, [train_len, len(dataset) - train_len],
+        generator=torch.Generator().manual_seed(cfg.RANDOMIZATION.SEED))
+    val_loader = torch.utils.data.DataLoader(val_dataset, batch_size=1, collate_fn=kitti_collate_fn)
+
+    rows = [("full", box_head_parameters(model), box_head_latency(model, args.num_rois),
+             evaluate_map(model, val_loader, args.num_eval_images))]
+
+    for fc1_rank, fc2_rank in zip(args.ranks, fc2_ranks):
+        model = compress_model(create_model(args.model_path), fc1_rank, fc2_rank)
+        name = "rank_{}_{}".format(*model.cfg.ROI_HEADS.FC_RANK)
+
+        if args.finetune_epochs > 0:
+            train_loader = torch.utils.data.DataLoader(train_dataset, batch_size=cfg.TRAIN.BATCH_SIZE,
+                shuffle=True, collate_fn=kitti_collate_fn, drop_last=True)
+            train_val_loader = torch.utils.data.DataLoader(val_dataset, batch_size=cfg.TRAIN.BATCH_SIZE,
+                collate_fn=kitti_collate_fn, drop_last=True)
+            finetune(model, train_loader, train_val_loader, args.finetune_epochs,
+                     os.path.join(args.output_dir, name), device)
+
+        torch.save({'model_state_dict': model.state_dict(), 'cfg': model.cfg},
+                   os.path.join(args.output_dir, name + ".model"))
+
+        rows.append((name, box_head_parameters(model), box_head_latency(model, args.num_rois),
+                     evaluate_map(model, val_loader, args.num_eval_images)))
+
+    print("{:<16} {:>12} {:>14} {:>8}".format("rank (fc1, fc2)", "fc params", "latency (ms)", "mAP"))
+    for name, params, latency, mean_ap in rows:
+        print("{:<16} {:>12d} {:>14.2f} {:>8.4f}".format(name, params, latency, mean_ap))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+'''
+Offline tracking evaluation over all the KITTI tracking training sequences.
+
+Every sequence is detected in batches of cfg.TRACKING.EVAL_BATCH_SIZE frames,
+then its detections (NumPy arrays) are handed to a pool of worker processes
+that run one `MultiObjTracker` per sequence, while the model detects the next
+sequence. The CLEAR MOT counts of the sequences are merged into one report.
+
+python -m src.tools.track_eval --model_path epoch_00050.model --output_dir results
+or: python main.py -name <experiment> -mode track_eval -epoch 50
+'''
+
+import os
+import glob
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import torch
+from scipy.optimize import linear_sum_assignment
+
+from model import create_model
+from src.datasets import KittiMOTDataset, kitti_collate_fn
+from src.tracker.track import build_tracker
+from src.tracker.iou_matching import iou_matrix
+from src.utils import utils
+
+COUNTS = ["frames", "gt", "tp", "fp", "fn", "idsw", "iou_sum", "tracker_time"]
+
+
+def list_sequences(root_dir):
+    """
+    Returns:
+        list[str]: names of the training sequences ("0000", "0001", ...).
+    """
+    labels = glob.glob(os.path.join(root_dir, "training", "label_02", "*.txt"))
+    return sorted(os.path.splitext(os.path.basename(x))[0] for x in labels)
+
+
+def detect_sequence(model, dataset, device, batch_size):
+    """
+    Run the detector over one sequence.
+
+    Returns:
+        list[dict]: per frame NumPy arrays, "pred_boxes", "pred_variance", "scores",
+            "pred_classes" of the detections and "gt_boxes", "gt_classes", "gt_trackid".
+    """
+    loader = torch.utils.data.DataLoader(dataset, batch_size=batch_size, shuffle=False,
+                                         collate_fn=kitti_collate_fn)
+    frames = []
+    with torch.no_grad():
+        for batch_sample in loader:
+            in_images = batch_sample['image'].to(device)
+            _, instances, _, _ = model(in_images, is_training=False)
+            for instance, target in zip(instances, batch_sample['target']):
+                frame = instance.to_numpy(["pred_boxes", "pred_variance", "scores", "pred_classes"])
+                frame.update(target.to_numpy(["gt_boxes", "gt_classes", "gt_trackid"]))
+                frames.append(frame)
+    return frames
+
+
+def track_sequence(name, frames, cfg, iou_threshold):
+    """
+    Track one sequence and count the CLEAR MOT events against the ground truth.
+    Runs in a worker process, the inputs and outputs are plain NumPy data.
+
+    Returns:
+        (str, dict): the sequence name and its counts, see `COUNTS`.
+    """
+    tracker = build_tracker(cfg)
+    counts = dict.fromkeys(COUNTS, 0)
+    last_match = {}
+
+    for frame in frames:
+        start = time.perf_counter()
+        tracker.predict()
+        tracker.update(frame["pred_boxes"], frame["pred_variance"])
+        counts["tracker_time"] += time.perf_counter() - start
+
+        track_boxes, track_ids = tracker.track_boxes(), tracker.track_ids()
+        gt_boxes, gt_ids = frame["gt_boxes"].reshape(-1, 4), frame["gt_trackid"].reshape(-1)
+
+        iou = iou_matrix(gt_boxes, track_boxes)
+        rows, cols = linear_sum_assignment(-iou)
+        keep = iou[rows, cols] >= iou_threshold
+        rows, cols = rows[keep], cols[keep]
+
+        for gt_id, track_id in zip(gt_ids[rows].tolist(), track_ids[cols].tolist()):
+            if gt_id in last_match and last_match[gt_id] != track_id:
+                counts["idsw"] += 1
+            last_match[gt_id] = track_id
+
+        counts["frames"] += 1
+        counts["gt"] += len(gt_boxes)
+        counts["tp"] += len(rows)
+        counts["fp"] += len(track_boxes) - len(rows)
+        counts["fn"] += len(gt_boxes) - len(rows)
+        counts["iou_sum"] += float(iou[rows, cols].sum())
+
+    return name, counts
+
+
+def summarize(counts):
+    """
+    Returns:
+        dict: MOTA, MOTP, precision, recall and tracker time per frame of the counts.
+    """
+    gt, tp = max(counts["gt"], 1), counts["tp"]
+    return {
+        "MOTA": 1. - (counts["fn"] + counts["fp"] + counts["idsw"]) / gt,
+        "MOTP": counts["iou_sum"] / max(tp, 1),
+        "precision": tp / max(tp + counts["fp"], 1),
+        "recall": tp / gt,
+        "ms/frame": 1000. * counts["tracker_time"] / max(counts["frames"], 1),
+    }
+
+
+def format_report(results, skipped=()):
+    """
+    Args:
+        results (dict[str, dict]): counts of every sequence.
+        skipped (list[str]): sequences without any frame, listed under the table.
+
+    Returns:
+        str: a table with one row per sequence and the merged total.
+    """
+    total = {k: sum(r[k] for r in results.values()) for k in COUNTS}
+    header = "{:<8} {:>7} {:>7} {:>6} {:>6} {:>6} {:>5} {:>7} {:>7} {:>9}".format(
+        "seq", "frames", "gt", "tp", "fp", "fn", "idsw", "MOTA", "MOTP", "ms/frame")
+    lines = [header]
+    for name, counts in sorted(results.items()) + [("total", total)]:
+        summary = summarize(counts)
+        lines.append("{:<8} {:>7d} {:>7d} {:>6d} {:>6d} {:>6d} {:>5d} {:>7.3f} {:>7.3f} {:>9.3f}".format(
+            name, counts["frames"], counts["gt"], counts["tp"], counts["fp"], counts["fn"], counts["idsw"],
+            summary["MOTA"], summary["MOTP"], summary["ms/frame"]))
+    if skipped:
+        lines.append("Skipped (no frame): {}".format(" ".join(sorted(skipped))))
+    return "\n".join(lines)
+
+
+def evaluate(model, root_dir, transform, device, results_dir, cfg, sequences=None, num_workers=None):
+    """
+    Detect and track all the sequences, and write the merged report to
+    `results_dir`/tracking_eval.txt.
+
+    Args:
+        sequences (list[str], optional): sequences to evaluate, all by default.
+        num_workers (int, optional): tracker processes, cfg.TRACKING.EVAL_WORKERS by default.
+
+    Returns:
+        dict[str, dict]: counts of every sequence.
+    """
+    sequences = sequences or list_sequences(root_dir)
+    num_workers = num_workers or cfg.TRACKING.EVAL_WORKERS
+    model.eval()
+
+    start = time.perf_counter()
+    futures, skipped = [], []
+    # fork: the workers only run NumPy trackers, and the entry points (main.py) are
+    # not import safe for spawn
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context("fork")) as executor:
+        for name in sequences:
+            # Every frame of every size: the sequences 0014-0020 are not 1242x375
+            dataset = KittiMOTDataset(root_dir, track=name, transform=transform, cfg=cfg, all_frames=True)
+            if len(dataset) == 0:
+                print("Sequence {}: no frame, skipped".format(name))
+                skipped.append(name)
+                continue
+            frames = detect_sequence(model, dataset, device, cfg.TRACKING.EVAL_BATCH_SIZE)
+            print("Sequence {}: {} frames detected".format(name, len(frames)))
+            futures.append(executor.submit(track_sequence, name, frames, cfg, cfg.TRACKING.EVAL_IOU))
+
+        results = dict(f.result() for f in futures)
+
+    report = format_report(results, skipped)
+    print(report)
+    print("Evaluated {} sequences in {:.1f} s".format(len(results), time.perf_counter() - start))
+
+    if not os.path.exists(results_dir):
+        os.makedirs(results_dir)
+    with open(os.path.join(results_dir, "tracking_eval.txt"), "w") as f:
+        f.write(report + "\n")
+    return results
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model_path", required=True)
+    ap.add_argument("--output_dir", required=True)
+    ap.add_argument("--sequences", nargs="+", default=None, help="all training sequences by default")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--association", choices=["iou", "gated"], default=None,
+                    help="cfg.TRACKING.ASSOCIATION by default")
+    args = ap.parse_args()
+
+    model = create_model(args.model_path)
+    cfg = model.cfg
+    if args.association is not None:
+        cfg.TRACKING.ASSOCIATION = args.association
+    device = next(model.parameters()).device
+    evaluate(model, cfg.PATH.DATASET, utils.image_transform(cfg), device, args.output_dir, cfg,
+             args.sequences, args.workers)
+
+
+if __name__ == "__main__":
+    main()
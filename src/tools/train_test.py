@@ -8,16 +8,19 @@ import sys
 from ..eval.detection_map import DetectionMAP
 import matplotlib.pyplot as plt
 from src.config import Cfg as cfg
-from ..tracker.track import MultiObjTracker
+from ..tracker.track import build_tracker
 from ..utils import Instances
 from ..utils import Boxes
+from ..utils.async_logger import build_async_logger
 
 
 def test(model, data_loader, device, results_dir):
 	is_training= False
 
 	mAP = DetectionMAP(len(cfg.INPUT.LABELS_TO_TRAIN)) # number of classes
-	tracker = MultiObjTracker(max_age=1)
+	tracker = build_tracker(cfg, max_age=1)
+	# The figures are rendered and saved by worker processes, the loop only sends the detections
+	logger = build_async_logger(cfg)
 	
 	with torch.no_grad():
 		for idx, batch_sample in enumerate(data_loader):
@@ -46,15 +49,17 @@ def test(model, data_loader, device, results_dir):
 				print("Measurement: ")
 				print("Detected boxes - {}".format(len(instance.pred_boxes)), instance.pred_boxes)
 				# print(instances)
-				utils.disk_logger(in_images, results_dir+"/normal", instances, rpn_proposals, img_paths)
+				logger.disk_logger(in_images, results_dir+"/normal", instances, rpn_proposals, img_paths)
 				
 				tracker.update(instance.pred_boxes, instance.pred_variance)
 				
-				updated_instances = [Instances((1242,375), pred_boxes=Boxes(torch.tensor([x.mean[:4] for x in tracker.tracks])), pred_variance=torch.tensor([x.get_diag_var()[:4] for x in tracker.tracks]))]
+				updated_instances = [Instances((1242,375), pred_boxes=Boxes(torch.from_numpy(tracker.track_boxes())), pred_variance=torch.from_numpy(tracker.track_variances()))]
 				_ = [x.toList() for x in updated_instances]
 				print("After Update: ", tracker.tracks)
 				print("Number of tracks - {}".format(len(tracker.tracks)))
-				utils.disk_logger(in_images, results_dir+"/tracked", updated_instances, rpn_proposals, img_paths)
+				logger.disk_logger(in_images, results_dir+"/tracked", updated_instances, rpn_proposals, img_paths)
+
+	logger.close()
 
 
 	# 		for instance, target in zip(instances, targets):
@@ -70,9 +75,11 @@ def test(model, data_loader, device, results_dir):
 
 
 
-def train(model, train_loader, val_loader, optimizer, epochs, tb_writer, lr_scheduler, device, model_save_dir, cfg):
+def train(model, train_loader, val_loader, optimizer, epochs, tb_log_dir, lr_scheduler, device, model_save_dir, cfg):
 	epoch = 1
 	is_training = True
+	# Tensorboard is written by a worker process, which owns the SummaryWriter of tb_log_dir
+	logger = build_async_logger(cfg, tb_log_dir=tb_log_dir)
 
 	while epoch <= epochs:
 
@@ -84,7 +91,9 @@ def train(model, train_loader, val_loader, optimizer, epochs, tb_writer, lr_sche
 			in_images = batch_sample['image'].to(device)
 			target = [x.to(device) for x in batch_sample['target']]
 
-			rpn_proposals, instances, proposal_losses, detector_losses = model(in_images, target, is_training)
+			# Detections are only computed on the iterations that get logged
+			log_detections = cfg.TRAIN.LOG_DETECTIONS and idx%10==0
+			rpn_proposals, instances, proposal_losses, detector_losses = model(in_images, target, is_training, log_detections)
 
 			loss_dict = {}
 			loss_dict.update(proposal_losses)
@@ -107,7 +116,7 @@ def train(model, train_loader, val_loader, optimizer, epochs, tb_writer, lr_sche
 					print("{:<8d} {:<9d} {:<7.4f}".format(epoch, idx, loss.item()))
 
 					for loss_name, value in loss_dict.items():
-						tb_writer.add_scalar('Loss/'+loss_name, value.item(), epoch+0.01*idx)
+						logger.add_scalar('Loss/'+loss_name, value.item(), epoch+0.01*idx)
 
 
 					for key, value in loss_dict.items():
@@ -115,8 +124,8 @@ def train(model, train_loader, val_loader, optimizer, epochs, tb_writer, lr_sche
 							running_loss[key] = 0.0
 						running_loss[key] = 0.9*running_loss[key] + 0.1*loss_dict[key].item()
 
-
-					# utils.tb_logger(in_images, tb_writer, rpn_proposals, instances, "Training")
+					if log_detections:
+						logger.add_detections_image('Training/detections', batch_sample['image_path'][0], instances[0], epoch+0.01*idx)
 				#------------------------------------------------#
 			# sys.exit()
 		val_loss = {}
@@ -128,7 +137,9 @@ def train(model, train_loader, val_loader, optimizer, epochs, tb_writer, lr_sche
 				in_images = batch_sample['image'].to(device)
 				target = [x.to(device) for x in batch_sample['target']]
 
-				rpn_proposals, instances, proposal_losses, detector_losses = model(in_images, target, is_training)
+				# Detections of the first batch only
+				log_detections = cfg.TRAIN.LOG_DETECTIONS and idx==0
+				rpn_proposals, instances, proposal_losses, detector_losses = model(in_images, target, is_training, log_detections)
 
 				loss_dict = {}
 				loss_dict.update(proposal_losses)
@@ -144,13 +155,14 @@ def train(model, train_loader, val_loader, optimizer, epochs, tb_writer, lr_sche
 						val_loss[key] = []
 					val_loss[key].append(loss_dict[key].item())
 
-				# utils.tb_logger(in_images, tb_writer, rpn_proposals, instances, "Validation")
+				if log_detections:
+					logger.add_detections_image('Validation/detections', batch_sample['image_path'][0], instances[0], epoch)
 
 			for key, value in  val_loss.items():
 				val_loss[key] = np.mean(val_loss[key])
 
 			for key in val_loss.keys():
-				tb_writer.add_scalars('loss/'+key, {'validation': val_loss[key], 'train': running_loss[key]}, epoch)
+				logger.add_scalars('loss/'+key, {'validation': val_loss[key], 'train': running_loss[key]}, epoch)
 
 
 			print("Epoch ---- {} ".format(epoch))
@@ -173,4 +185,4 @@ def train(model, train_loader, val_loader, optimizer, epochs, tb_writer, lr_sche
 
 		epoch += 1
 
-	tb_writer.close()
+	logger.close()
@@ -38,6 +38,44 @@ def iou(bbox, candidates):
     area_candidates = candidates[:, 2:].prod(axis=1)
     return area_intersection / (area_bbox + area_candidates - area_intersection)
 
+def iou_matrix(boxes, candidates):
+    """Computer intersection over union between all pairs of boxes.
+
+    Parameters
+    ----------
+    boxes : ndarray
+        A Nx4 matrix of bounding boxes in format `(x1, y1, x2, y2)`.
+    candidates : ndarray
+        A Mx4 matrix of bounding boxes in the same format.
+
+    Returns
+    -------
+    ndarray
+        The NxM intersection over union in [0, 1], where entry (i, j) is the
+        IoU between `boxes[i]` and `candidates[j]`.
+
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    candidates = np.asarray(candidates, dtype=np.float64).reshape(-1, 4)
+    tl = np.maximum(boxes[:, None, :2], candidates[None, :, :2])
+    br = np.minimum(boxes[:, None, 2:], candidates[None, :, 2:])
+    area_intersection = np.maximum(0., br - tl).prod(axis=2)
+
+    area_boxes = (boxes[:, 2:] - boxes[:, :2]).prod(axis=1)
+    area_candidates = (candidates[:, 2:] - candidates[:, :2]).prod(axis=1)
+    return area_intersection / (area_boxes[:, None] + area_candidates[None, :] - area_intersection)
+
+def paired_iou(boxes, candidates):
+    """Intersection over union of aligned pairs, `boxes[i]` with `candidates[i]`,
+    both Kx4 in format `(x1, y1, x2, y2)`. Returns an array of length K.
+    """
+    tl = np.maximum(boxes[:, :2], candidates[:, :2])
+    br = np.minimum(boxes[:, 2:], candidates[:, 2:])
+    area_intersection = np.maximum(0., br - tl).prod(axis=1)
+    area_boxes = (boxes[:, 2:] - boxes[:, :2]).prod(axis=1)
+    area_candidates = (candidates[:, 2:] - candidates[:, :2]).prod(axis=1)
+    return area_intersection / (area_boxes + area_candidates - area_intersection)
+
 def to_xywh(a):
     if a.ndim==2:
         a[:, 2] = a[:, 2] - a[:, 0] 
@@ -56,8 +94,9 @@ def iou_cost(tracks, detections, track_indices=None,
     ----------
     tracks : List[deep_sort.track.Track]
         A list of tracks.
-    detections : List[deep_sort.detection.Detection]
-        A list of detections.
+    detections : ndarray
+        A Nx4 matrix of detections in format `(x1, y1, x2, y2)`. It is not
+        modified.
     track_indices : Optional[List[int]]
         A list of indices to tracks that should be matched. Defaults to
         all `tracks`.
@@ -78,13 +117,10 @@ def iou_cost(tracks, detections, track_indices=None,
     if detection_indices is None:
         detection_indices = np.arange(len(detections))
 
-    cost_matrix = np.zeros((len(track_indices), len(detection_indices)))
-    for row, track_idx in enumerate(track_indices):
-        if tracks[track_idx].time_since_update > 1:
-            cost_matrix[row, :] = linear_assignment.INFTY_COST
-            continue
+    track_boxes = np.asarray([tracks[i].to_xyxy() for i in track_indices]).reshape(-1, 4)
+    candidates = np.asarray(detections)[np.asarray(detection_indices, dtype=np.int64)]
+    cost_matrix = 1. - iou_matrix(track_boxes, candidates)
 
-        bbox = tracks[track_idx].to_tlwh()
-        candidates = np.asarray([to_xywh(detections[i]) for i in detection_indices])
-        cost_matrix[row, :] = 1. - iou(bbox, candidates)
+    time_since_update = np.asarray([tracks[i].time_since_update for i in track_indices])
+    cost_matrix[time_since_update > 1, :] = linear_assignment.INFTY_COST
     return cost_matrix
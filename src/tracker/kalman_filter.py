@@ -28,6 +28,10 @@ class KalmanFilter(object):
     Object motion follows a constant velocity model. The bounding box location
     (x, y, a, h) is taken as direct observation of the state space (linear
     observation model).
+
+    Time is counted in frames: the velocities are per frame and `predict`
+    takes the time step `dt` in frame periods (1 at the nominal frame rate).
+    The process noise variances are those of one frame, scaled by `dt`.
     """
 
     def __init__(self):
@@ -45,6 +49,13 @@ class KalmanFilter(object):
         self._std_weight_position = 1. / 20
         self._std_weight_velocity = 1. / 160
 
+    def _motion_matrix(self, dt):
+        if dt == 1.:
+            return self._motion_mat
+        motion_mat = np.eye(8)
+        motion_mat[np.arange(4), np.arange(4, 8)] = dt
+        return motion_mat
+
     def initiate(self, measurement, measurement_var):
         """Create track from unassociated measurement.
         Parameters
@@ -87,7 +98,7 @@ class KalmanFilter(object):
         
         return mean, covariance
 
-    def predict(self, mean, covariance):
+    def predict(self, mean, covariance, dt=1.):
         """Run Kalman filter prediction step.
         Parameters
         ----------
@@ -97,6 +108,8 @@ class KalmanFilter(object):
         covariance : ndarray
             The 8x8 dimensional covariance matrix of the object state at the
             previous time step.
+        dt : float
+            Time since the previous time step, in frame periods.
         Returns
         -------
         (ndarray, ndarray)
@@ -115,13 +128,14 @@ class KalmanFilter(object):
             self._std_weight_velocity * mean[3],
             self._std_weight_velocity * mean[3]]
 
-        motion_cov = np.diag(np.square(np.r_[std_pos, std_vel]))
+        motion_cov = dt * np.diag(np.square(np.r_[std_pos, std_vel]))
         # motion_cov = 0
 
-        mean = np.dot(self._motion_mat, mean)
+        motion_mat = self._motion_matrix(dt)
+        mean = np.dot(motion_mat, mean)
  
         covariance = np.linalg.multi_dot((
-            self._motion_mat, covariance, self._motion_mat.T)) + motion_cov
+            motion_mat, covariance, motion_mat.T)) + motion_cov
 
         return mean, covariance
 
@@ -144,6 +158,10 @@ class KalmanFilter(object):
         covariance = np.linalg.multi_dot((
             self._update_mat, covariance, self._update_mat.T))
 
+        measurement_noise = np.asarray(measurement_noise)
+        if measurement_noise.ndim == 1:
+            # Variance of every coordinate, independent noise
+            measurement_noise = np.diag(measurement_noise)
         return mean, covariance + measurement_noise
 
     def update(self, mean, covariance, measurement, measurement_noise):
@@ -183,6 +201,91 @@ class KalmanFilter(object):
         
         return new_mean, new_covariance
 
+    def initiate_batch(self, measurements, measurements_var):
+        """Create N tracks at once, batched version of `initiate`.
+        Parameters
+        ----------
+        measurements : ndarray
+            The Nx4 dimensional bounding boxes (x1, y1, x2, y2).
+        measurements_var : ndarray
+            The Nx4 dimensional variance of the bounding boxes.
+        Returns
+        -------
+        (ndarray, ndarray)
+            Returns the Nx8 mean vectors and Nx8x8 covariance matrices of the
+            new tracks.
+        """
+        measurements = np.asarray(measurements, dtype=np.float64).reshape(-1, 4)
+        n = len(measurements)
+        mean = np.concatenate([measurements, np.zeros_like(measurements)], axis=1)
+
+        vel_var = np.square(10 * self._std_weight_velocity * measurements[:, 3])
+        var = np.concatenate([np.asarray(measurements_var).reshape(-1, 4),
+                              np.repeat(vel_var[:, None], 4, axis=1)], axis=1)
+        covariance = np.zeros((n, 8, 8))
+        covariance[:, np.arange(8), np.arange(8)] = var
+        return mean, covariance
+
+    def predict_batch(self, mean, covariance, dt=1.):
+        """Run Kalman filter prediction step for N tracks, batched version of
+        `predict`.
+        Parameters
+        ----------
+        mean : ndarray
+            The Nx8 dimensional mean vectors.
+        covariance : ndarray
+            The Nx8x8 dimensional covariance matrices.
+        dt : float
+            Time since the previous time step, in frame periods, shared by
+            all the tracks.
+        Returns
+        -------
+        (ndarray, ndarray)
+            Returns the mean vectors and covariance matrices of the predicted
+            states.
+        """
+        weights = np.r_[[self._std_weight_position] * 4, [self._std_weight_velocity] * 4]
+        motion_var = dt * np.square(weights[None, :] * mean[:, 3:4])
+
+        motion_mat = self._motion_matrix(dt)
+        mean = np.dot(mean, motion_mat.T)
+        covariance = np.matmul(np.matmul(motion_mat, covariance), motion_mat.T)
+        covariance[:, np.arange(8), np.arange(8)] += motion_var
+        return mean, covariance
+
+    def update_batch(self, mean, covariance, measurement, measurement_noise):
+        """Run Kalman filter correction step for N tracks, batched version of
+        `update`.
+        Parameters
+        ----------
+        mean : ndarray
+            The Nx8 dimensional predicted mean vectors.
+        covariance : ndarray
+            The Nx8x8 dimensional predicted covariance matrices.
+        measurement : ndarray
+            The Nx4 dimensional associated measurements.
+        measurement_noise : ndarray
+            The Nx4 dimensional variance of the measurements, or their Nx4x4
+            covariance.
+        Returns
+        -------
+        (ndarray, ndarray)
+            Returns the measurement-corrected state distributions.
+        """
+        projected_mean = mean[:, :4]
+        projected_cov = covariance[:, :4, :4].copy()
+        if np.ndim(measurement_noise) == 3:
+            projected_cov += measurement_noise
+        else:
+            projected_cov[:, np.arange(4), np.arange(4)] += measurement_noise
+
+        # The covariances are symmetric, so K^T = S^-1 H P
+        kalman_gain_t = np.linalg.solve(projected_cov, covariance[:, :4, :])
+        innovation = measurement - projected_mean
+        new_mean = mean + np.einsum('nij,ni->nj', kalman_gain_t, innovation)
+        new_covariance = covariance - np.matmul(kalman_gain_t.transpose(0, 2, 1), covariance[:, :4, :])
+        return new_mean, new_covariance
+
     def gating_distance(self, mean, covariance, measurements,
                         only_position=False):
         """Compute gating distance between state distribution and measurements.
@@ -221,3 +324,136 @@ class KalmanFilter(object):
             overwrite_b=True)
         squared_maha = np.sum(z * z, axis=0)
         return squared_maha
+
+    def gating_distance_batch(self, mean, covariance, measurements, measurements_var=None,
+                              only_position=False):
+        """Compute the gating distance between N state distributions and M
+        measurements at once, batched version of `gating_distance` that also
+        accounts for the uncertainty of every measurement.
+        Parameters
+        ----------
+        mean : ndarray
+            The Nx8 mean vectors of the tracks.
+        covariance : ndarray
+            The Nx8x8 covariance matrices of the tracks.
+        measurements : ndarray
+            The Mx4 measurements (x1, y1, x2, y2).
+        measurements_var : Optional[ndarray]
+            The Mx4 variance of the measurements, e.g. the `pred_variance` of
+            the detector. Ignored if None.
+        only_position : Optional[bool]
+            If True, only the first two coordinates are used.
+        Returns
+        -------
+        ndarray
+            Returns the NxM matrix of squared Mahalanobis distances, entry (i, j)
+            between track i and measurement j, with covariance
+            `H P_i H^T + R_j`. Computed with batched Cholesky factors.
+        """
+        ndim = 2 if only_position else 4
+        mean, covariance = np.asarray(mean).reshape(-1, 8), np.asarray(covariance).reshape(-1, 8, 8)
+        measurements = np.asarray(measurements).reshape(-1, 4)
+        d = measurements[None, :, :ndim] - mean[:, None, :ndim]
+
+        innovation_cov = np.repeat(covariance[:, None, :ndim, :ndim], len(measurements), axis=1)
+        if measurements_var is not None:
+            measurements_var = np.asarray(measurements_var).reshape(-1, 4)
+            innovation_cov[..., np.arange(ndim), np.arange(ndim)] += measurements_var[None, :, :ndim]
+
+        cholesky_factor = np.linalg.cholesky(innovation_cov)
+        z = np.linalg.solve(cholesky_factor, d[..., None])[..., 0]
+        return np.sum(z * z, axis=-1)
+
+
+class DecoupledKalmanFilter(KalmanFilter):
+    """
+    The same filter as `KalmanFilter`, computed with its block structure.
+
+    The four coordinates x1, y1, x2, y2 follow independent constant velocity
+    models, and the initial, process and (diagonal) measurement noises do not
+    couple them. The 8x8 covariance therefore only has nonzero entries in the
+    2x2 position/velocity block of every coordinate, and every step reduces to
+    four scalar 2x2 filters in closed form, without matrix products or
+    inversions. The mean and covariance keep the 8 and 8x8 layout of
+    `KalmanFilter`, and all methods accept single tracks (8, 8x8) as well as
+    batches (Nx8, Nx8x8).
+
+    A full (non-diagonal) measurement noise covariance would couple the
+    coordinates, `update` falls back to `KalmanFilter` in that case.
+    """
+
+    _pos = np.arange(4)
+    _vel = np.arange(4, 8)
+
+    def _blocks(self, covariance):
+        return (covariance[..., self._pos, self._pos], covariance[..., self._pos, self._vel],
+                covariance[..., self._vel, self._vel])
+
+    def _assemble(self, var_pos, cov_pos_vel, var_vel):
+        covariance = np.zeros(var_pos.shape[:-1] + (8, 8))
+        covariance[..., self._pos, self._pos] = var_pos
+        covariance[..., self._pos, self._vel] = cov_pos_vel
+        covariance[..., self._vel, self._pos] = cov_pos_vel
+        covariance[..., self._vel, self._vel] = var_vel
+        return covariance
+
+    def predict(self, mean, covariance, dt=1.):
+        """Run Kalman filter prediction step, see `KalmanFilter.predict`."""
+        height = mean[..., 3:4]
+        var_pos, cov_pos_vel, var_vel = self._blocks(covariance)
+
+        new_mean = mean.copy()
+        new_mean[..., :4] += dt * mean[..., 4:]
+        return new_mean, self._assemble(
+            var_pos + 2 * dt * cov_pos_vel + dt * dt * var_vel + dt * np.square(self._std_weight_position * height),
+            cov_pos_vel + dt * var_vel,
+            var_vel + dt * np.square(self._std_weight_velocity * height))
+
+    def update(self, mean, covariance, measurement, measurement_noise):
+        """Run Kalman filter correction step, see `KalmanFilter.update`.
+        `measurement_noise` is the variance of the 4 coordinates (4 or Nx4).
+        """
+        measurement_noise = np.asarray(measurement_noise)
+        if measurement_noise.ndim == mean.ndim + 1:
+            # Full noise covariance, the coordinates are not independent
+            if mean.ndim == 1:
+                return KalmanFilter.update(self, mean, covariance, measurement, measurement_noise)
+            return KalmanFilter.update_batch(self, mean, covariance, measurement, measurement_noise)
+
+        var_pos, cov_pos_vel, var_vel = self._blocks(covariance)
+        innovation_var = var_pos + measurement_noise
+        gain_pos = var_pos / innovation_var
+        gain_vel = cov_pos_vel / innovation_var
+        innovation = measurement - mean[..., :4]
+
+        new_mean = mean.copy()
+        new_mean[..., :4] += gain_pos * innovation
+        new_mean[..., 4:] += gain_vel * innovation
+        return new_mean, self._assemble(
+            var_pos - gain_pos * var_pos,
+            cov_pos_vel - gain_pos * cov_pos_vel,
+            var_vel - gain_vel * cov_pos_vel)
+
+    def gating_distance_batch(self, mean, covariance, measurements, measurements_var=None,
+                              only_position=False):
+        """See `KalmanFilter.gating_distance_batch`. The projected covariances
+        are diagonal, so the distance is a sum of normalized squares."""
+        ndim = 2 if only_position else 4
+        mean, covariance = np.asarray(mean).reshape(-1, 8), np.asarray(covariance).reshape(-1, 8, 8)
+        measurements = np.asarray(measurements).reshape(-1, 4)
+        d = measurements[None, :, :ndim] - mean[:, None, :ndim]
+
+        innovation_var = np.repeat(self._blocks(covariance)[0][:, None, :ndim], len(measurements), axis=1)
+        if measurements_var is not None:
+            innovation_var = innovation_var + np.asarray(measurements_var).reshape(-1, 4)[None, :, :ndim]
+        return np.sum(d * d / innovation_var, axis=-1)
+
+    predict_batch = predict
+    update_batch = update
+
+
+# Filters selectable with MultiObjTracker(kalman_filter=...)
+KALMAN_FILTERS = {
+    "full": KalmanFilter,
+    "decoupled": DecoupledKalmanFilter,
+}
@@ -0,0 +1,101 @@
+# vim: expandtab:ts=4:sw=4
+"""
+Keyframe scheduling: run the detector only on some frames and extrapolate the
+tracks with `MultiObjTracker.predict` in between.
+"""
+
+from __future__ import absolute_import
+import numpy as np
+
+
+class KeyframeScheduler:
+    """
+    Decides, from the predicted tracks, whether the detector has to run on the
+    current frame. A frame is a keyframe if any of:
+
+    * no frame was detected yet, or `max_interval` frames passed since the last
+      keyframe, or `max_staleness` seconds (bounded staleness of the tracks);
+    * a track became too uncertain: the standard deviation of one of its
+      coordinates is more than `std_ratio` times the height of its box;
+    * a track is within `border_margin` pixels of the left or right image
+      border, where objects enter and leave the field of view. The bottom
+      border is not used, close objects are cut by it all the time.
+
+    Parameters
+    ----------
+    max_interval : int
+        Maximum number of frames between two keyframes, 1 detects every frame.
+    max_staleness : float
+        Maximum time between two keyframes in seconds.
+    std_ratio : float
+        Threshold of the standard deviation of the box coordinates, relative
+        to the box height.
+    border_margin : float
+        Distance to the image border in pixels, negative to disable.
+    image_width : int
+        Width of the images.
+
+    """
+
+    def __init__(self, max_interval=3, max_staleness=0.5, std_ratio=0.2, border_margin=20.,
+                 image_width=1242):
+        self.max_interval = max_interval
+        self.max_staleness = max_staleness
+        self.std_ratio = std_ratio
+        self.border_margin = border_margin
+        self.image_width = image_width
+
+        self.last_keyframe = None
+        self.frames_since_keyframe = 0
+
+    def should_detect(self, stamp, boxes, variances):
+        """Whether to run the detector on the frame at `stamp`.
+        Parameters
+        ----------
+        stamp : float
+            Time of the frame in seconds.
+        boxes : ndarray
+            The Nx4 predicted boxes (x1, y1, x2, y2) of the tracks at `stamp`.
+        variances : ndarray
+            The Nx4 variance of `boxes`.
+        Returns
+        -------
+        bool
+            True if the frame is a keyframe. Call `keyframe` once it is detected.
+
+        """
+        self.frames_since_keyframe += 1
+        if self.last_keyframe is None or self.frames_since_keyframe >= self.max_interval:
+            return True
+        if stamp - self.last_keyframe >= self.max_staleness:
+            return True
+
+        boxes = np.asarray(boxes).reshape(-1, 4)
+        if len(boxes) == 0:
+            return False
+        heights = np.maximum(boxes[:, 3] - boxes[:, 1], 1.)
+        std = np.sqrt(np.asarray(variances).reshape(-1, 4)).max(axis=1)
+        if np.any(std > self.std_ratio * heights):
+            return True
+
+        if self.border_margin >= 0:
+            near_border = (boxes[:, 0] < self.border_margin) | \
+                (boxes[:, 2] > self.image_width - self.border_margin)
+            if np.any(near_border):
+                return True
+        return False
+
+    def keyframe(self, stamp):
+        """Record that the frame at `stamp` was detected."""
+        self.last_keyframe = stamp
+        self.frames_since_keyframe = 0
+
+
+def build_keyframe_scheduler(cfg, image_width=1242):
+    """Returns the `KeyframeScheduler` of cfg.TRACKING.KEYFRAME, or None if
+    keyframe detection is disabled (the detector runs on every frame)."""
+    keyframe = cfg.TRACKING.KEYFRAME
+    if not keyframe.ENABLED:
+        return None
+    return KeyframeScheduler(keyframe.MAX_INTERVAL, keyframe.MAX_STALENESS, keyframe.STD_RATIO,
+                             keyframe.BORDER_MARGIN, image_width)
@@ -1,16 +1,65 @@
 # vim: expandtab:ts=4:sw=4
 from __future__ import absolute_import
 import numpy as np
-from sklearn.utils.linear_assignment_ import linear_assignment
+from scipy.optimize import linear_sum_assignment
 from . import kalman_filter
+from . import sparse_assignment
 
 
 INFTY_COST = 1e+5
 
 
+def linear_assignment(cost_matrix):
+    """Solve the linear assignment problem with
+    `scipy.optimize.linear_sum_assignment`, in place of the removed
+    `sklearn.utils.linear_assignment_.linear_assignment`.
+
+    Parameters
+    ----------
+    cost_matrix : ndarray
+        The NxM dimensional cost matrix.
+
+    Returns
+    -------
+    ndarray
+        A Kx2 array of the matched (row, col) pairs, K = min(N, M).
+
+    """
+    rows, cols = linear_sum_assignment(cost_matrix)
+    return np.stack([rows, cols], axis=1)
+
+
+def split_matches(indices, num_rows, num_cols, keep=None):
+    """Split the output of `linear_assignment` in matches and unmatched
+    rows and columns with array set operations.
+
+    Parameters
+    ----------
+    indices : ndarray
+        The Kx2 matched (row, col) pairs.
+    num_rows, num_cols : int
+        The shape of the cost matrix.
+    keep : Optional[ndarray]
+        A boolean array of length K, pairs where it is False are rejected and
+        their row and column are unmatched.
+
+    Returns
+    -------
+    (ndarray, ndarray, ndarray)
+        The matched pairs, the unmatched rows and the unmatched columns, in
+        increasing order.
+
+    """
+    if keep is not None:
+        indices = indices[keep]
+    unmatched_rows = np.setdiff1d(np.arange(num_rows), indices[:, 0], assume_unique=True)
+    unmatched_cols = np.setdiff1d(np.arange(num_cols), indices[:, 1], assume_unique=True)
+    return indices, unmatched_rows, unmatched_cols
+
+
 def min_cost_matching(
         distance_metric, max_distance, tracks, detections, track_indices=None,
-        detection_indices=None):
+        detection_indices=None, sparse=False, max_workers=0):
     """Solve linear assignment problem.
 
     Parameters
@@ -34,6 +83,13 @@ def min_cost_matching(
     detection_indices : List[int]
         List of detection indices that maps columns in `cost_matrix` to
         detections in `detections` (see description above).
+    sparse : Optional[bool]
+        If True, only the pairs within `max_distance` are considered and the
+        assignment is solved per connected component, see
+        `sparse_assignment.connected_assignment`. Same result, faster when most
+        pairs are infeasible.
+    max_workers : Optional[int]
+        Threads used to solve the components when `sparse`.
 
     Returns
     -------
@@ -54,30 +110,29 @@ def min_cost_matching(
 
     cost_matrix = distance_metric(
         tracks, detections, track_indices, detection_indices)
-    cost_matrix[cost_matrix > max_distance] = max_distance + 1e-5
-    indices = linear_assignment(cost_matrix)
-
-    matches, unmatched_tracks, unmatched_detections = [], [], []
-    for col, detection_idx in enumerate(detection_indices):
-        if col not in indices[:, 1]:
-            unmatched_detections.append(detection_idx)
-    for row, track_idx in enumerate(track_indices):
-        if row not in indices[:, 0]:
-            unmatched_tracks.append(track_idx)
-    for row, col in indices:
-        track_idx = track_indices[row]
-        detection_idx = detection_indices[col]
-        if cost_matrix[row, col] > max_distance:
-            unmatched_tracks.append(track_idx)
-            unmatched_detections.append(detection_idx)
-        else:
-            matches.append((track_idx, detection_idx))
-    return matches, unmatched_tracks, unmatched_detections
+    if sparse:
+        rows, cols = np.nonzero(cost_matrix <= max_distance)
+        indices = sparse_assignment.connected_assignment(
+            rows, cols, cost_matrix[rows, cols], len(track_indices), len(detection_indices),
+            max_distance + 1e-5, max_workers)
+        indices, unmatched_rows, unmatched_cols = split_matches(
+            indices, len(track_indices), len(detection_indices))
+    else:
+        cost_matrix[cost_matrix > max_distance] = max_distance + 1e-5
+        indices = linear_assignment(cost_matrix)
+        indices, unmatched_rows, unmatched_cols = split_matches(
+            indices, len(track_indices), len(detection_indices),
+            keep=cost_matrix[indices[:, 0], indices[:, 1]] <= max_distance)
+
+    track_indices = np.asarray(track_indices)
+    detection_indices = np.asarray(detection_indices)
+    matches = list(zip(track_indices[indices[:, 0]].tolist(), detection_indices[indices[:, 1]].tolist()))
+    return matches, track_indices[unmatched_rows].tolist(), detection_indices[unmatched_cols].tolist()
 
 
 def matching_cascade(
         distance_metric, max_distance, cascade_depth, tracks, detections,
-        track_indices=None, detection_indices=None):
+        track_indices=None, detection_indices=None, sparse=False, max_workers=0):
     """Run matching cascade.
 
     Parameters
@@ -104,6 +159,8 @@ def matching_cascade(
         List of detection indices that maps columns in `cost_matrix` to
         detections in `detections` (see description above). Defaults to all
         detections.
+    sparse, max_workers : Optional
+        See `min_cost_matching`.
 
     Returns
     -------
@@ -135,7 +192,7 @@ def matching_cascade(
         matches_l, _, unmatched_detections = \
             min_cost_matching(
                 distance_metric, max_distance, tracks, detections,
-                track_indices_l, unmatched_detections)
+                track_indices_l, unmatched_detections, sparse, max_workers)
         matches += matches_l
     unmatched_tracks = list(set(track_indices) - set(k for k, _ in matches))
     return matches, unmatched_tracks, unmatched_detections
@@ -143,7 +200,7 @@ def matching_cascade(
 
 def gate_cost_matrix(
         kf, cost_matrix, tracks, detections, track_indices, detection_indices,
-        gated_cost=INFTY_COST, only_position=False):
+        gated_cost=INFTY_COST, only_position=False, measurement_var=None):
     """Invalidate infeasible entries in cost matrix based on the state
     distributions obtained by Kalman filtering.
 
@@ -157,8 +214,8 @@ def gate_cost_matrix(
         `detections[detection_indices[j]]`.
     tracks : List[track.Track]
         A list of predicted tracks at the current time step.
-    detections : List[detection.Detection]
-        A list of detections at the current time step.
+    detections : ndarray
+        The detections (x1, y1, x2, y2) at the current time step.
     track_indices : List[int]
         List of track indices that maps rows in `cost_matrix` to tracks in
         `tracks` (see description above).
@@ -171,6 +228,8 @@ def gate_cost_matrix(
     only_position : Optional[bool]
         If True, only the x, y position of the state distribution is considered
         during gating. Defaults to False.
+    measurement_var : Optional[ndarray]
+        The variance of the detections, added to the covariance of the tracks.
 
     Returns
     -------
@@ -180,11 +239,14 @@ def gate_cost_matrix(
     """
     gating_dim = 2 if only_position else 4
     gating_threshold = kalman_filter.chi2inv95[gating_dim]
-    measurements = np.asarray(
-        [detections[i].to_xyah() for i in detection_indices])
-    for row, track_idx in enumerate(track_indices):
-        track = tracks[track_idx]
-        gating_distance = kf.gating_distance(
-            track.mean, track.covariance, measurements, only_position)
-        cost_matrix[row, gating_distance > gating_threshold] = gated_cost
+    detection_indices = np.asarray(detection_indices, dtype=np.int64)
+    measurements = np.asarray(detections)[detection_indices]
+    if measurement_var is not None:
+        measurement_var = np.asarray(measurement_var)[detection_indices]
+
+    gating_distance = kf.gating_distance_batch(
+        np.asarray([tracks[i].mean for i in track_indices]),
+        np.asarray([tracks[i].covariance for i in track_indices]),
+        measurements, measurement_var, only_position)
+    cost_matrix[gating_distance > gating_threshold] = gated_cost
     return cost_matrix
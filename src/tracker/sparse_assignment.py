@@ -0,0 +1,157 @@
+# vim: expandtab:ts=4:sw=4
+"""
+Association by connected components.
+
+In a crowded scene most track/detection pairs do not overlap, and a single
+global assignment over all of them is cubic in the number of objects. The
+admissible pairs form a sparse bipartite graph; an optimal assignment never
+needs a pair outside of it, so every connected component of the graph can be
+solved on its own and the union of the solutions is a global optimum (with
+the same total cost as `linear_assignment.linear_assignment` on the full
+matrix, the matches themselves can only differ between equal cost solutions).
+"""
+
+from __future__ import absolute_import
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import scipy.sparse
+from scipy.sparse.csgraph import connected_components
+from scipy.optimize import linear_sum_assignment
+
+
+def _box_cells(boxes, cell_size, origin):
+    """Returns the (box index, cell x, cell y) of every grid cell overlapped by
+    every box."""
+    lo = np.floor((boxes[:, :2] - origin) / cell_size).astype(np.int64)
+    hi = np.floor((boxes[:, 2:] - origin) / cell_size).astype(np.int64)
+    size = np.maximum(hi - lo + 1, 1)
+    counts = size[:, 0] * size[:, 1]
+
+    box_idx = np.repeat(np.arange(len(boxes)), counts)
+    rank = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    cell_x = lo[box_idx, 0] + rank % size[box_idx, 0]
+    cell_y = lo[box_idx, 1] + rank // size[box_idx, 0]
+    return box_idx, cell_x, cell_y
+
+
+def grid_candidate_pairs(boxes, candidates, cell_size=None):
+    """Find the pairs of overlapping boxes with a uniform grid index instead of
+    comparing all pairs.
+
+    Parameters
+    ----------
+    boxes : ndarray
+        A Nx4 matrix of boxes (x1, y1, x2, y2), e.g. the predicted tracks.
+    candidates : ndarray
+        A Mx4 matrix of boxes in the same format, e.g. the detections.
+    cell_size : Optional[float]
+        Side of the grid cells. Defaults to the median side of the boxes.
+
+    Returns
+    -------
+    (ndarray, ndarray)
+        The indices in `boxes` and in `candidates` of the pairs whose boxes
+        share a grid cell, each pair once. It contains all overlapping pairs.
+
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    candidates = np.asarray(candidates, dtype=np.float64).reshape(-1, 4)
+    empty = np.empty(0, dtype=np.int64)
+    if len(boxes) == 0 or len(candidates) == 0:
+        return empty, empty
+
+    if cell_size is None:
+        sides = np.concatenate([boxes[:, 2:] - boxes[:, :2], candidates[:, 2:] - candidates[:, :2]])
+        cell_size = max(float(np.median(sides)), 1.0)
+    origin = np.minimum(boxes[:, :2].min(axis=0), candidates[:, :2].min(axis=0))
+
+    box_idx, box_x, box_y = _box_cells(boxes, cell_size, origin)
+    cand_idx, cand_x, cand_y = _box_cells(candidates, cell_size, origin)
+
+    # A single integer key per cell, shared by both sets
+    width = max(box_x.max(), cand_x.max()) + 1
+    box_key = box_y * width + box_x
+    cand_key = cand_y * width + cand_x
+
+    order = np.argsort(box_key, kind="stable")
+    box_idx, box_key = box_idx[order], box_key[order]
+    start = np.searchsorted(box_key, cand_key, side="left")
+    count = np.searchsorted(box_key, cand_key, side="right") - start
+
+    # Expand every candidate entry to the boxes in its cell
+    rows = box_idx[np.repeat(start, count) + np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)]
+    cols = np.repeat(cand_idx, count)
+
+    pairs = np.unique(rows * len(candidates) + cols)
+    return pairs // len(candidates), pairs % len(candidates)
+
+
+def _solve_component(rows, cols, costs, pad_cost):
+    """Dense assignment of one component, with `pad_cost` outside of its edges."""
+    row_ids, local_rows = np.unique(rows, return_inverse=True)
+    col_ids, local_cols = np.unique(cols, return_inverse=True)
+    cost_matrix = np.full((len(row_ids), len(col_ids)), pad_cost)
+    cost_matrix[local_rows, local_cols] = costs
+    edge = np.zeros(cost_matrix.shape, dtype=bool)
+    edge[local_rows, local_cols] = True
+
+    r, c = linear_sum_assignment(cost_matrix)
+    keep = edge[r, c]
+    return np.stack([row_ids[r[keep]], col_ids[c[keep]]], axis=1)
+
+
+def connected_assignment(rows, cols, costs, num_rows, num_cols, pad_cost, max_workers=0):
+    """Solve the linear assignment problem on a sparse set of admissible pairs,
+    one connected component at a time.
+
+    Parameters
+    ----------
+    rows, cols : ndarray
+        The row and column of the K admissible pairs, each pair at most once.
+    costs : ndarray
+        The K costs of the pairs, lower than `pad_cost`.
+    num_rows, num_cols : int
+        The shape of the full cost matrix.
+    pad_cost : float
+        The cost of all the other pairs in the full cost matrix.
+    max_workers : int
+        Solve the components of more than two nodes in a thread pool of this
+        size, 0 to solve them sequentially.
+
+    Returns
+    -------
+    ndarray
+        The matched (row, col) pairs, only admissible ones, sorted by row.
+        Rows and columns outside of it are unmatched.
+
+    """
+    rows, cols = np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)
+    costs = np.asarray(costs, dtype=np.float64)
+    if len(rows) == 0:
+        return np.empty((0, 2), dtype=np.int64)
+
+    # Rows are nodes 0..num_rows-1, columns num_rows..num_rows+num_cols-1
+    graph = scipy.sparse.coo_matrix(
+        (np.ones(len(rows)), (rows, num_rows + cols)), shape=(num_rows + num_cols,) * 2)
+    _, labels = connected_components(graph, directed=False)
+    component = labels[rows]
+
+    # A component with a single edge is a single row and column: a match
+    edges_per_component = np.bincount(component)
+    single = edges_per_component[component] == 1
+    matches = [np.stack([rows[single], cols[single]], axis=1)]
+
+    order = np.argsort(component[~single], kind="stable")
+    multi_rows, multi_cols, multi_costs = rows[~single][order], cols[~single][order], costs[~single][order]
+    bounds = np.flatnonzero(np.diff(component[~single][order])) + 1
+    groups = list(zip(np.split(multi_rows, bounds), np.split(multi_cols, bounds), np.split(multi_costs, bounds)))
+    groups = [g for g in groups if len(g[0])]
+
+    if max_workers > 0 and len(groups) > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            matches += list(executor.map(lambda g: _solve_component(g[0], g[1], g[2], pad_cost), groups))
+    else:
+        matches += [_solve_component(r, c, k, pad_cost) for r, c, k in groups]
+
+    matches = np.concatenate(matches).astype(np.int64)
+    return matches[np.argsort(matches[:, 0], kind="stable")]
@@ -1,23 +1,10 @@
 from __future__ import absolute_import
 import numpy as np
-from .kalman_filter import KalmanFilter
+from .kalman_filter import KALMAN_FILTERS, chi2inv95
+from .track_bank import TrackBank, TrackState
 from . import linear_assignment
 from . import iou_matching
-from sklearn.utils.linear_assignment_ import linear_assignment as assignment
-
-class TrackState:
-    """
-    Enumeration type for the single target track state. Newly created tracks are
-    classified as `tentative` until enough evidence has been collected. Then,
-    the track state is changed to `confirmed`. Tracks that are no longer alive
-    are classified as `deleted` to mark them for removal from the set of active
-    tracks.
-    """
-
-    Tentative = 1
-    Confirmed = 2
-    Deleted = 3
-
+from . import sparse_assignment
 
 class Track:
     """
@@ -55,7 +42,8 @@ class Track:
     age : int
         Total number of frames since first occurance.
     time_since_update : int
-        Total number of frames since last measurement update.
+        Number of detection steps (`update` or `mark_missed` calls) since the
+        last measurement update, as counted by `MultiObjTracker`.
     state : TrackState
         The current track state.
     features : List[ndarray]
@@ -96,17 +84,18 @@ class Track:
     def get_diag_var(self):
         return self.covariance.diagonal()
 
-    def predict(self, kf):
+    def predict(self, kf, dt=1.):
         """Propagate the state distribution to the current time step using a
         Kalman filter prediction step.
         Parameters
         ----------
         kf : kalman_filter.KalmanFilter
             The Kalman filter.
+        dt : float
+            Time since the previous time step, in frame periods.
         """
-        self.mean, self.covariance = kf.predict(self.mean, self.covariance)
+        self.mean, self.covariance = kf.predict(self.mean, self.covariance, dt)
         self.age += 1
-        self.time_since_update += 1
 
     def update(self, kf, detection, detection_noise):
         """Perform Kalman filter measurement update step and update the feature
@@ -129,6 +118,7 @@ class Track:
     def mark_missed(self):
         """Mark this track as missed (no association at the current time step).
         """
+        self.time_since_update += 1
         if self.state == TrackState.Tentative:
             self.state = TrackState.Deleted
         elif self.time_since_update > self._max_age:
@@ -154,6 +144,43 @@ class Track:
         return str(self.mean)
 
 
+def _bank_field(field):
+    def getter(self):
+        return getattr(self._bank, field)[self._slot]
+
+    def setter(self, value):
+        getattr(self._bank, field)[self._slot] = value
+
+    return property(getter, setter)
+
+
+class TrackView(Track):
+    """
+    A `Track` whose attributes are read from and written to a slot of a
+    `TrackBank`, so the per track API keeps working on the batched storage.
+    A view is only valid while its track is alive.
+    Parameters
+    ----------
+    bank : TrackBank
+        The storage of the tracks.
+    slot : int
+        The slot of the track in `bank`.
+    """
+
+    mean = _bank_field("means")
+    covariance = _bank_field("covariances")
+    track_id = _bank_field("track_ids")
+    hits = _bank_field("hits")
+    age = _bank_field("ages")
+    time_since_update = _bank_field("time_since_update")
+    state = _bank_field("states")
+    _n_init = _bank_field("n_init")
+    _max_age = _bank_field("max_age")
+
+    def __init__(self, bank, slot):
+        self._bank = bank
+        self._slot = slot
+
 
 class MultiObjTracker:
     """
@@ -176,27 +203,98 @@ class MultiObjTracker:
         Maximum number of missed misses before a track is deleted.
     n_init : int
         Number of frames that a track remains in initialization phase.
+    kalman_filter : str
+        The Kalman filter implementation, a key of `kalman_filter.KALMAN_FILTERS`.
+        "decoupled" is exact for diagonal measurement noise and faster than "full".
+    association : str
+        "gated": matching cascade on the combined IoU / Mahalanobis cost of
+        `gated_cost`, which accounts for the variance of the detections.
+        "iou": a single assignment on the IoU, see `associate_detections_to_trackers`.
+    iou_weight : float
+        Weight of the IoU cost in the combined cost, the Mahalanobis distance
+        has weight 1 - iou_weight.
+    max_gated_cost : float
+        Pairs with a larger combined cost are not matched by the cascade. A
+        value below `iou_weight` rejects the pairs that do not overlap.
+    sparse_association : bool
+        Solve the assignment per connected component of the graph of feasible
+        pairs (overlapping for "iou", within the gate for "gated"), see
+        `sparse_assignment`. Same matches, cost close to linear in the number
+        of objects in dense scenes.
+    association_workers : int
+        Threads used to solve the components, 0 to solve them sequentially.
     kf : kalman_filter.KalmanFilter
         A Kalman filter to filter target trajectories in image space.
-    tracks : List[Track]
-        The list of active tracks at the current time step.
+    bank : TrackBank
+        The states of the active tracks, in struct-of-arrays form.
+    tracks : List[TrackView]
+        The list of active tracks at the current time step, views of `bank`.
+
+    The `time_since_update` of the tracks counts detection steps (`update`
+    calls), not `predict` calls: with keyframe detection the frames between
+    two keyframes only extrapolate the tracks, and must not age them out of
+    the matching cascade or past `max_age`.
     """
 
-    def __init__(self, max_iou_distance=0.7, max_age=30, n_init=3):
+    def __init__(self, max_iou_distance=0.7, max_age=30, n_init=3, kalman_filter="decoupled",
+                 association="iou", iou_weight=0.5, max_gated_cost=0.4, sparse_association=True,
+                 association_workers=0):
         self.max_iou_distance = max_iou_distance
         self.max_age = max_age
         self.n_init = n_init
-
-        self.kf = KalmanFilter()
-        self.tracks = []
+        if association not in ("gated", "iou"):
+            raise ValueError("Unknown association: {}. Choose from ['gated', 'iou']".format(association))
+        self.association = association
+        self.iou_weight = iou_weight
+        self.max_gated_cost = max_gated_cost
+        self.sparse_association = sparse_association
+        self.association_workers = association_workers
+
+        if kalman_filter not in KALMAN_FILTERS:
+            raise ValueError("Unknown Kalman filter: {}. Choose from {}".format(kalman_filter, list(KALMAN_FILTERS)))
+        self.kf = KALMAN_FILTERS[kalman_filter]()
+        self.bank = TrackBank()
         self._next_id = 1
 
-    def predict(self):
+    @property
+    def tracks(self):
+        return [TrackView(self.bank, slot) for slot in self.bank.active_slots()]
+
+    def track_boxes(self):
+        """Returns the Nx4 boxes (x1, y1, x2, y2) of the active tracks, in the
+        order of `tracks`."""
+        return self.bank.means[self.bank.active_slots(), :4]
+
+    def confirmed_boxes(self):
+        """Returns the Nx4 boxes (x1, y1, x2, y2) of the confirmed tracks, e.g.
+        after `predict` to seed the proposals of the next frame."""
+        return self.bank.means[self.bank.states == TrackState.Confirmed, :4]
+
+    def track_ids(self):
+        """Returns the ids of the active tracks, in the order of `tracks`."""
+        return self.bank.track_ids[self.bank.active_slots()]
+
+    def track_variances(self):
+        """Returns the Nx4 variance of the boxes of the active tracks, in the
+        order of `tracks`."""
+        variances = np.diagonal(self.bank.covariances[self.bank.active_slots()], axis1=1, axis2=2)[:, :4]
+        return np.ascontiguousarray(variances)
+
+    def predict(self, dt=1.):
         """Propagate track state distributions one time step forward.
         This function should be called once every time step, before `update`.
+        Parameters
+        ----------
+        dt : float
+            Time since the previous time step in frame periods, e.g. from the
+            timestamps of the images times the nominal frame rate.
         """
-        for track in self.tracks:
-            track.predict(self.kf)
+        slots = self.bank.active_slots()
+        if len(slots) == 0:
+            return
+        self.bank.means[slots], self.bank.covariances[slots] = self.kf.predict_batch(
+            self.bank.means[slots], self.bank.covariances[slots], dt)
+        self.bank.ages[slots] += 1
 
     def update(self, detections, measurement_var):
         """Perform measurement update and track management.
@@ -208,132 +306,213 @@ class MultiObjTracker:
             A list of measurement noise of each bounding box at current time step.
         """
 
-        # Run matching cascade.
-        # matches, unmatched_tracks, unmatched_detections = \
-        #     self._match(detections)
-
-       
-        matches, unmatched_tracks, unmatched_detections = \
-            self.associate_detections_to_trackers(detections, self.tracks)
+        detections = np.asarray(detections, dtype=np.float64).reshape(-1, 4)
+        measurement_var = np.asarray(measurement_var, dtype=np.float64).reshape(-1, 4)
+        slots = self.bank.active_slots()
+        # One more detection step since the last measurement, reset below for the matched tracks
+        self.bank.time_since_update[slots] += 1
+
+        if self.association == "gated":
+            # Run matching cascade.
+            matches, unmatched_tracks, unmatched_detections = \
+                self._match(detections, measurement_var)
+            matches = np.asarray(matches, dtype=np.int64).reshape(-1, 2)
+            unmatched_tracks = np.asarray(unmatched_tracks, dtype=np.int64)
+            unmatched_detections = np.asarray(unmatched_detections, dtype=np.int64)
+        else:
+            matches, unmatched_tracks, unmatched_detections = \
+                self.associate_detections_to_trackers(detections, self.bank.means[slots, :4])
 
         # print("Update state print:")
         # print(matches, unmatched_tracks, unmatched_detections)
         # Update track set.
-        for track_idx, detection_idx in matches:
-            self.tracks[track_idx].update(
-                self.kf, detections[detection_idx], measurement_var[detection_idx])
-        for track_idx in unmatched_tracks:
-            self.tracks[track_idx].mark_missed()
-        for detection_idx in unmatched_detections:
-            self._initiate_track(detections[detection_idx], measurement_var[detection_idx])
-        
-        self.tracks = [t for t in self.tracks if not t.is_deleted()]
-
-    def _match(self, detections):
+        bank = self.bank
+        if len(matches):
+            matched, det_idx = slots[matches[:, 0]], matches[:, 1]
+            bank.means[matched], bank.covariances[matched] = self.kf.update_batch(
+                bank.means[matched], bank.covariances[matched], detections[det_idx], measurement_var[det_idx])
+            bank.hits[matched] += 1
+            bank.time_since_update[matched] = 0
+            confirmed = matched[(bank.states[matched] == TrackState.Tentative) & (bank.hits[matched] >= bank.n_init[matched])]
+            bank.states[confirmed] = TrackState.Confirmed
+
+        # Mark missed
+        missed = slots[unmatched_tracks]
+        deleted = missed[(bank.states[missed] == TrackState.Tentative) | (bank.time_since_update[missed] > bank.max_age[missed])]
+        bank.states[deleted] = TrackState.Deleted
+
+        self._initiate_tracks(detections[unmatched_detections], measurement_var[unmatched_detections])
+
+        bank.release_deleted()
+
+    def update_tracks(self, track_indices, detections, measurement_var):
+        """Measurement update of given tracks, without association and without
+        track management: the other tracks are not marked missed and no track
+        is created. For measurements that are already known to belong to a
+        track, e.g. the re-detection of the track in a crop around its
+        predicted box (`detection.crop_refiner.CropRefiner`).
+        Parameters
+        ----------
+        track_indices : List[int]
+            Indices in `tracks` of the K updated tracks.
+        detections : ndarray
+            The Kx4 measured boxes (x1, y1, x2, y2).
+        measurement_var : ndarray
+            The Kx4 variance of the measurements.
+        """
+        slots = self.bank.active_slots()[np.asarray(track_indices, dtype=np.int64)]
+        if len(slots) == 0:
+            return
+        detections = np.asarray(detections, dtype=np.float64).reshape(-1, 4)
+        measurement_var = np.asarray(measurement_var, dtype=np.float64).reshape(-1, 4)
+
+        bank = self.bank
+        bank.means[slots], bank.covariances[slots] = self.kf.update_batch(
+            bank.means[slots], bank.covariances[slots], detections, measurement_var)
+        bank.hits[slots] += 1
+        bank.time_since_update[slots] = 0
+
+    def gated_cost(self, detections, measurement_var=None):
+        """Combined IoU / Mahalanobis association cost between all active tracks
+        and all detections.
+        Parameters
+        ----------
+        detections : ndarray
+            The Mx4 detections (x1, y1, x2, y2).
+        measurement_var : Optional[ndarray]
+            The Mx4 variance of the detections, the `pred_variance` of the detector.
+        Returns
+        -------
+        (ndarray, ndarray)
+            The NxM combined cost, `iou_weight * (1 - IoU) + (1 - iou_weight) *
+            d^2 / chi2inv95[4]`, with pairs whose squared Mahalanobis distance d^2
+            is beyond the 95% gate set to `linear_assignment.INFTY_COST`, and the
+            NxM IoU cost `1 - IoU`.
+        """
+        slots = self.bank.active_slots()
+        means, covariances = self.bank.means[slots], self.bank.covariances[slots]
+        gating_threshold = chi2inv95[4]
+
+        iou_cost = 1. - iou_matching.iou_matrix(means[:, :4], detections)
+        gating_distance = self.kf.gating_distance_batch(means, covariances, detections, measurement_var)
+        cost_matrix = self.iou_weight * iou_cost + (1. - self.iou_weight) * gating_distance / gating_threshold
+        cost_matrix[gating_distance > gating_threshold] = linear_assignment.INFTY_COST
+        return cost_matrix, iou_cost
+
+    def _match(self, detections, measurement_var=None):
+        """Matching cascade of the confirmed tracks on the gated cost, then IoU
+        matching of the unconfirmed and just missed tracks. Indices are those of
+        `tracks`."""
+        slots = self.bank.active_slots()
+        if len(slots) == 0 or len(detections) == 0:
+            return [], list(range(len(slots))), list(range(len(detections)))
+
+        cost_matrix, iou_cost = self.gated_cost(detections, measurement_var)
+        time_since_update = self.bank.time_since_update[slots]
+        # A track is kept while time_since_update <= max_age after the update, and
+        # incremented once before this one: all the surviving tracks can be matched
+        max_staleness = self.max_age + 1
+        iou_cost[time_since_update > max_staleness, :] = linear_assignment.INFTY_COST
 
         def gated_metric(tracks, dets, track_indices, detection_indices):
-            cost_matrix = iou_matching.iou_cost(tracks, dets, track_indices, detection_indices)
-            cost_matrix = linear_assignment.gate_cost_matrix(
-                self.kf, cost_matrix, tracks, dets, track_indices,
-                detection_indices)
+            return cost_matrix[np.ix_(track_indices, detection_indices)]
 
-            return cost_matrix
+        def iou_metric(tracks, dets, track_indices, detection_indices):
+            return iou_cost[np.ix_(track_indices, detection_indices)]
 
         # Split track set into confirmed and unconfirmed tracks.
-        confirmed_tracks_idx = [
-            i for i, t in enumerate(self.tracks) if t.is_confirmed()]
-        unconfirmed_tracks_idx = [
-            i for i, t in enumerate(self.tracks) if not t.is_confirmed()]
+        tracks = self.tracks
+        confirmed = self.bank.states[slots] == TrackState.Confirmed
+        confirmed_tracks_idx = np.flatnonzero(confirmed).tolist()
+        unconfirmed_tracks_idx = np.flatnonzero(~confirmed).tolist()
 
-        # Associate confirmed tracks using appearance features.
+        # Associate confirmed tracks using the probabilistic gate.
         matches_a, unmatched_tracks_a, unmatched_detections = \
             linear_assignment.matching_cascade(
-                gated_metric, self.max_iou_distance, self.max_age,
-                self.tracks, detections, confirmed_tracks_idx)
+                gated_metric, self.max_gated_cost, max_staleness,
+                tracks, detections, confirmed_tracks_idx,
+                sparse=self.sparse_association, max_workers=self.association_workers)
 
         # Associate remaining tracks together with unconfirmed tracks using IOU.
         iou_track_candidates = unconfirmed_tracks_idx + [
-            k for k in unmatched_tracks_a if
-            self.tracks[k].time_since_update == 1]
+            k for k in unmatched_tracks_a if time_since_update[k] <= max_staleness]
         unmatched_tracks_a = [
-            k for k in unmatched_tracks_a if
-            self.tracks[k].time_since_update != 1]
+            k for k in unmatched_tracks_a if time_since_update[k] > max_staleness]
         matches_b, unmatched_tracks_b, unmatched_detections = \
             linear_assignment.min_cost_matching(
-                iou_matching.iou_cost, self.max_iou_distance, self.tracks,
-                detections, iou_track_candidates, unmatched_detections)
+                iou_metric, self.max_iou_distance, tracks,
+                detections, iou_track_candidates, unmatched_detections,
+                sparse=self.sparse_association, max_workers=self.association_workers)
 
         matches = matches_a + matches_b
-        unmatched_tracks = list(set(unmatched_tracks_a + unmatched_tracks_b))
+        unmatched_tracks = list(set(unmatched_tracks_a) | set(unmatched_tracks_b))
 
-        
         return matches, unmatched_tracks, unmatched_detections
 
-
-    # Not used anywhere, but can be used in place of _match
-    def associate_detections_to_trackers(self, detections, trackers,iou_threshold = 0.3):
+    # Used by `update` when association is "iou"
+    def associate_detections_to_trackers(self, detections, trackers, iou_threshold = 0.3):
         """
         Assigns detections to tracked object (both represented as bounding boxes)
-        Returns 3 lists of matches, unmatched_detections and unmatched_trackers
+        Returns 3 arrays of matches, unmatched_trackers and unmatched_detections
+        Parameters
+        ----------
+        detections : ndarray
+            The Nx4 detected boxes (x1, y1, x2, y2).
+        trackers : ndarray or List[Track]
+            The Mx4 boxes of the tracks, or the tracks.
+        iou_threshold : float
+            Matched pairs with a lower IoU are rejected.
+        Returns
+        -------
+        (ndarray, ndarray, ndarray)
+            The Kx2 matches, 0th column is the tracker and 1st the detection,
+            the unmatched trackers and the unmatched detections.
         """
-        
-        if(len(trackers)==0):
-            return np.empty((0,2),dtype=int), np.empty((0,5),dtype=int), np.arange(len(detections))
-    
-        iou_matrix = np.zeros((len(detections),len(trackers)),dtype=np.float32)
-
-        for d,det in enumerate(detections):
-            for t,trk in enumerate(trackers):
-                iou_matrix[d,t] = self._iou(det,trk.to_xyxy())
-        
-        matched_indices = assignment(-iou_matrix)
-
-        unmatched_detections = []
-        for d,det in enumerate(detections):
-            if(d not in matched_indices[:,0]):
-                unmatched_detections.append(d)
-        
-        unmatched_trackers = []
-        for t,trk in enumerate(trackers):
-            if(t not in matched_indices[:,1]):
-                unmatched_trackers.append(t)
-
-        #filter out matched with low IOU
-        matches = []
-        for m in matched_indices:
-            if(iou_matrix[m[0],m[1]]<iou_threshold):
-                unmatched_detections.append(m[0])
-                unmatched_trackers.append(m[1])
-            else:
-                matches.append(m.reshape(1,2))
-        if(len(matches)==0):
-            matches = np.empty((0,2),dtype=int)
+        if not isinstance(trackers, np.ndarray):
+            trackers = np.asarray([trk.to_xyxy() for trk in trackers])
+        trackers = trackers.reshape(-1, 4)
+        detections = np.asarray(detections).reshape(-1, 4)
+
+        if self.sparse_association:
+            # Only overlapping pairs, found with a grid index, maximizing the IoU
+            rows, cols = sparse_assignment.grid_candidate_pairs(trackers, detections)
+            iou = iou_matching.paired_iou(trackers[rows], detections[cols])
+            overlap = iou > 0
+            rows, cols, iou = rows[overlap], cols[overlap], iou[overlap]
+            matched_indices = sparse_assignment.connected_assignment(
+                rows, cols, -iou, len(trackers), len(detections), 0., self.association_workers)
+            matched_iou = iou_matching.paired_iou(trackers[matched_indices[:, 0]], detections[matched_indices[:, 1]])
         else:
-            matches = np.concatenate(matches,axis=0)
-
-        matches = matches[:,[1,0]] # 0th col is tracking, 1st col is detection
-        
-        return matches, np.array(unmatched_trackers), np.array(unmatched_detections)
+            iou_matrix = iou_matching.iou_matrix(trackers, detections)
+            matched_indices = linear_assignment.linear_assignment(-iou_matrix)
+            matched_iou = iou_matrix[matched_indices[:, 0], matched_indices[:, 1]]
 
+        #filter out matched with low IOU
+        keep = matched_iou >= iou_threshold
+        return linear_assignment.split_matches(matched_indices, len(trackers), len(detections), keep)
 
-    def _initiate_track(self, detection, detection_noise):
-        mean, covariance = self.kf.initiate(detection, detection_noise)
-        self.tracks.append(Track(
-            mean, covariance, self._next_id, self.n_init, self.max_age))
-        self._next_id += 1
+    def _initiate_tracks(self, detections, detection_noise):
+        if len(detections) == 0:
+            return
+        means, covariances = self.kf.initiate_batch(detections, detection_noise)
+        track_ids = np.arange(self._next_id, self._next_id + len(detections))
+        self.bank.allocate(means, covariances, track_ids, self.n_init, self.max_age)
+        self._next_id += len(detections)
 
-    def _iou(self, bb_test,bb_gt):
-        """
-        Computes IUO between two bboxes in the form [x1,y1,x2,y2]
-        """
-        xx1 = np.maximum(bb_test[0], bb_gt[0])
-        yy1 = np.maximum(bb_test[1], bb_gt[1])
-        xx2 = np.minimum(bb_test[2], bb_gt[2])
-        yy2 = np.minimum(bb_test[3], bb_gt[3])
-        w = np.maximum(0., xx2 - xx1)
-        h = np.maximum(0., yy2 - yy1)
-        wh = w * h
-        o = wh / ((bb_test[2]-bb_test[0])*(bb_test[3]-bb_test[1])
-            + (bb_gt[2]-bb_gt[0])*(bb_gt[3]-bb_gt[1]) - wh)
-        return(o)
 
+def build_tracker(cfg, max_age=1, **kwargs):
+    """
+    Build a `MultiObjTracker` with the association and filter of cfg.TRACKING.
+    Other arguments of `MultiObjTracker` can be overridden through kwargs.
+    """
+    params = dict(
+        max_age=max_age,
+        kalman_filter=cfg.TRACKING.KALMAN_FILTER,
+        association=cfg.TRACKING.ASSOCIATION,
+        iou_weight=cfg.TRACKING.IOU_WEIGHT,
+        max_gated_cost=cfg.TRACKING.GATED_MAX_COST,
+        sparse_association=cfg.TRACKING.SPARSE_ASSOCIATION,
+        association_workers=cfg.TRACKING.ASSOCIATION_WORKERS,
+    )
+    params.update(kwargs)
+    return MultiObjTracker(**params)
@@ -0,0 +1,112 @@
+from __future__ import absolute_import
+import numpy as np
+
+
+class TrackState:
+    """
+    Enumeration type for the single target track state. Newly created tracks are
+    classified as `tentative` until enough evidence has been collected. Then,
+    the track state is changed to `confirmed`. Tracks that are no longer alive
+    are classified as `deleted` to mark them for removal from the set of active
+    tracks.
+    """
+
+    Tentative = 1
+    Confirmed = 2
+    Deleted = 3
+
+
+class TrackBank:
+    """
+    Struct-of-arrays storage of the tracks of a `MultiObjTracker`. Track i of the
+    bank lives in a slot, a row of preallocated arrays, so the Kalman filter
+    steps of all tracks are a few batched NumPy calls. Slots of deleted tracks
+    go to a free-list and are reused; the arrays double in size when it is empty.
+    Parameters
+    ----------
+    capacity : int
+        Initial number of slots.
+    ndim : int
+        Dimension of the state space.
+    Attributes
+    ----------
+    means : ndarray
+        The capacity x ndim mean vectors.
+    covariances : ndarray
+        The capacity x ndim x ndim covariance matrices.
+    track_ids, hits, ages, time_since_update, states, n_init, max_age : ndarray
+        Per slot attributes of `track.Track`. `states` is 0 for a free slot.
+    """
+
+    _FIELDS = ("track_ids", "hits", "ages", "time_since_update", "states", "n_init", "max_age")
+
+    def __init__(self, capacity=64, ndim=8):
+        self.ndim = ndim
+        self.means = np.zeros((capacity, ndim))
+        self.covariances = np.zeros((capacity, ndim, ndim))
+        for name in self._FIELDS:
+            setattr(self, name, np.zeros(capacity, dtype=np.int64))
+        self._free = list(range(capacity - 1, -1, -1))
+
+    @property
+    def capacity(self):
+        return len(self.means)
+
+    def __len__(self):
+        return self.capacity - len(self._free)
+
+    def active_slots(self):
+        """Returns the slots of the live tracks, in increasing slot order."""
+        return np.flatnonzero(self.states != 0)
+
+    def _grow(self, min_capacity):
+        capacity = self.capacity
+        new_capacity = max(2 * capacity, min_capacity)
+        grow = new_capacity - capacity
+        self.means = np.concatenate([self.means, np.zeros((grow, self.ndim))])
+        self.covariances = np.concatenate([self.covariances, np.zeros((grow, self.ndim, self.ndim))])
+        for name in self._FIELDS:
+            setattr(self, name, np.concatenate([getattr(self, name), np.zeros(grow, dtype=np.int64)]))
+        self._free = list(range(new_capacity - 1, capacity - 1, -1)) + self._free
+
+    def allocate(self, means, covariances, track_ids, n_init, max_age):
+        """Store N new tentative tracks.
+        Parameters
+        ----------
+        means : ndarray
+            The Nx8 mean vectors.
+        covariances : ndarray
+            The Nx8x8 covariance matrices.
+        track_ids : ndarray
+            The N unique track identifiers.
+        n_init, max_age : int
+            See `track.Track`.
+        Returns
+        -------
+        ndarray
+            The N slots of the new tracks.
+        """
+        n = len(means)
+        if n > len(self._free):
+            self._grow(len(self) + n)
+        slots = np.array([self._free.pop() for _ in range(n)], dtype=np.int64)
+
+        self.means[slots] = means
+        self.covariances[slots] = covariances
+        self.track_ids[slots] = track_ids
+        self.hits[slots] = 1
+        self.ages[slots] = 1
+        self.time_since_update[slots] = 0
+        self.states[slots] = TrackState.Tentative
+        self.n_init[slots] = n_init
+        self.max_age[slots] = max_age
+        return slots
+
+    def release(self, slots):
+        """Free the given slots."""
+        self.states[slots] = 0
+        self._free.extend(np.asarray(slots).tolist())
+
+    def release_deleted(self):
+        """Free the slots of the tracks in the `Deleted` state."""
+        self.release(np.flatnonzero(self.states == TrackState.Deleted))
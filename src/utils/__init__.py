@@ -1,5 +1,6 @@
-from .boxes import Boxes, pairwise_iou, pairwise_iou
+from .boxes import Boxes, pairwise_iou, batched_pairwise_iou
 from .box_regression import Box2BoxTransform, Box2BoxXYXYTransform
-from .instances import Instances
+from .instances import Instances, RaggedInstances
 from .matcher import Matcher
-from .sampling import subsample_labels
+from .sampling import subsample_labels, subsample_labels_batched
+from .checks import set_check_mode, get_check_mode, check, flush_checks
@@ -0,0 +1,197 @@
+"""
+Logging off the inference and training loops.
+
+`AsyncLogger` hands the logging work to worker processes through bounded
+queues: a pool of workers renders the detection figures and writes them to
+disk (as `utils.disk_logger`), and one worker owns the tensorboard
+`SummaryWriter`. The callers only send NumPy arrays of the detections and a
+reference to the image (its path, the worker reads it), so logging a frame
+costs a copy of a few small arrays. When a queue is full, the record is
+dropped ("drop") or the caller waits for a free slot ("block"), see
+cfg.LOGGING.
+"""
+
+import multiprocessing
+import queue
+import numpy as np
+import torch
+from PIL import Image
+
+from .boxes import Boxes
+from .instances import Instances
+from .visualizer import Visualizer
+from .renderer import RasterRenderer
+
+__all__ = ["AsyncLogger", "build_async_logger"]
+
+POLICIES = ("drop", "block")
+
+
+def _load_image(image):
+    if isinstance(image, str):
+        return Image.open(image).convert("RGB")
+    return Image.fromarray(np.asarray(image, dtype=np.uint8))
+
+
+def _to_instances(image_size, arrays):
+    fields = {k: torch.from_numpy(np.ascontiguousarray(v)) for k, v in arrays.items() if k != "pred_boxes"}
+    if "pred_boxes" in arrays:
+        fields["pred_boxes"] = Boxes(torch.from_numpy(np.ascontiguousarray(arrays["pred_boxes"])).reshape(-1, 4))
+    return Instances(image_size, **fields)
+
+
+def _render_worker(tasks, cfg):
+    """Render the detection figures with the matplotlib `Visualizer` and save them."""
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        image, arrays, image_path, direc = task
+        try:
+            image = _load_image(image)
+            instances = _to_instances(image.size[::-1], arrays)
+            visualizer = Visualizer(image, instances, image_path, None, cfg)
+            if instances:
+                visualizer.draw_instances()
+                visualizer.draw_projection()
+            visualizer.save(direc)
+        except Exception as e:
+            print("AsyncLogger: could not save {}: {}".format(image_path, e))
+
+
+def _tensorboard_worker(tasks, log_dir, cfg):
+    """Own the `SummaryWriter` of `log_dir` and write the scalars and images sent to it."""
+    from torch.utils.tensorboard import SummaryWriter
+    writer = SummaryWriter(log_dir)
+    renderer = None
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        kind, args = task
+        try:
+            if kind == "scalar":
+                writer.add_scalar(*args)
+            elif kind == "scalars":
+                writer.add_scalars(*args)
+            elif kind == "detections":
+                tag, image, arrays, step = args
+                image = _load_image(image)
+                if renderer is None or renderer.image_size != image.size[::-1]:
+                    renderer = RasterRenderer(cfg.INPUT.LABELS_TO_TRAIN, image.size[::-1])
+                rendered = renderer.render(image, _to_instances(image.size[::-1], arrays))
+                writer.add_image(tag, np.ascontiguousarray(rendered[:, :image.size[0]]), step, dataformats='HWC')
+        except Exception as e:
+            print("AsyncLogger: could not write {}: {}".format(kind, e))
+    writer.close()
+
+
+class AsyncLogger(object):
+    """
+    Bounded queues in front of logging worker processes.
+    """
+
+    def __init__(self, cfg, num_workers=2, queue_size=64, policy="drop", tb_log_dir=None):
+        """
+        Args:
+            cfg: config, for the class names.
+            num_workers (int): rendering processes of `disk_logger`.
+            queue_size (int): maximum number of pending records of each queue.
+            policy (str): "drop" a record when its queue is full, or "block" until
+                there is room (backpressure on the caller).
+            tb_log_dir (str, optional): tensorboard directory. Without it, the
+                tensorboard methods are no-ops.
+        """
+        if policy not in POLICIES:
+            raise ValueError("Unknown logging policy: {}. Choose from {}".format(policy, list(POLICIES)))
+        self.policy = policy
+        self.dropped = 0
+
+        # fork: the entry points (main.py) are not import safe for spawn
+        context = multiprocessing.get_context("fork")
+        self._tasks = context.Queue(queue_size)
+        self._workers = [context.Process(target=_render_worker, args=(self._tasks, cfg), daemon=True)
+                         for _ in range(num_workers)]
+
+        self._tb_tasks = None
+        if tb_log_dir is not None:
+            self._tb_tasks = context.Queue(queue_size)
+            self._workers.append(context.Process(target=_tensorboard_worker,
+                                                 args=(self._tb_tasks, tb_log_dir, cfg), daemon=True))
+        for worker in self._workers:
+            worker.start()
+        self._closed = False
+
+    def _put(self, tasks, task):
+        if tasks is None or self._closed:
+            return False
+        if self.policy == "block":
+            tasks.put(task)
+            return True
+        try:
+            tasks.put_nowait(task)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def save_detections(self, image, instances, image_path, direc):
+        """
+        Render the detections of one image and save the figure in `direc`, in a worker.
+
+        Args:
+            image (str or ndarray): path of the image, read by the worker, or (H, W, 3) uint8 image.
+            instances (Instances): detections, only their arrays are sent.
+            image_path (str): names the saved file, as `Visualizer.save`.
+            direc (str): output directory.
+
+        Returns:
+            bool: False if the record was dropped.
+        """
+        return self._put(self._tasks, (image, instances.to_numpy(), image_path, direc))
+
+    def disk_logger(self, images, direc, instances=None, rpn_proposals=None, image_paths=None):
+        """
+        Asynchronous `utils.disk_logger`: the images are referenced by their paths,
+        `images` is only there for the same signature.
+        """
+        for instance, path in zip(instances, image_paths):
+            self.save_detections(path, instance, path, direc)
+
+    def add_scalar(self, tag, value, step):
+        return self._put(self._tb_tasks, ("scalar", (tag, float(value), step)))
+
+    def add_scalars(self, main_tag, values, step):
+        return self._put(self._tb_tasks, ("scalars", (main_tag, {k: float(v) for k, v in values.items()}, step)))
+
+    def add_detections_image(self, tag, image, instances, step):
+        """Draw the detections on the image (path or uint8 array) and add it to tensorboard."""
+        return self._put(self._tb_tasks, ("detections", (tag, image, instances.to_numpy(), step)))
+
+    def close(self):
+        """Process the pending records and stop the workers."""
+        if self._closed:
+            return
+        self._closed = True
+        for _ in range(len(self._workers) - (self._tb_tasks is not None)):
+            self._tasks.put(None)
+        if self._tb_tasks is not None:
+            self._tb_tasks.put(None)
+        for worker in self._workers:
+            worker.join()
+        if self.dropped:
+            print("AsyncLogger: {} records dropped".format(self.dropped))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def build_async_logger(cfg, tb_log_dir=None):
+    """
+    Returns:
+        AsyncLogger: configured by cfg.LOGGING.
+    """
+    return AsyncLogger(cfg, cfg.LOGGING.WORKERS, cfg.LOGGING.QUEUE_SIZE, cfg.LOGGING.POLICY, tb_log_dir)
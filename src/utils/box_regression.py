@@ -2,6 +2,8 @@
 import math
 import torch
 
+from .checks import check
+
 # Value for clamping large dw and dh predictions. The heuristic is that we clamp
 # such that dw and dh are no larger than what would transform a 16px box into a
 # 1000px box (based on a small anchor, 16px, and a typical image size, 1000px).
@@ -64,7 +66,7 @@ class Box2BoxTransform(object):
 
         deltas = torch.stack((dx, dy, dw, dh), dim=1)
         # print(src_widths.min().item())
-        assert (src_widths > 0).all().item(), "Input boxes to Box2BoxTransform are not valid!"
+        check(src_widths > 0, "Input boxes to Box2BoxTransform are not valid!")
         return deltas
 
     def apply_deltas(self, deltas, boxes):
@@ -77,7 +79,7 @@ class Box2BoxTransform(object):
                 box transformations for the single box boxes[i].
             boxes (Tensor): boxes to transform, of shape (N, 4)
         """
-        assert torch.isfinite(deltas).all().item(), "Box regression deltas become infinite or NaN!"
+        check(torch.isfinite(deltas), "Box regression deltas become infinite or NaN!")
         boxes = boxes.to(deltas.dtype)
 
         widths = boxes[:, 2] - boxes[:, 0]
@@ -166,7 +168,7 @@ class Box2BoxXYXYTransform(object):
         
 
         deltas = torch.stack((dx1, dy1, dx2, dy2), dim=1)
-        assert (src_widths > 0).all().item(), "Input boxes to Box2BoxTransform are not valid!"
+        check(src_widths > 0, "Input boxes to Box2BoxTransform are not valid!")
         return deltas
 
     def apply_deltas(self, deltas, boxes):
@@ -179,7 +181,7 @@ class Box2BoxXYXYTransform(object):
             boxes (Tensor): boxes to transform, of shape (N, 4)
         """
 
-        assert torch.isfinite(deltas).all().item(), "Box regression deltas become infinite or NaN!"
+        check(torch.isfinite(deltas), "Box regression deltas become infinite or NaN!")
         boxes = boxes.to(deltas.dtype)
 
         widths = boxes[:, 2] - boxes[:, 0]
@@ -208,7 +210,7 @@ class Box2BoxXYXYTransform(object):
 
     def apply_deltas_variance(self, deltas, boxes):
 
-        assert torch.isfinite(deltas).all().item(), "Box regression deltas become infinite or NaN!"
+        check(torch.isfinite(deltas), "Box regression deltas become infinite or NaN!")
         boxes = boxes.to(deltas.dtype)
 
         widths = boxes[:, 2] - boxes[:, 0]
@@ -233,3 +235,29 @@ class Box2BoxXYXYTransform(object):
         pred_boxes_var[:, 2::4] = dx2 * (widths[:, None]**2)
         pred_boxes_var[:, 3::4] = dy2 * (heights[:, None]**2)
         return pred_boxes_var
+
+    def apply_deltas_and_variance(self, deltas, variance, boxes):
+        """
+        Fused :meth:`apply_deltas` and :meth:`apply_deltas_variance` for one
+        (class-agnostic or already class-selected) set of deltas per box.
+
+        Args:
+            deltas (Tensor): (N, 4) transformation deltas.
+            variance (Tensor): (N, 4) variance of the deltas.
+            boxes (Tensor): (N, 4) boxes to transform.
+
+        Returns:
+            Tensor: (N, 4) transformed boxes.
+            Tensor: (N, 4) variance of the transformed boxes.
+        """
+        check(torch.isfinite(deltas), "Box regression deltas become infinite or NaN!")
+        boxes = boxes.to(deltas.dtype)
+
+        widths = boxes[:, 2] - boxes[:, 0]
+        heights = boxes[:, 3] - boxes[:, 1]
+        scale = torch.stack([widths, heights, widths, heights], dim=1)
+        weights = deltas.new_tensor(self.weights)
+
+        pred_boxes = deltas / weights * scale + boxes
+        pred_boxes_var = variance / weights**2 * scale**2
+        return pred_boxes, pred_boxes_var
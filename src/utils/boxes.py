@@ -4,6 +4,8 @@ from enum import Enum, unique
 from typing import Iterator, List, Tuple, Union
 import torch
 
+from .checks import check
+
 
 _RawBoxType = Union[List[float], Tuple[float, ...], torch.Tensor, np.ndarray]
 
@@ -135,7 +137,7 @@ class Boxes:
         Args:
             box_size (height, width): The clipping box's size.
         """
-        assert torch.isfinite(self.tensor).all()
+        check(torch.isfinite(self.tensor), "Boxes to clip must be finite")
         h, w = box_size
         self.tensor[:, 0].clamp_(min=0, max=w)
         self.tensor[:, 1].clamp_(min=0, max=h)
@@ -281,6 +283,36 @@ def pairwise_iou(boxes1: Boxes, boxes2: Boxes) -> torch.Tensor:
     return iou
 
 
+def batched_pairwise_iou(boxes1: torch.Tensor, boxes2: torch.Tensor) -> torch.Tensor:
+    """
+    Batched version of :func:`pairwise_iou` on padded box tensors.
+
+    Args:
+        boxes1 (Tensor): (N, M, 4) boxes in (xmin, ymin, xmax, ymax) format.
+        boxes2 (Tensor): (N, P, 4) boxes in the same format.
+
+    Returns:
+        Tensor: IoU, sized [N, M, P]. Pairs involving an empty (e.g. all-zero
+            padding) box have an IoU of 0.
+    """
+    area1 = (boxes1[..., 2] - boxes1[..., 0]) * (boxes1[..., 3] - boxes1[..., 1])
+    area2 = (boxes2[..., 2] - boxes2[..., 0]) * (boxes2[..., 3] - boxes2[..., 1])
+
+    lt = torch.max(boxes1[:, :, None, :2], boxes2[:, None, :, :2])  # [N,M,P,2]
+    rb = torch.min(boxes1[:, :, None, 2:], boxes2[:, None, :, 2:])  # [N,M,P,2]
+
+    wh = (rb - lt).clamp(min=0)  # [N,M,P,2]
+    inter = wh[..., 0] * wh[..., 1]  # [N,M,P]
+
+    # handle empty boxes
+    iou = torch.where(
+        inter > 0,
+        inter / (area1[:, :, None] + area2[:, None, :] - inter),
+        torch.zeros(1, dtype=inter.dtype, device=inter.device),
+    )
+    return iou
+
+
 def matched_boxlist_iou(boxes1: Boxes, boxes2: Boxes) -> torch.Tensor:
     """
     Compute pairwise intersection over union (IOU) of two sets of matched
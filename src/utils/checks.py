@@ -0,0 +1,81 @@
+"""
+Validation of tensors on the hot path without hidden host synchronizations.
+
+`assert tensor.all()` copies the result to the host and waits for the device to
+finish all queued work. The checks of the detector go through :func:`check`,
+whose behaviour is set globally (cfg.CHECK_MODE):
+
+    * "debug": every check is evaluated immediately, as a plain assert would.
+    * "deferred": checks are queued on the device and evaluated together by
+      :func:`flush_checks`, with a single synchronization (the model flushes at
+      the end of every forward pass).
+    * "off": checks are skipped.
+"""
+
+import torch
+
+__all__ = ["CHECK_MODES", "set_check_mode", "get_check_mode", "check", "flush_checks"]
+
+CHECK_MODES = ("debug", "deferred", "off")
+
+# Deferred checks are flushed automatically beyond this many, to bound the memory
+MAX_PENDING_CHECKS = 256
+
+_mode = "debug"
+_pending = []
+
+
+def set_check_mode(mode):
+    """
+    Set the global check mode, one of `CHECK_MODES`. Pending deferred checks are
+    evaluated before leaving the "deferred" mode.
+    """
+    global _mode
+    if mode not in CHECK_MODES:
+        raise ValueError("Unknown check mode: {}. Choose from {}".format(mode, list(CHECK_MODES)))
+    if _mode == "deferred" and mode != "deferred":
+        flush_checks()
+    _mode = mode
+
+
+def get_check_mode():
+    return _mode
+
+
+def check(condition, message):
+    """
+    Assert that `condition` holds, according to the global check mode.
+
+    Args:
+        condition (Tensor or bool): a bool tensor whose elements must all be True,
+            or a Python bool (always checked immediately, it costs no sync).
+        message (str): message of the AssertionError.
+    """
+    if _mode == "off":
+        return
+    if not torch.is_tensor(condition):
+        assert condition, message
+        return
+    if _mode == "debug":
+        assert condition.all().item(), message
+        return
+
+    _pending.append((condition.all(), message))
+    if len(_pending) >= MAX_PENDING_CHECKS:
+        flush_checks()
+
+
+def flush_checks():
+    """
+    Evaluate the deferred checks with a single host synchronization and raise an
+    AssertionError with the message of the first one that failed.
+    """
+    if not _pending:
+        return
+    conditions, messages = zip(*_pending)
+    del _pending[:]
+
+    device = conditions[0].device
+    results = torch.stack([c.to(device) for c in conditions]).tolist()
+    for result, message in zip(results, messages):
+        assert result, message
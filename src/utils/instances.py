@@ -2,6 +2,7 @@
 import itertools
 from typing import Any, Dict, List, Tuple, Union
 from PIL import Image, ImageDraw
+import numpy as np
 import torch
 from .boxes import Boxes
 
@@ -115,6 +116,52 @@ class Instances:
                 self._fields[k] = v.tensor.cpu().numpy()
 
 
+    def to_numpy(self, names: List[str] = None) -> Dict[str, np.ndarray]:
+        """
+        Export fields as NumPy arrays, without modifying this instance (unlike `toList`).
+
+        The tensor fields (and Boxes) of the same dtype are flattened into one
+        buffer and copied to the host with a single transfer. The returned arrays
+        are contiguous views of that buffer. Fields that are already NumPy arrays
+        are returned as they are.
+
+        Args:
+            names (list[str], optional): the fields to export. Defaults to all fields.
+
+        Returns:
+            dict[str, ndarray]
+        """
+        names = list(self._fields.keys()) if names is None else names
+        ret, groups = {}, {}
+        for k in names:
+            v = self._fields[k]
+            if isinstance(v, Boxes):
+                v = v.tensor
+            if isinstance(v, torch.Tensor):
+                groups.setdefault(v.dtype, []).append((k, v.detach()))
+            else:
+                ret[k] = np.asarray(v)
+
+        for values in groups.values():
+            flat = torch.cat([v.reshape(-1) for _, v in values]).cpu().numpy()
+            chunks = np.split(flat, np.cumsum([v.numel() for _, v in values])[:-1])
+            for (k, v), chunk in zip(values, chunks):
+                ret[k] = chunk.reshape(tuple(v.shape))
+        return {k: ret[k] for k in names}
+
+    def to_structured(self, names: List[str] = None) -> np.ndarray:
+        """
+        Export fields as a single NumPy structured array with one record per
+        instance, e.g. `arr["pred_boxes"]` is (N, 4) and `arr[i]` the record of
+        instance i. See `to_numpy`.
+        """
+        arrays = self.to_numpy(names)
+        dtype = [(k, v.dtype, v.shape[1:]) for k, v in arrays.items()]
+        out = np.empty(len(self), dtype=dtype)
+        for k, v in arrays.items():
+            out[k] = v
+        return out
+
     # Tensor-like methods
     def to(self, device: str) -> "Instances":
         """
@@ -197,3 +244,261 @@ class Instances:
             s += "{} = {}, ".format(k, v)
         s += "])"
         return s
+
+
+def _index_field(value: Any, item: Any) -> Any:
+    if isinstance(value, list):
+        return [value[i] for i in item.tolist()] if torch.is_tensor(item) else value[item]
+    return value[item]
+
+
+class RaggedInstances:
+    """
+    The instances of a batch of images, stored as one flat tensor (or `Boxes`)
+    per field plus the number of instances of every image.
+
+    Per-image data are slices of the flat fields, so going from the batch to an
+    image and back does not copy anything. The number of instances per image is
+    kept on the host, so no operation here needs a device synchronization.
+
+    It can be used where a `list[Instances]` is expected: `len(ragged)` is the
+    number of images, and `ragged[i]` / iteration return the per-image
+    :class:`Instances` (views of the flat fields).
+
+    Some basic usage:
+
+    1. `RaggedInstances.from_instances(list_of_instances)` concatenates once.
+    2. `ragged.proposal_boxes` is the flat field over all images,
+       `ragged.batch_indices` the image of every row.
+    3. `ragged.index(flat_idx, num_instances)` selects rows of all images at once.
+    """
+
+    def __init__(self, image_sizes: List[Tuple[int, int]], num_instances: List[int], **kwargs: Any):
+        """
+        Args:
+            image_sizes (list[(height, width)]): the spatial size of every image.
+            num_instances (list[int]): the number of instances of every image.
+            kwargs: flat fields to add, of length sum(num_instances), sorted by image.
+        """
+        assert len(image_sizes) == len(num_instances)
+        self._image_sizes = list(image_sizes)
+        self._num_instances = [int(n) for n in num_instances]
+        self._offsets = [0] + list(itertools.accumulate(self._num_instances))
+        self._batch_indices = None
+        self._fields = {}
+        for k, v in kwargs.items():
+            self.set(k, v)
+
+    @staticmethod
+    def from_instances(instance_lists: List[Instances]) -> "RaggedInstances":
+        """
+        Concatenate the fields of a `list[Instances]` once.
+        """
+        assert len(instance_lists) > 0
+        if isinstance(instance_lists, RaggedInstances):
+            return instance_lists
+        ret = RaggedInstances([i.image_size for i in instance_lists], [len(i) for i in instance_lists])
+        for k in instance_lists[0].get_fields().keys():
+            values = [i.get(k) for i in instance_lists]
+            v0 = values[0]
+            if isinstance(v0, torch.Tensor):
+                values = torch.cat(values, dim=0)
+            elif isinstance(v0, list):
+                values = list(itertools.chain(*values))
+            elif hasattr(type(v0), "cat"):
+                values = type(v0).cat(values)
+            else:
+                raise ValueError("Unsupported type {} for concatenation".format(type(v0)))
+            ret.set(k, values)
+        return ret
+
+    @property
+    def image_sizes(self) -> List[Tuple[int, int]]:
+        return self._image_sizes
+
+    @property
+    def num_instances(self) -> List[int]:
+        """
+        Returns:
+            list[int]: number of instances of every image.
+        """
+        return self._num_instances
+
+    @property
+    def offsets(self) -> List[int]:
+        """
+        Returns:
+            list[int]: N + 1 offsets, the instances of image i are the rows
+                offsets[i]:offsets[i + 1] of the flat fields.
+        """
+        return self._offsets
+
+    def num_total(self) -> int:
+        return self._offsets[-1]
+
+    @property
+    def device(self) -> torch.device:
+        for v in self._fields.values():
+            if hasattr(v, "device"):
+                return v.device
+        return torch.device("cpu")
+
+    @property
+    def batch_indices(self) -> torch.Tensor:
+        """
+        Returns:
+            Tensor[int64]: image index of every row of the flat fields.
+        """
+        if self._batch_indices is None:
+            device = self.device
+            self._batch_indices = torch.repeat_interleave(
+                torch.arange(len(self._num_instances), device=device),
+                torch.as_tensor(self._num_instances, device=device),
+            )
+        return self._batch_indices
+
+    def __setattr__(self, name: str, val: Any) -> None:
+        if name.startswith("_"):
+            super().__setattr__(name, val)
+        else:
+            self.set(name, val)
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "_fields" or name not in self._fields:
+            raise AttributeError("Cannot find field '{}' in the given RaggedInstances!".format(name))
+        return self._fields[name]
+
+    def set(self, name: str, value: Any) -> None:
+        """
+        Set the flat field named `name`. Its length must be the total number of instances.
+        """
+        assert len(value) == self._offsets[-1], \
+            "Adding a field of length {} to RaggedInstances of {} instances".format(len(value), self._offsets[-1])
+        self._fields[name] = value
+
+    def has(self, name: str) -> bool:
+        return name in self._fields
+
+    def remove(self, name: str) -> None:
+        del self._fields[name]
+
+    def get(self, name: str) -> Any:
+        return self._fields[name]
+
+    def get_fields(self) -> Dict[str, Any]:
+        return self._fields
+
+    def split(self, name: str) -> List[Any]:
+        """
+        Returns:
+            list: per-image views of the field `name`.
+        """
+        value = self._fields[name]
+        return [value[a:b] for a, b in zip(self._offsets[:-1], self._offsets[1:])]
+
+    def to(self, device: str) -> "RaggedInstances":
+        ret = RaggedInstances(self._image_sizes, self._num_instances)
+        for k, v in self._fields.items():
+            if hasattr(v, "to"):
+                v = v.to(device)
+            ret.set(k, v)
+        return ret
+
+    def index(self, item: torch.Tensor, num_instances: List[int]) -> "RaggedInstances":
+        """
+        Select rows of all the images at once.
+
+        Args:
+            item (Tensor[int64]): indices into the flat fields, grouped by image.
+            num_instances (list[int]): how many of the indices belong to every image.
+
+        Returns:
+            RaggedInstances
+        """
+        ret = RaggedInstances(self._image_sizes, num_instances)
+        for k, v in self._fields.items():
+            ret.set(k, _index_field(v, item))
+        return ret
+
+    def head(self, num_instances: List[int]) -> "RaggedInstances":
+        """
+        Keep the first `num_instances[i]` instances of every image i.
+        """
+        num_instances = [min(k, n) for k, n in zip(num_instances, self._num_instances)]
+        if num_instances == self._num_instances:
+            return self
+        device = self.device
+        counts = torch.as_tensor(num_instances, device=device)
+        starts = torch.as_tensor(self._offsets[:-1], device=device)
+        # position of every kept row inside its image, plus the offset of the image
+        first = torch.cumsum(counts, dim=0) - counts
+        rank = torch.arange(sum(num_instances), device=device) - torch.repeat_interleave(first, counts)
+        return self.index(torch.repeat_interleave(starts, counts) + rank, num_instances)
+
+    def append_per_image(self, other: "RaggedInstances") -> "RaggedInstances":
+        """
+        Append the instances of image i of `other` after those of image i of
+        `self`, for every image, with a single scatter per field. Both must have
+        the same fields.
+        """
+        assert len(other) == len(self)
+        num_instances = [a + b for a, b in zip(self._num_instances, other.num_instances)]
+        device = self.device
+        # every row moves forward by the number of rows of `other` in the images before it
+        self_shift = torch.as_tensor([0] + other.offsets[1:-1], device=device)
+        other_shift = torch.as_tensor(self._offsets[1:], device=device)
+        self_pos = torch.arange(self.num_total(), device=device) + self_shift[self.batch_indices]
+        other_pos = torch.arange(other.num_total(), device=device) + other_shift[other.batch_indices]
+
+        ret = RaggedInstances(self._image_sizes, num_instances)
+        for k, v in self._fields.items():
+            w = other.get(k)
+            is_boxes = isinstance(v, Boxes)
+            v_t, w_t = (v.tensor, w.tensor) if is_boxes else (v, w)
+            out = v_t.new_empty((len(v_t) + len(w_t),) + tuple(v_t.shape[1:]))
+            out[self_pos] = v_t
+            out[other_pos] = w_t.to(v_t.dtype)
+            ret.set(k, Boxes(out) if is_boxes else out)
+        return ret
+
+    def pooler_format(self, name: str = "proposal_boxes") -> torch.Tensor:
+        """
+        The boxes of the field `name` in the (M, 5) format of the ROI pooling ops,
+        (batch index, x0, y0, x1, y1), filled in place without concatenation.
+        """
+        boxes = self._fields[name]
+        boxes = boxes.tensor if isinstance(boxes, Boxes) else boxes
+        out = boxes.new_empty((len(boxes), 5))
+        out[:, 0] = self.batch_indices
+        out[:, 1:] = boxes
+        return out
+
+    def to_instances(self) -> List[Instances]:
+        return [self[i] for i in range(len(self))]
+
+    def __getitem__(self, i: int) -> Instances:
+        """
+        Returns:
+            Instances: the instances of image `i`, as views of the flat fields.
+        """
+        a, b = self._offsets[i], self._offsets[i + 1]
+        ret = Instances(self._image_sizes[i])
+        for k, v in self._fields.items():
+            ret.set(k, v[a:b])
+        return ret
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __len__(self) -> int:
+        return len(self._num_instances)
+
+    def __str__(self) -> str:
+        s = self.__class__.__name__ + "("
+        s += "num_images={}, ".format(len(self))
+        s += "num_instances={}, ".format(self._num_instances)
+        s += "fields=[{}])".format(", ".join(self._fields.keys()))
+        return s
+
+    __repr__ = __str__
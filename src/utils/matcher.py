@@ -1,6 +1,8 @@
 # Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
 import torch
 
+from .checks import check
+
 
 class Matcher(object):
     """
@@ -58,28 +60,26 @@ class Matcher(object):
                 pairwise quality between M ground-truth elements and N predicted
                 elements. All elements must be >= 0 (due to the us of `torch.nonzero`
                 for selecting indices in :meth:`set_low_quality_matches_`).
+                A batch of matrices of shape (B, M, N) is matched independently.
 
         Returns:
             matches (Tensor[int64]): a vector of length N, where matches[i] is a matched
-                ground-truth index in [0, M)
+                ground-truth index in [0, M). (B, N) for a batch.
             match_labels (Tensor[int8]): a vector of length N, where pred_labels[i] indicates
-                whether a prediction is a true or false positive or ignored
+                whether a prediction is a true or false positive or ignored. (B, N) for a batch.
         """
-        assert match_quality_matrix.dim() == 2
+        assert match_quality_matrix.dim() >= 2
         if match_quality_matrix.numel() == 0:
+            shape = match_quality_matrix.shape[:-2] + match_quality_matrix.shape[-1:]
             return (
-                match_quality_matrix.new_full(
-                    (match_quality_matrix.size(1),), 0, dtype=torch.int64
-                ),
-                match_quality_matrix.new_full(
-                    (match_quality_matrix.size(1),), -1, dtype=torch.int8
-                ),
+                match_quality_matrix.new_full(shape, 0, dtype=torch.int64),
+                match_quality_matrix.new_full(shape, -1, dtype=torch.int8),
             )
-        assert torch.all(match_quality_matrix >= 0)
+        check(match_quality_matrix >= 0, "Match quality must be non-negative")
 
         # match_quality_matrix is M (gt) x N (predicted)
-        # Max over gt elements (dim 0) to find best gt candidate for each prediction
-        matched_vals, matches = match_quality_matrix.max(dim=0) # matched_vals: max iou value for predictionn with gt, matches: index of the gt with which the prediction have max iou
+        # Max over gt elements (dim -2) to find best gt candidate for each prediction
+        matched_vals, matches = match_quality_matrix.max(dim=-2) # matched_vals: max iou value for predictionn with gt, matches: index of the gt with which the prediction have max iou
 
         match_labels = matches.new_full(matches.size(), 1, dtype=torch.int8)
 
@@ -102,6 +102,15 @@ class Matcher(object):
         This function implements the RPN assignment case (i) in Sec. 3.1.2 of the
         Faster R-CNN paper: https://arxiv.org/pdf/1506.01497v3.pdf.
         """
+        if match_quality_matrix.dim() > 2:
+            # Batched: mark every prediction that is the best match of one of the gt boxes
+            highest_quality_foreach_gt, _ = match_quality_matrix.max(dim=-1, keepdim=True)
+            # Padded gt rows have quality 0 everywhere: they would tie with every prediction
+            # that overlaps nothing, so only the rows with a positive best match count
+            best = (match_quality_matrix == highest_quality_foreach_gt) & (highest_quality_foreach_gt > 0)
+            match_labels[best.any(dim=-2)] = 1
+            return
+
         # For each gt, find the prediction with which it has highest quality
         highest_quality_foreach_gt, _ = match_quality_matrix.max(dim=1)
         # Find the highest quality match available, even if it is low, including ties.
@@ -0,0 +1,93 @@
+"""
+Vectorized construction of the denso/Instances ROS message (msg/Instances.msg)
+from the NumPy arrays of `Instances.to_numpy`.
+
+Building `BoundingBox2D(*x)` one box at a time costs a Python call and a float
+conversion per coordinate. Instead, the serialized form of the whole message is
+written with NumPy in one pass and handed to the generated `deserialize` of the
+message class. ROS is not imported here, the message class is passed in.
+"""
+
+import struct
+import numpy as np
+
+__all__ = ["instances_to_msg", "serialize_instances"]
+
+# Field layout of the ROS1 serialization, little endian and packed
+_BOX_DTYPE = np.dtype("<f8")
+_CLASSIFICATION_DTYPE = np.dtype([("score", "<f8"), ("class", "<i2")])
+
+
+def _pack_string(value):
+    value = value.encode("utf-8")
+    return struct.pack("<I", len(value)) + value
+
+
+def _pack_array(values, dtype, width):
+    values = np.ascontiguousarray(np.asarray(values, dtype=dtype).reshape(-1, width))
+    return struct.pack("<I", len(values)) + values.tobytes()
+
+
+def serialize_instances(boxes, variances=None, scores=None, classes=None, image_size=(0, 0),
+                        image_path="", stamp=None, frame_id="", seq=0):
+    """
+    Serialize detections in the wire format of msg/Instances.msg.
+
+    Args:
+        boxes (ndarray): (N, 4) boxes in (x1, y1, x2, y2).
+        variances (ndarray, optional): (N, 4) variance of the box coordinates.
+        scores (ndarray, optional): (N,) scores. Classifications are only filled
+            when both `scores` and `classes` are given.
+        classes (ndarray, optional): (N,) class indices.
+        image_size (height, width): size of the image.
+        image_path (str): image path, or any identifier of the frame.
+        stamp (rospy.Time, optional): header stamp, anything with `secs` and `nsecs`.
+        frame_id (str): header frame id.
+        seq (int): header sequence number.
+
+    Returns:
+        bytes
+    """
+    secs, nsecs = (stamp.secs, stamp.nsecs) if stamp is not None else (0, 0)
+    empty = np.empty((0, 4))
+
+    classifications = np.empty(0, dtype=_CLASSIFICATION_DTYPE)
+    if scores is not None and classes is not None:
+        classifications = np.empty(len(scores), dtype=_CLASSIFICATION_DTYPE)
+        classifications["score"] = scores
+        classifications["class"] = classes
+
+    return b"".join([
+        struct.pack("<3I", seq, secs, nsecs),
+        _pack_string(frame_id),
+        _pack_array(boxes, _BOX_DTYPE, 4),
+        _pack_array(empty if variances is None else variances, _BOX_DTYPE, 4),
+        struct.pack("<I", len(classifications)) + classifications.tobytes(),
+        struct.pack("<2d", image_size[1], image_size[0]),
+        _pack_string(image_path),
+    ])
+
+
+def instances_to_msg(msg_type, arrays, image_size=(0, 0), image_path="", stamp=None, frame_id=""):
+    """
+    Build a denso/Instances message in one step.
+
+    Args:
+        msg_type (type): the generated message class, `denso.msg.Instances`.
+        arrays (dict[str, ndarray]): output of `Instances.to_numpy`. Uses
+            "pred_boxes" and, if present, "pred_variance", "scores" and "pred_classes".
+        Others: see `serialize_instances`.
+
+    Returns:
+        msg_type
+    """
+    buff = serialize_instances(
+        arrays["pred_boxes"], arrays.get("pred_variance"), arrays.get("scores"), arrays.get("pred_classes"),
+        image_size, image_path, stamp, frame_id,
+    )
+    msg = msg_type()
+    msg.deserialize(buff)
+    if stamp is not None:
+        # keep the original time type (rospy.Time) rather than the deserialized genpy.Time
+        msg.header.stamp = stamp
+    return msg
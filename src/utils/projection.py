@@ -1,3 +1,5 @@
+import os
+import functools
 import numpy as np
 from PIL import Image, ImageDraw
 import matplotlib.pyplot as plt
@@ -34,10 +36,14 @@ def TwoDtoThreeD_cam0(samples, p_matrix, rect_matrix=0):
         Threedboxes.append(bboxBottomIn3D[:2])
     return np.array(Threedboxes)
 
+DEFAULT_CALIB = "/home/dishank/denso-ws/src/denso/datasets/kitti_tracking/training/calib/0001.txt"
+CAM_HEIGHT = 1.72
+# Added to the pixel covariances before their Cholesky factorization, for zero variances
+_JITTER = 1e-9 * np.eye(2)
 
-def read_matrix(path):
-    file_path = "/home/dishank/denso-ws/src/denso/datasets/kitti_tracking/training/calib/0001.txt"
-    file = open(file_path)
+
+def read_matrix(path=DEFAULT_CALIB):
+    file = open(path)
     lines = file.read().splitlines()
     p_matrix = lines[2].split(':', 1)[1].strip()
     p_matrix = np.array(p_matrix.split(' '), dtype='float').reshape((3,4))
@@ -49,24 +55,143 @@ def read_matrix(path):
     # matrix = matrix[:,:-1]
 
     return np.matmul(p_matrix, r_matrix)
-            
-def ground_project(instances, path="/home/dishank/denso-ws/src/denso/datasets/kitti_tracking/training/calib/0001.txt"):
-    means = instances.pred_boxes
-    means = [[(x[0]+x[2])/2,x[3]] for x in means]
-    sigmas = instances.pred_variance
-    sigmas = [[(y[0]+y[2])/4, y[3]] for y in sigmas]
-    # K_matrix, rect_matrix = read_matrix(path)
-    matrix = read_matrix(path)
-    gd_means=[]
-    gd_sigmas = []
-
-    for mean, sigma in zip(means, sigmas): #iterating gthrough each of the box
-        samples = np.random.normal(np.full((10,2), mean), sigma) #Draw 10 samples
-        # ground_points = TwoDtoThreeD(samples, K_matrix)
-        ground_points = TwoDtoThreeD_cam0(samples, matrix)
-        gd_mean = ground_points.mean(axis=0, keepdims=False)
-        gd_std = ground_points.std(axis=0, keepdims=False)
-        gd_means.append(np.squeeze(gd_mean))
-        gd_sigmas.append(np.squeeze(gd_std))
-
-    return np.asarray(gd_means), np.asarray(gd_sigmas)
+
+
+class Calibration(object):
+    """
+    Projection of image points onto the ground plane, for one camera calibration.
+
+    A pixel (u, v) of a point on the ground, at CAM_HEIGHT below the camera, is
+    the projection of (x, CAM_HEIGHT, z, 1) in the rectified cam0 frame. With
+    A mapping (x, z, 1) to it, H = P_rect A is a homography between the ground
+    plane and the image, and its inverse, computed once, projects any number
+    of pixels back in one matrix product (as `TwoDtoThreeD_cam0`).
+    """
+
+    def __init__(self, path=DEFAULT_CALIB, cam_height=CAM_HEIGHT):
+        self.path = path
+        self.matrix = read_matrix(path)
+        A = np.array([[1, 0, 0], [0, 0, cam_height], [0, 1, 0], [0, 0, 1]])
+        self.homography = np.matmul(self.matrix, A)
+        self.homography_inv = np.linalg.inv(self.homography)
+
+    def to_ground(self, pixels):
+        """
+        Args:
+            pixels (ndarray): (..., 2) image points (u, v).
+
+        Returns:
+            ndarray: (..., 2) ground points (x, z) in the rectified cam0 frame.
+        """
+        pixels = np.asarray(pixels, dtype=np.float64)
+        points = np.matmul(pixels, self.homography_inv[:, :2].T) + self.homography_inv[:, 2]
+        return points[..., :2] / points[..., 2:]
+
+    def jacobian(self, pixels):
+        """
+        Args:
+            pixels (ndarray): (N, 2) image points (u, v).
+
+        Returns:
+            ndarray: (N, 2) ground points, as `to_ground`.
+            ndarray: (N, 2, 2) Jacobian of the ground points w.r.t. (u, v) at the pixels.
+        """
+        pixels = np.asarray(pixels, dtype=np.float64).reshape(-1, 2)
+        points = np.matmul(pixels, self.homography_inv[:, :2].T) + self.homography_inv[:, 2]
+        w = points[:, 2]
+        ground = points[:, :2] / w[:, None]
+        # d(q_i / w)/dp_j = (Hinv[i, j] - g_i Hinv[2, j]) / w
+        jacobian = (self.homography_inv[None, :2, :2] - ground[:, :, None] * self.homography_inv[None, None, 2, :2]) / w[:, None, None]
+        return ground, jacobian
+
+    def propagate(self, pixel_mean, pixel_cov, mode="unscented", num_samples=10):
+        """
+        Ground distribution of uncertain image points, for all the points at once.
+
+        Args:
+            pixel_mean (ndarray): (N, 2) mean image points (u, v).
+            pixel_cov (ndarray): (N, 2) variances of u and v, or (N, 2, 2) covariances.
+            mode (str): one of
+                - "linear": mean and covariance through the Jacobian of the projection at the mean.
+                - "unscented": unscented transform with the 5 sigma points of a 2D Gaussian
+                  (kappa = 1, i.e. n + kappa = 3).
+                - "sampling": Monte Carlo with `num_samples` samples per point.
+
+        Returns:
+            ndarray: (N, 2) mean ground points (x, z).
+            ndarray: (N, 2, 2) their covariances.
+        """
+        pixel_mean = np.asarray(pixel_mean, dtype=np.float64).reshape(-1, 2)
+        pixel_cov = np.asarray(pixel_cov, dtype=np.float64)
+        if pixel_cov.ndim == 2:
+            pixel_cov = pixel_cov[:, :, None] * np.eye(2)
+
+        if mode == "linear":
+            ground, jacobian = self.jacobian(pixel_mean)
+            return ground, np.matmul(np.matmul(jacobian, pixel_cov), jacobian.transpose(0, 2, 1))
+
+        if mode == "unscented":
+            n, kappa = 2, 1.0
+            offsets = np.linalg.cholesky((n + kappa) * (pixel_cov + _JITTER)).transpose(0, 2, 1) # rows are the columns of the square root
+            sigma_points = np.concatenate([pixel_mean[:, None], pixel_mean[:, None] + offsets, pixel_mean[:, None] - offsets], axis=1)
+            weights = np.r_[kappa / (n + kappa), np.full(2 * n, 0.5 / (n + kappa))]
+        elif mode == "sampling":
+            noise = np.random.standard_normal((len(pixel_mean), num_samples, 2))
+            sigma_points = pixel_mean[:, None] + np.matmul(noise, np.linalg.cholesky(pixel_cov + _JITTER).transpose(0, 2, 1))
+            weights = np.full(num_samples, 1.0 / num_samples)
+        else:
+            raise ValueError("Unknown propagation mode: {}".format(mode))
+
+        points = self.to_ground(sigma_points)
+        mean = np.einsum('s,nsi->ni', weights, points)
+        centered = points - mean[:, None]
+        return mean, np.einsum('s,nsi,nsj->nij', weights, centered, centered)
+
+
+@functools.lru_cache(maxsize=16)
+def get_calibration(path=DEFAULT_CALIB):
+    """
+    Returns:
+        Calibration: of the calib file `path`, read once and shared by all the callers.
+    """
+    return Calibration(path)
+
+
+def calib_path(root_dir, sequence):
+    """
+    Returns:
+        str: calib file of a KITTI tracking training sequence, e.g. "0001".
+    """
+    return os.path.join(root_dir, "training", "calib", sequence + ".txt")
+
+
+def ground_project(instances, path=DEFAULT_CALIB, num_samples=10, calibration=None, mode="unscented",
+                   return_covariance=False):
+    """
+    Ground position of the bottom center of the boxes and its uncertainty,
+    propagated from the box uncertainty for all the boxes at once.
+
+    Args:
+        instances (Instances): with fields "pred_boxes" and "pred_variance".
+        path (str): calib file, used when `calibration` is None.
+        num_samples (int): samples per box of the "sampling" mode.
+        calibration (Calibration, optional): defaults to `get_calibration(path)`.
+        mode (str): "unscented", "linear" or "sampling", see `Calibration.propagate`.
+        return_covariance (bool): return the (N, 2, 2) covariances instead of the std.
+
+    Returns:
+        ndarray: (N, 2) mean ground points (x, z).
+        ndarray: (N, 2) standard deviation of the ground points, or their covariances.
+    """
+    calibration = calibration or get_calibration(path)
+    arrays = instances.to_numpy(["pred_boxes", "pred_variance"])
+    boxes = arrays["pred_boxes"].reshape(-1, 4)
+    variances = arrays["pred_variance"].reshape(-1, 4)
+    # Bottom center (u, v) = ((x1 + x2)/2, y2) and its variance
+    pixel_mean = np.stack([(boxes[:, 0]+boxes[:, 2])/2, boxes[:, 3]], axis=1)
+    pixel_var = np.stack([(variances[:, 0]+variances[:, 2])/4, variances[:, 3]], axis=1)
+
+    mean, covariance = calibration.propagate(pixel_mean, pixel_var, mode, num_samples)
+    if return_covariance:
+        return mean, covariance
+    return mean, np.sqrt(np.diagonal(covariance, axis1=1, axis2=2))
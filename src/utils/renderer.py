@@ -0,0 +1,128 @@
+"""
+Direct raster rendering of the detections, without matplotlib.
+
+The output has the content of `Visualizer.draw_instances` + `draw_projection`:
+the image with the boxes, labels and 2 sigma corner ellipses, and next to it
+the bird's eye view panel with the ground points, their uncertainty ellipses
+and a 2 x 4 m footprint. Everything is drawn with PIL into one RGBA buffer
+allocated once and reused for every frame, at the resolution of the image
+(no figure rasterization). `Visualizer` stays for the offline figures.
+"""
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+__all__ = ["RasterRenderer"]
+
+# Ellipse colors of the bird's eye view, one per ground point in turn
+_PALETTE = [(31, 119, 180), (255, 127, 14), (44, 160, 44), (214, 39, 40), (148, 103, 189),
+            (140, 86, 75), (227, 119, 194), (127, 127, 127), (188, 189, 34), (23, 190, 207)]
+
+
+class RasterRenderer(object):
+    """
+    Renders frames of a fixed image size into a reusable buffer.
+    """
+
+    def __init__(self, labels, image_size=(375, 1242), x_range=(-15.0, 15.0), z_range=(0.0, 50.0),
+                 grid_step=10.0):
+        """
+        Args:
+            labels (list[str]): class names, cfg.INPUT.LABELS_TO_TRAIN.
+            image_size (height, width): size of the images.
+            x_range, z_range (float, float): extent of the bird's eye view in meters,
+                lateral and forward. The panel has the height of the image and equal axes.
+            grid_step (float): spacing of the grid lines of the bird's eye view, in meters.
+        """
+        self.labels = labels
+        self.image_size = image_size
+        self.x_range = x_range
+        self.z_range = z_range
+        self.grid_step = grid_step
+        height, width = image_size
+        self.bev_scale = height / (z_range[1] - z_range[0]) # pixels per meter
+        self.bev_width = int(round(self.bev_scale * (x_range[1] - x_range[0])))
+
+        # Writable RGBA array shared with a PIL image: drawing writes into the array
+        self.buffer = np.zeros((height, width + self.bev_width, 4), dtype=np.uint8)
+        self._canvas = Image.frombuffer("RGBA", (self.buffer.shape[1], height), self.buffer, "raw", "RGBA", 0, 1)
+        self._canvas.readonly = 0
+        self._drawer = ImageDraw.Draw(self._canvas)
+
+        # Empty bird's eye view with its grid, copied in at every frame
+        self._bev_background = self._draw_bev_background()
+
+    def _to_bev(self, x, z):
+        """Meters to canvas pixels."""
+        u = self.image_size[1] + (np.asarray(x) - self.x_range[0]) * self.bev_scale
+        v = self.image_size[0] - (np.asarray(z) - self.z_range[0]) * self.bev_scale
+        return u, v
+
+    def _draw_bev_background(self):
+        self.buffer[:, self.image_size[1]:] = 255
+        grid = (200, 200, 200, 255)
+        step = self.grid_step
+        for x in np.arange(np.ceil(self.x_range[0] / step) * step, self.x_range[1] + 1e-6, step):
+            u, _ = self._to_bev(x, 0)
+            self._drawer.line([u, 0, u, self.image_size[0]], fill=grid)
+        for z in np.arange(self.z_range[0], self.z_range[1] + 1e-6, step):
+            _, v = self._to_bev(0, z)
+            self._drawer.line([self.image_size[1], v, self.buffer.shape[1], v], fill=grid)
+        self._drawer.line([self.image_size[1], 0, self.image_size[1], self.image_size[0]], fill=(0, 0, 0, 255))
+        return self.buffer[:, self.image_size[1]:].copy()
+
+    def render(self, image, instances=None, projection=None):
+        """
+        Args:
+            image (PIL.Image or ndarray): (H, W, 3) uint8 image, of size `image_size`.
+            instances (Instances, optional): with "pred_boxes" and optionally "pred_classes",
+                "scores", "pred_variance".
+            projection (ndarray, ndarray, optional): (N, 2) ground points and their (N, 2) std,
+                as returned by `projection.ground_project`.
+
+        Returns:
+            ndarray: (H, W + bev width, 3) uint8 RGB view of the buffer (not contiguous),
+                valid until the next call.
+        """
+        height, width = self.image_size
+        draw = self._drawer
+        image = np.asarray(image)
+        if image.shape[:2] != (height, width):
+            raise ValueError("Image of size {} given to a renderer of size {}".format(image.shape[:2], self.image_size))
+
+        # The bird's eye view first: what it draws past its left edge is then covered by the image
+        self.buffer[:, width:] = self._bev_background
+        if projection is not None:
+            points, std = projection
+            u, v = self._to_bev(points[:, 0], points[:, 1])
+            du, dv = std[:, 0] * self.bev_scale, std[:, 1] * self.bev_scale
+            # 2 x 4 m footprint starting at the ground point
+            box_u0, box_v1 = self._to_bev(points[:, 0] - 1.0, points[:, 1])
+            box_u1, box_v0 = self._to_bev(points[:, 0] + 1.0, points[:, 1] + 4.0)
+            for i in range(len(points)):
+                color = _PALETTE[i % len(_PALETTE)] + (255,)
+                draw.ellipse([u[i]-du[i], v[i]-dv[i], u[i]+du[i], v[i]+dv[i]], outline=color)
+                draw.rectangle([box_u0[i], box_v0[i], box_u1[i], box_v1[i]], outline=(255, 0, 0, 255))
+
+        self.buffer[:, :width, :3] = image[:, :, :3]
+        self.buffer[:, :width, 3] = 255
+
+        if instances is not None and len(instances) > 0:
+            arrays = instances.to_numpy()
+            boxes = arrays["pred_boxes"].reshape(-1, 4)
+            for box in boxes.tolist():
+                draw.rectangle(box, outline=(255, 0, 0, 255), width=3)
+
+            if "pred_classes" in arrays:
+                for box, label, score in zip(boxes.tolist(), arrays["pred_classes"].tolist(), arrays["scores"].tolist()):
+                    draw.text([box[0], box[1]-10], "{}: {:.2f}%".format(self.labels[label], score), fill=(0, 128, 0, 255))
+
+            if "pred_variance" in arrays:
+                # 2 sigma ellipses around the top left and bottom right corners
+                corners = boxes.reshape(-1, 2, 2)
+                sigma = 2*np.sqrt(arrays["pred_variance"]).reshape(-1, 2, 2)
+                ellipses = np.concatenate([corners - sigma, corners + sigma], axis=2).reshape(-1, 4)
+                for ellipse in ellipses.tolist():
+                    draw.ellipse(ellipse, outline=(0, 0, 255, 255), width=3)
+
+        return self.buffer[:, :, :3]
@@ -1,7 +1,7 @@
 # Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved
 import torch
 
-__all__ = ["subsample_labels"]
+__all__ = ["subsample_labels", "subsample_labels_batched"]
 
 
 def subsample_labels(labels, num_samples, positive_fraction, bg_label):
@@ -46,3 +46,50 @@ def subsample_labels(labels, num_samples, positive_fraction, bg_label):
     pos_idx = positive[perm1]
     neg_idx = negative[perm2]
     return pos_idx, neg_idx
+
+
+def subsample_labels_batched(labels, num_samples, positive_fraction, bg_label, mask=None):
+    """
+    Batched version of :func:`subsample_labels` over the rows of a padded label
+    matrix, without any host synchronization.
+
+    Positives and negatives are drawn by ranking random keys, so every row samples
+    the same number of positives and negatives as :func:`subsample_labels` would.
+
+    Args:
+        labels (Tensor): (N, P) label matrix, same values as in :func:`subsample_labels`.
+        num_samples, positive_fraction, bg_label: same as :func:`subsample_labels`.
+        mask (Tensor, optional): (N, P) bool, False for padding entries. Padding is
+            never sampled before a real entry.
+
+    Returns:
+        sampled_idx (Tensor): (N, S) column indices with S = min(num_samples, P).
+            The sampled positives come first, then the sampled negatives, then
+            filler entries that were not sampled.
+        sampled_mask (Tensor): (N, S) bool, True for the entries that were sampled.
+    """
+    positive = (labels != -1) & (labels != bg_label)
+    negative = labels == bg_label
+    if mask is not None:
+        positive &= mask
+        negative &= mask
+
+    num_pos = positive.sum(dim=1).clamp(max=int(num_samples * positive_fraction))
+    num_neg = torch.min(negative.sum(dim=1), num_samples - num_pos)
+
+    keys = torch.rand(labels.shape, device=labels.device)
+    # Rank of every entry among the entries of its kind, in random order
+    pos_rank = torch.where(positive, keys, keys + 2).argsort(dim=1).argsort(dim=1)
+    neg_rank = torch.where(negative, keys, keys + 2).argsort(dim=1).argsort(dim=1)
+    sampled_pos = positive & (pos_rank < num_pos[:, None])
+    sampled_neg = negative & (neg_rank < num_neg[:, None])
+    sampled = sampled_pos | sampled_neg
+
+    # Order: sampled positives, sampled negatives, the rest, padding
+    order = torch.where(sampled_pos, keys, torch.where(sampled_neg, keys + 1, keys + 2))
+    if mask is not None:
+        order = torch.where(mask, order, keys + 3)
+
+    num_out = min(num_samples, labels.shape[1])
+    sampled_idx = order.topk(num_out, dim=1, largest=False).indices
+    return sampled_idx, sampled.gather(1, sampled_idx)
@@ -0,0 +1,216 @@
+"""
+Append-only binary log of the tracks, one fixed size record per track and frame.
+
+A log file is a small header (magic, length and JSON of the record dtype)
+followed by packed records of `TRACK_RECORD`. Records are only ever appended,
+so a file cut by a crash loses at most its last partial record, which the
+reader drops. `TrackLogWriter` buffers the records of the last frames and a
+background thread appends them to the file, rotating to a new file when it
+reaches `max_bytes`. Memory is bounded by the flush interval, not by the
+length of the drive.
+
+Reading back, as NumPy structured arrays (memory mapped):
+    python -m src.utils.track_log track_log --csv tracks.csv
+"""
+
+import os
+import glob
+import json
+import struct
+import argparse
+import threading
+import numpy as np
+
+__all__ = ["TRACK_RECORD", "TrackLogWriter", "read_track_log", "iter_track_log", "log_files"]
+
+TRACK_RECORD = np.dtype([
+    ("frame", "<u4"),
+    ("stamp", "<f8"),
+    ("track_id", "<i8"),
+    ("mean", "<f8", (4,)),
+    ("variance", "<f8", (4,)),
+])
+
+_MAGIC = b"PODTRKLG"
+
+
+def _header(dtype):
+    descr = json.dumps(dtype.descr).encode("utf-8")
+    return _MAGIC + struct.pack("<I", len(descr)) + descr
+
+
+def _read_header(f):
+    magic = f.read(len(_MAGIC))
+    if magic != _MAGIC:
+        raise ValueError("Not a track log: {}".format(getattr(f, "name", f)))
+    size, = struct.unpack("<I", f.read(4))
+    descr = json.loads(f.read(size).decode("utf-8"))
+    # JSON turns the (name, type, shape) tuples into lists
+    dtype = np.dtype([tuple(tuple(x) if isinstance(x, list) else x for x in field) for field in descr])
+    return dtype, len(_MAGIC) + 4 + size
+
+
+def log_files(prefix):
+    """
+    Returns:
+        list[str]: the files of the log `prefix`, in writing order.
+    """
+    return sorted(glob.glob(glob.escape(prefix) + ".*.trk"))
+
+
+class TrackLogWriter(object):
+    """
+    Streaming writer of the track log `prefix`.<index>.trk.
+
+    `write` only packs the records of a frame and queues them, the file is
+    written by a background thread every `flush_interval` seconds, or as soon
+    as `max_pending` records are queued.
+    """
+
+    def __init__(self, prefix, max_bytes=64 * 2**20, flush_interval=1.0, max_pending=8192):
+        """
+        Args:
+            prefix (str): path of the log without the ".<index>.trk" suffix. Writing
+                continues after the existing files of the log.
+            max_bytes (int): size at which the file is rotated.
+            flush_interval (float): seconds between two writes to the file.
+            max_pending (int): queued records that trigger a write before the interval.
+        """
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        directory = os.path.dirname(prefix)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._index = len(log_files(prefix))
+        self._header = _header(TRACK_RECORD)
+        self._file = None
+        self._open()
+
+        self._pending = []
+        self._num_pending = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="track-log", daemon=True)
+        self._thread.start()
+
+    def _open(self):
+        path = "{}.{:05d}.trk".format(self.prefix, self._index)
+        self._file = open(path, "wb")
+        self._file.write(self._header)
+        self._index += 1
+
+    def write(self, frame, stamp, track_ids, means, variances):
+        """
+        Queue the tracks of one frame.
+
+        Args:
+            frame (int): frame number.
+            stamp (float): time of the frame in seconds.
+            track_ids (ndarray): (N,) ids of the tracks.
+            means (ndarray): (N, 4) boxes of the tracks.
+            variances (ndarray): (N, 4) variance of the boxes.
+        """
+        records = np.empty(len(track_ids), dtype=TRACK_RECORD)
+        records["frame"] = frame
+        records["stamp"] = stamp
+        records["track_id"] = track_ids
+        records["mean"] = np.asarray(means).reshape(-1, 4)
+        records["variance"] = np.asarray(variances).reshape(-1, 4)
+
+        with self._lock:
+            if self._closed:
+                raise ValueError("Write to a closed track log")
+            self._pending.append(records)
+            self._num_pending += len(records)
+            if self._num_pending >= self.max_pending:
+                self._wake.set()
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self._flush()
+
+    def _flush(self):
+        with self._lock:
+            pending, self._pending, self._num_pending = self._pending, [], 0
+        if not pending:
+            return
+        data = np.concatenate(pending).tobytes()
+        if self._file.tell() + len(data) > self.max_bytes and self._file.tell() > len(self._header):
+            self._file.close()
+            self._open()
+        self._file.write(data)
+        self._file.flush()
+
+    def close(self):
+        """Write the queued records and close the file."""
+        if self._closed:
+            return
+        with self._lock:
+            self._closed = True
+        self._wake.set()
+        self._thread.join()
+        self._flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_track_log(prefix):
+    """
+    Yield the records of every file of the log `prefix` as memory mapped
+    structured arrays, without loading the log. A partial last record (crash
+    while writing) is dropped.
+    """
+    for path in log_files(prefix):
+        with open(path, "rb") as f:
+            dtype, offset = _read_header(f)
+        count = (os.path.getsize(path) - offset) // dtype.itemsize
+        if count > 0:
+            yield np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+
+
+def read_track_log(prefix):
+    """
+    Returns:
+        ndarray: all the records of the log `prefix`, a structured array of `TRACK_RECORD`.
+    """
+    chunks = list(iter_track_log(prefix))
+    if not chunks:
+        return np.empty(0, dtype=TRACK_RECORD)
+    return np.concatenate(chunks)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("prefix", help="log path without the .<index>.trk suffix")
+    ap.add_argument("--csv", default=None, help="also export the records to this csv file")
+    args = ap.parse_args()
+
+    num_records, frames, track_ids = 0, set(), set()
+    for chunk in iter_track_log(args.prefix):
+        num_records += len(chunk)
+        frames.update(np.unique(chunk["frame"]).tolist())
+        track_ids.update(np.unique(chunk["track_id"]).tolist())
+    print("{} files, {} records, {} frames, {} tracks".format(
+        len(log_files(args.prefix)), num_records, len(frames), len(track_ids)))
+
+    if args.csv:
+        with open(args.csv, "w") as f:
+            f.write("frame,stamp,track_id,x1,y1,x2,y2,var_x1,var_y1,var_x2,var_y2\n")
+            for chunk in iter_track_log(args.prefix):
+                table = np.column_stack([chunk["frame"], chunk["stamp"], chunk["track_id"], chunk["mean"], chunk["variance"]])
+                np.savetxt(f, table, delimiter=",", fmt=["%d", "%.6f", "%d"] + ["%.4f"] * 8)
+
+
+if __name__ == "__main__":
+    main()
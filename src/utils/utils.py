@@ -60,10 +60,10 @@ def disk_logger(images, direc, instances=None, rpn_proposals=None, image_paths=N
 
         return output_images
 
-def single_disk_logger(img, instances=None, rpn_proposals=None, image_path=None):
+def single_disk_logger(img, instances=None, rpn_proposals=None, image_path=None, projection=None):
     img = img.cpu()
     img = toPIL(img)
-    img_visualizer = Visualizer(img, instances, image_path, None, cfg)
+    img_visualizer = Visualizer(img, instances, image_path, None, cfg, projection)
 
     if instances:
         img_visualizer.draw_instances()
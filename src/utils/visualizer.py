@@ -30,12 +30,17 @@ def fig2data(fig):
 class Visualizer(object):
     """docstring for Visualizer."""
 
-    def __init__(self, img, instances, img_path, rpn_proposals, cfg):
+    def __init__(self, img, instances, img_path, rpn_proposals, cfg, projection=None):
+        """
+        projection: optional (ground points, ground std) of the instances from `ground_project`,
+                    when the caller already has them. Computed by `draw_projection` otherwise.
+        """
         super(Visualizer, self).__init__()
         self.image = img
         self.proposals = rpn_proposals
         self.instances = instances
         self.path = img_path
+        self.projection = projection
         self.output = plt.figure(figsize=(16, 12), dpi=80, constrained_layout=True)
         widths_ratio = [3,1]
         self.grid_spec = self.output.add_gridspec(ncols=2, nrows=1, width_ratios=widths_ratio)
@@ -47,17 +52,23 @@ class Visualizer(object):
         img = self.image.copy()
         drawer = ImageDraw.Draw(img, mode=None)
 
-        for instance in self.instances:
-            box = instance.pred_boxes
+        arrays = self.instances.to_numpy()
+        boxes = arrays["pred_boxes"].tolist()
+
+        for box in boxes:
             drawer.rectangle(box, outline ='red',width=3)
-            if instance.has("pred_classes"):
-                drawer.text([box[0], box[1]-10],"{}: {:.2f}%".format(class_labels[instance.pred_classes],
-                instance.scores), outline='green')
-
-            if instance.has("pred_variance"):
-                sigma = np.sqrt(instance.pred_variance)
-                drawer.ellipse([box[0]-2*sigma[0], box[1]-2*sigma[1], box[0]+2*sigma[0], box[1]+2*sigma[1]], outline='blue', width=3)
-                drawer.ellipse([box[2]-2*sigma[2], box[3]-2*sigma[3], box[2]+2*sigma[2], box[3]+2*sigma[3]], outline='blue', width=3)
+
+        if "pred_classes" in arrays:
+            for box, label, score in zip(boxes, arrays["pred_classes"].tolist(), arrays["scores"].tolist()):
+                drawer.text([box[0], box[1]-10],"{}: {:.2f}%".format(class_labels[label], score), outline='green')
+
+        if "pred_variance" in arrays:
+            # 2 sigma ellipses around the top left and bottom right corners
+            corners = arrays["pred_boxes"].reshape(-1, 2, 2)
+            sigma = 2*np.sqrt(arrays["pred_variance"]).reshape(-1, 2, 2)
+            ellipses = np.concatenate([corners - sigma, corners + sigma], axis=2).reshape(-1, 4)
+            for ellipse in ellipses.tolist():
+                drawer.ellipse(ellipse, outline='blue', width=3)
         ax = self.output.add_subplot(self.grid_spec[0,0])
         ax.imshow(img)
 
@@ -71,8 +82,7 @@ class Visualizer(object):
         ax = self.output.add_subplot(1,2,1)
         ax.imshow(img)
 
-        for instance in self.instances:
-            box_cords = instance.pred_boxes
+        for box_cords in self.instances.to_numpy(["pred_boxes"])["pred_boxes"]:
             box = patches.Rectangle(box_cords[[0,3]], box_cords[2]-box_cords[0], box_cords[3]-box_cords[1], linewidth=1, fill=False, edgecolor='r')
             ax.add_patch(box)
         
@@ -85,7 +95,9 @@ class Visualizer(object):
             drawer.rectangle(box, outline ='red' ,width=3)
 
     def draw_projection(self):
-        xy_coords, variance = ground_project(self.instances, self.path)
+        if self.projection is None:
+            self.projection = ground_project(self.instances)
+        xy_coords, variance = self.projection
         ax = self.output.add_subplot(self.grid_spec[0,1])
 
         for xy, xy_var in zip(xy_coords, variance):
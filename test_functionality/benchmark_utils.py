@@ -0,0 +1,69 @@
+'''
+Timing and synthetic data helpers shared by the benchmarks of the
+components. They are imported from the repository root, which the scripts
+put on the path:
+
+sys.path.insert(1, '../..')
+from test_functionality.benchmark_utils import median_ms, random_boxes
+
+torch is only imported by the helpers that need it, so that the numpy
+benchmarks (e.g. tracker/) run without it.
+'''
+
+import time
+import numpy as np
+
+
+def sync(device):
+	if device is not None and device.type == 'cuda':
+		import torch
+		torch.cuda.synchronize()
+
+
+def median_ms(fn, repeats, device=None):
+	"""
+	Median time of `repeats` calls of fn, in ms. With a torch device, one more
+	warmup call is made and dropped, and cuda is synchronized around every call.
+	"""
+	warmup = 0 if device is None else 1
+	times = []
+	for _ in range(repeats + warmup):
+		sync(device)
+		start = time.perf_counter()
+		fn()
+		sync(device)
+		times.append(time.perf_counter() - start)
+	return 1000*np.median(times[warmup:])
+
+
+def random_boxes(n, rng, extent=1000, size=(10, 200)):
+	"""(n, 4) numpy boxes with their corner in [0, extent) and sides in `size`."""
+	xy = rng.uniform(0, extent, (n, 2))
+	return np.concatenate([xy, xy + rng.uniform(size[0], size[1], (n, 2))], axis=1)
+
+
+def random_image_boxes(n, generator, image_size=(375, 1242), corner=(0.8, 0.8), min_size=10, size=None):
+	"""
+	(n, 4) torch boxes in an image: the corner in the `corner` fractions of the
+	width and height, the sides min_size plus up to `size` (w, h), by default
+	a fifth of the image.
+	"""
+	import torch
+	h, w = image_size
+	size = (w*0.2, h*0.2) if size is None else size
+	xy = torch.rand(n, 2, generator=generator)*torch.tensor([w*corner[0], h*corner[1]])
+	wh = min_size + torch.rand(n, 2, generator=generator)*torch.tensor([float(size[0]), float(size[1])])
+	return torch.cat([xy, xy + wh], dim=1)
+
+
+def synthetic_instances(n, rng, num_classes, image_size=(375, 1242)):
+	"""Detections of a frame, with variances, as returned by the model."""
+	import torch
+	from src.utils import Boxes, Instances
+	h, w = image_size
+	xy = rng.uniform(0, 1, (n, 2))*[w*0.8, h*0.5]
+	boxes = np.concatenate([xy, xy + rng.uniform(20, 150, (n, 2))], axis=1)
+	return Instances(image_size, pred_boxes=Boxes(torch.from_numpy(boxes)),
+					 pred_variance=torch.from_numpy(rng.uniform(1, 30, (n, 4))),
+					 scores=torch.from_numpy(rng.uniform(0.5, 1, n)),
+					 pred_classes=torch.from_numpy(rng.randint(num_classes, size=n)))
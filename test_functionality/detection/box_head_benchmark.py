@@ -0,0 +1,126 @@
+'''
+Comparison of the box heads (cfg.ROI_HEADS.BOX_HEAD): parameters, per-ROI latency,
+and, for trained checkpoints, KITTI mAP and the Gaussian NLL of the matched
+detections under their predicted variance.
+
+Without checkpoints only the heads built from the default config are timed:
+python box_head_benchmark.py --num_rois 1000 --threads 4
+
+With checkpoints (e.g. one trained with BOX_HEAD = 'FC' and one with 'LIGHT'):
+python box_head_benchmark.py -mp fc/epoch_00050.model light/epoch_00050.model -n 500
+'''
+
+import sys
+import time
+import argparse
+import numpy as np
+import torch
+
+## Inserting path of src directory
+sys.path.insert(1, '../..')
+from model import create_model
+from src.config import Cfg as cfg
+from src.datasets import KittiDataset, kitti_collate_fn
+from src.detection.fast_rcnn import BOX_HEADS, build_box_predictor
+from src.eval.detection_map import DetectionMAP
+from src.utils import utils, pairwise_iou
+
+
+def time_head(box_predictor, num_rois, channels, repeats):
+	box_predictor.eval()
+	device = next(box_predictor.parameters()).device
+	x = torch.randn(num_rois, channels, 7, 7, device=device)
+	times = []
+	with torch.no_grad():
+		for _ in range(repeats + 1):
+			if device.type == 'cuda':
+				torch.cuda.synchronize()
+			start = time.perf_counter()
+			box_predictor(x)
+			if device.type == 'cuda':
+				torch.cuda.synchronize()
+			times.append(time.perf_counter() - start)
+	return 1000*np.median(times[1:])
+
+
+def count_parameters(module):
+	return sum(p.numel() for p in module.parameters())
+
+
+def gaussian_nll(pred_boxes, pred_variance, gt_boxes):
+	"""
+	NLL per box of the gt coordinates under independent Gaussians on the 4 predicted coordinates.
+	"""
+	variance = pred_variance.clamp(min=1e-6)
+	return 0.5*(torch.log(2*np.pi*variance) + (gt_boxes - pred_boxes)**2/variance).sum(dim=1)
+
+
+def evaluate(model, loader, num_images, iou_threshold=0.5):
+	device = next(model.parameters()).device
+	mAP = DetectionMAP(model.cfg.INPUT.NUM_CLASSES)
+	nll = []
+	with torch.no_grad():
+		for idx, batch_sample in enumerate(loader):
+			if idx >= num_images:
+				break
+			in_images = batch_sample['image'].to(device)
+			_, instances, _, _ = model(in_images, None, False)
+			for instance, target in zip(instances, batch_sample['target']):
+				target = target.to(device)
+				mAP.evaluate(instance.pred_boxes.tensor.cpu().numpy(), instance.pred_classes.cpu().numpy(),
+							 instance.scores.cpu().numpy(), target.gt_boxes.tensor.cpu().numpy(),
+							 target.gt_classes.cpu().numpy())
+
+				if len(instance) == 0 or len(target) == 0:
+					continue
+				# Every detection is scored against its best overlapping gt box
+				iou = pairwise_iou(instance.pred_boxes, target.gt_boxes)
+				best_iou, best_gt = iou.max(dim=1)
+				matched = best_iou >= iou_threshold
+				if matched.any():
+					nll.append(gaussian_nll(instance.pred_boxes.tensor[matched], instance.pred_variance[matched],
+											target.gt_boxes.tensor[best_gt[matched]]).cpu())
+
+	nll = torch.cat(nll).mean().item() if nll else float('nan')
+	return mAP.compute_map()[0], nll
+
+
+ap = argparse.ArgumentParser()
+ap.add_argument("-mp", "--model_paths", nargs="*", default=[], help="checkpoints to compare")
+ap.add_argument("-n", "--num_images", type=int, default=500)
+ap.add_argument("--num_rois", type=int, default=1000, help="ROIs per timing run, POST_NMS_TOPK_TEST by default")
+ap.add_argument("--repeats", type=int, default=10)
+ap.add_argument("--threads", type=int, default=0, help="torch CPU threads, 0 keeps the default")
+ap.add_argument("--channels", type=int, default=1024, help="backbone channels when no checkpoint is given")
+args = ap.parse_args()
+
+if args.threads > 0:
+	torch.set_num_threads(args.threads)
+
+print("{:<40} {:>12} {:>14} {:>14} {:>8} {:>8}".format("head", "params", "latency (ms)", "us / ROI", "mAP", "NLL"))
+
+if not args.model_paths:
+	cfg.defrost()
+	for name in BOX_HEADS:
+		cfg.ROI_HEADS.BOX_HEAD = name
+		box_predictor = build_box_predictor(cfg, (args.channels, 7, 7), cfg.INPUT.NUM_CLASSES, cfg.ROI_HEADS.CLS_AGNOSTIC_BBOX_REG)
+		ms = time_head(box_predictor, args.num_rois, args.channels, args.repeats)
+		print("{:<40} {:>12d} {:>14.2f} {:>14.2f} {:>8} {:>8}".format(name, count_parameters(box_predictor), ms,
+			1000*ms/args.num_rois, "-", "-"))
+
+for model_path in args.model_paths:
+	model = create_model(model_path)
+	model.eval()
+	box_predictor = model.detector.box_predictor
+	ms = time_head(box_predictor, args.num_rois, model.backbone.out_channels, args.repeats)
+
+	dataset = KittiDataset(model.cfg.PATH.DATASET, transform=utils.image_transform(model.cfg), cfg=model.cfg)
+	train_len = int(model.cfg.TRAIN.DATASET_DIVIDE*len(dataset))
+	_, val_dataset = torch.utils.data.random_split(dataset, [train_len, len(dataset) - train_len],
+		generator=torch.Generator().manual_seed(model.cfg.RANDOMIZATION.SEED))
+	loader = torch.utils.data.DataLoader(val_dataset, batch_size=1, collate_fn=kitti_collate_fn)
+	mean_ap, nll = evaluate(model, loader, args.num_images)
+
+	name = "{} ({})".format(model.cfg.ROI_HEADS.BOX_HEAD, model_path)
+	print("{:<40} {:>12d} {:>14.2f} {:>14.2f} {:>8.4f} {:>8.3f}".format(name[-40:], count_parameters(box_predictor), ms,
+		1000*ms/args.num_rois, mean_ap, nll))
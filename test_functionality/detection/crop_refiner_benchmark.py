@@ -0,0 +1,51 @@
+'''
+Per frame cost of re-detecting N tracked objects with the CropRefiner
+(src/detection/crop_refiner.py) against full-frame inference of the model, on
+a KITTI sized image. The weights do not matter for the timing, a randomly
+initialized model is used unless a checkpoint is given.
+
+python crop_refiner_benchmark.py --objects 1 5 10 20 50 --crop-size 192 --repeats 20
+'''
+
+import sys
+import argparse
+import torch
+
+## Inserting path of src directory
+sys.path.insert(1, '../..')
+from model import create_model
+from src.config import Cfg as cfg
+from src.architecture import FasterRCNN
+from src.detection.crop_refiner import CropRefiner
+from test_functionality.benchmark_utils import median_ms, random_image_boxes
+
+
+ap = argparse.ArgumentParser()
+ap.add_argument("-mp", "--model_path", default=None, help="checkpoint, random weights if not given")
+ap.add_argument("--objects", type=int, nargs="+", default=[1, 5, 10, 20, 50])
+ap.add_argument("--crop-size", type=int, default=cfg.TRACKING.CROP_REFINE.CROP_SIZE)
+ap.add_argument("--repeats", type=int, default=20)
+args = ap.parse_args()
+
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+if args.model_path:
+	model = create_model(args.model_path)
+else:
+	model = FasterRCNN(cfg).to(device)
+model.eval()
+refine = model.cfg.TRACKING.CROP_REFINE
+refiner = CropRefiner(model, args.crop_size, refine.PADDING, 0.0, refine.BATCH_SIZE)
+
+g = torch.Generator().manual_seed(0)
+image = torch.randn(1, 3, 375, 1242, generator=g).to(device)
+
+with torch.no_grad():
+	t_full = median_ms(lambda: model(image, is_training=False), args.repeats, device)
+	print("Full frame: {:.2f} ms".format(t_full))
+	print("{:<8} {:>12} {:>14}".format("objects", "crops (ms)", "vs full frame"))
+	for n in args.objects:
+		boxes = random_image_boxes(n, g, corner=(0.8, 0.6), min_size=20, size=(180, 120)).to(device)
+		refined = refiner(image, boxes)
+		assert len(refined) == n # score_thresh 0 keeps every box
+		t_crop = median_ms(lambda: refiner(image, boxes), args.repeats, device)
+		print("{:<8} {:>12.2f} {:>13.2f}x".format(n, t_crop, t_crop/t_full))
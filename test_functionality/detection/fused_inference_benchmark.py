@@ -0,0 +1,95 @@
+'''
+Benchmark of FastRCNNOutputs.inference with the fused, filter-first decoding
+against the decode-everything path, on synthetic box head outputs where only a
+small fraction of the rows passes SCORE_THRESH_TEST.
+
+python fused_inference_benchmark.py --images 2 --rois 1000 --pass-fraction 0.01 0.05 0.2
+'''
+
+import sys
+import time
+import argparse
+import numpy as np
+import torch
+
+## Inserting path of src directory
+sys.path.insert(1, '../..')
+from src.config import Cfg as cfg
+from src.detection.fast_rcnn import FastRCNNOutputs
+from src.utils import Boxes, Instances, Box2BoxXYXYTransform
+
+
+def synthetic_outputs(num_images, num_rois, num_classes, pass_fraction, score_thresh, device, image_size=(375, 1242), seed=0):
+	"""
+	Random proposals and head outputs. A `pass_fraction` of the rows gets a
+	foreground logit high enough to pass `score_thresh`, the rest is background.
+	"""
+	g = torch.Generator().manual_seed(seed)
+	h, w = image_size
+	proposals = []
+	for _ in range(num_images):
+		xy = torch.rand(num_rois, 2, generator=g)*torch.tensor([w*0.8, h*0.8])
+		wh = 10 + torch.rand(num_rois, 2, generator=g)*torch.tensor([w*0.2, h*0.2])
+		p = Instances(image_size)
+		p.proposal_boxes = Boxes(torch.cat([xy, xy + wh], dim=1).to(device))
+		proposals.append(p)
+
+	num_pred = num_images*num_rois
+	logits = torch.randn(num_pred, num_classes + 1, generator=g)
+	logits[:, -1] += 4.0
+	passing = torch.rand(num_pred, generator=g) < pass_fraction
+	cls = torch.randint(num_classes, (num_pred,), generator=g)
+	logits[passing, cls[passing]] += 8.0 + np.log(1.0/(1.0 - score_thresh))
+
+	deltas = 0.1*torch.randn(num_pred, 4, generator=g)
+	variance = 0.01 + torch.rand(num_pred, 4, generator=g)
+	return logits.to(device), deltas.to(device), variance.to(device), proposals
+
+
+def time_inference(outputs, fused, repeats):
+	times = []
+	for _ in range(repeats + 1):
+		if outputs.pred_class_logits.is_cuda:
+			torch.cuda.synchronize()
+		start = time.perf_counter()
+		instances, kept = outputs.inference(cfg.ROI_HEADS.SCORE_THRESH_TEST, cfg.ROI_HEADS.NMS_THRESH_TEST,
+											cfg.TEST.DETECTIONS_PER_IMAGE, fused=fused)
+		if outputs.pred_class_logits.is_cuda:
+			torch.cuda.synchronize()
+		times.append(time.perf_counter() - start)
+	return instances, kept, 1000*np.median(times[1:])
+
+
+def same_results(a, b):
+	for x, y in zip(a, b):
+		if len(x) != len(y):
+			return False
+		if not (torch.allclose(x.pred_boxes.tensor, y.pred_boxes.tensor, atol=1e-4)
+				and torch.allclose(x.pred_variance, y.pred_variance, rtol=1e-4, atol=1e-6)
+				and torch.equal(x.pred_classes, y.pred_classes)):
+			return False
+	return True
+
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--images", type=int, default=2)
+ap.add_argument("--rois", type=int, default=1000, help="proposals per image, POST_NMS_TOPK_TEST")
+ap.add_argument("--pass-fraction", type=float, nargs="+", default=[0.01, 0.05, 0.2])
+ap.add_argument("--repeats", type=int, default=20)
+ap.add_argument("--device", default="cpu")
+args = ap.parse_args()
+
+box2box_transform = Box2BoxXYXYTransform(weights=cfg.ROI_HEADS.BBOX_REG_WEIGHTS)
+
+print("{:>9} {:>8} {:>12} {:>12} {:>9} {:>10}".format("pass", "dets", "full (ms)", "fused (ms)", "speedup", "identical"))
+for fraction in args.pass_fraction:
+	logits, deltas, variance, proposals = synthetic_outputs(args.images, args.rois, cfg.INPUT.NUM_CLASSES, fraction,
+		cfg.ROI_HEADS.SCORE_THRESH_TEST, args.device)
+	outputs = FastRCNNOutputs(box2box_transform, logits, deltas, variance, proposals, cfg.ROI_HEADS.SMOOTH_L1_BETA)
+
+	with torch.no_grad():
+		full, _, full_ms = time_inference(outputs, False, args.repeats)
+		fused, _, fused_ms = time_inference(outputs, True, args.repeats)
+
+	print("{:>9.3f} {:>8d} {:>12.3f} {:>12.3f} {:>9.2f} {:>10}".format(fraction, sum(len(x) for x in fused),
+		full_ms, fused_ms, full_ms/fused_ms, str(same_results(full, fused))))
@@ -0,0 +1,93 @@
+'''
+Recall of the RPN proposals against the number of proposals sent to the box head,
+and the operating point of every adaptive proposal budget mode
+(cfg.ROI_HEADS.PROPOSAL_BUDGET).
+
+python proposal_budget_eval.py -mp /path/to/epoch_00050.model -n 500
+'''
+
+import sys
+import argparse
+import numpy as np
+import torch
+import matplotlib
+matplotlib.use('agg')
+import matplotlib.pyplot as plt
+
+## Inserting path of src directory
+sys.path.insert(1, '../..')
+from model import create_model
+from src.datasets import KittiDataset, kitti_collate_fn
+from src.detection.proposal_utils import proposal_budget
+from src.utils import utils, pairwise_iou
+
+
+ap = argparse.ArgumentParser()
+ap.add_argument("-mp", "--model_path", required=True, help="checkpoint to evaluate")
+ap.add_argument("-n", "--num_images", type=int, default=500)
+ap.add_argument("-iou", "--iou", type=float, default=0.5, help="IoU for a gt box to count as recalled")
+ap.add_argument("-o", "--output", default="proposal_recall.png")
+args = ap.parse_args()
+
+model = create_model(args.model_path)
+cfg = model.cfg
+device = next(model.parameters()).device
+budget = cfg.ROI_HEADS.PROPOSAL_BUDGET
+
+dataset = KittiDataset(cfg.PATH.DATASET, transform=utils.image_transform(cfg), cfg=cfg)
+loader = torch.utils.data.DataLoader(dataset, batch_size=1, shuffle=False, collate_fn=kitti_collate_fn)
+
+ks = np.unique(np.round(np.logspace(0, np.log10(cfg.RPN.POST_NMS_TOPK_TEST), 30)).astype(int))
+modes = ['mass', 'logit', 'knee']
+
+num_gt = 0
+recalled_at_k = np.zeros(len(ks))
+mode_k = {m: [] for m in modes}
+mode_recalled = {m: 0 for m in modes}
+
+with torch.no_grad():
+	for idx, batch_sample in enumerate(loader):
+		if idx >= args.num_images:
+			break
+		in_images = batch_sample['image'].to(device)
+		target = batch_sample['target'][0].to(device)
+
+		feature_map = model.backbone(in_images)
+		proposals, _ = model.rpn(feature_map, None, in_images.shape[-2:], False)
+		proposals = proposals[0]
+
+		iou = pairwise_iou(target.gt_boxes, proposals.proposal_boxes) # G x P, proposals sorted by objectness
+		# first proposal rank at which each gt box is recalled
+		hit = iou >= args.iou
+		first_hit = torch.where(hit.any(dim=1), hit.float().argmax(dim=1), torch.full_like(hit[:, 0], len(proposals), dtype=torch.long))
+		first_hit = first_hit.cpu().numpy()
+
+		num_gt += len(first_hit)
+		recalled_at_k += (first_hit[None, :] < ks[:, None]).sum(axis=1)
+
+		for m in modes:
+			k = proposal_budget(proposals.objectness_logits, m, budget.MIN_PROPOSALS, budget.MAX_PROPOSALS,
+								budget.MASS_FRACTION, budget.MIN_LOGIT, budget.KNEE_SCALE)
+			mode_k[m].append(k)
+			mode_recalled[m] += (first_hit < k).sum()
+
+recall = recalled_at_k/max(num_gt, 1)
+
+print("Number of gt boxes: {}".format(num_gt))
+print("{:>10} {:>8}".format("proposals", "recall"))
+for k, r in zip(ks, recall):
+	print("{:>10d} {:>8.4f}".format(k, r))
+
+print("\n{:<6} {:>10} {:>10} {:>10} {:>8}".format("mode", "mean k", "median k", "max k", "recall"))
+for m in modes:
+	print("{:<6} {:>10.1f} {:>10.0f} {:>10d} {:>8.4f}".format(m, np.mean(mode_k[m]), np.median(mode_k[m]),
+		int(np.max(mode_k[m])), mode_recalled[m]/max(num_gt, 1)))
+
+fig, ax = plt.subplots()
+ax.semilogx(ks, recall, label='fixed top-k')
+for m in modes:
+	ax.plot(np.mean(mode_k[m]), mode_recalled[m]/max(num_gt, 1), 'o', label=m)
+ax.set_xlabel('Proposals per image')
+ax.set_ylabel('Recall @ IoU {}'.format(args.iou))
+ax.legend()
+fig.savefig(args.output)
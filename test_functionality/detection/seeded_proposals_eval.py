@@ -0,0 +1,101 @@
+'''
+Recall and latency of the detector against the number of RPN proposals, with
+and without the predicted boxes of the confirmed tracks as extra proposals
+(cfg.TRACKING.SEED_PROPOSALS). The frames of a KITTI tracking sequence are run
+in order through the detector and a MultiObjTracker. "tracked recall" is the
+recall of the gt objects that were already detected in the previous frame,
+the ones a seed can cover. "no-track recall" is the recall on the frames
+without any confirmed track, where the seeded runs fall back to the RPN budget
+of cfg.RPN.PRE_NMS_TOPK_TEST/POST_NMS_TOPK_TEST, as FasterRCNN.forward does.
+
+python seeded_proposals_eval.py -mp /path/to/epoch_00050.model -s 0001 -k 1000 300 100 50
+'''
+
+import sys
+import time
+import argparse
+import numpy as np
+import torch
+
+## Inserting path of src directory
+sys.path.insert(1, '../..')
+from model import create_model
+from src.datasets import KittiMOTDataset, kitti_collate_fn
+from src.tracker.track import build_tracker
+from src.utils import utils, Boxes, pairwise_iou
+
+
+ap = argparse.ArgumentParser()
+ap.add_argument("-mp", "--model_path", required=True, help="checkpoint to evaluate")
+ap.add_argument("-s", "--sequence", default="0001", help="KITTI tracking training sequence")
+ap.add_argument("-k", "--post_nms_topk", type=int, nargs="+", default=[1000, 300, 100, 50])
+ap.add_argument("-iou", "--iou", type=float, default=0.5, help="IoU for a gt box to count as recalled")
+args = ap.parse_args()
+
+model = create_model(args.model_path)
+model.eval()
+cfg = model.cfg
+device = next(model.parameters()).device
+
+dataset = KittiMOTDataset(cfg.PATH.DATASET, track=args.sequence, transform=utils.image_transform(cfg), cfg=cfg)
+loader = torch.utils.data.DataLoader(dataset, batch_size=1, shuffle=False, collate_fn=kitti_collate_fn)
+frames = [(batch_sample['image'].to(device), batch_sample['target'][0].to(device)) for batch_sample in loader]
+
+
+def synchronize():
+	if device.type == "cuda":
+		torch.cuda.synchronize()
+
+
+def run(post_nms_topk, seeded):
+	tracker = build_tracker(cfg, max_age=1)
+	pre_nms_topk = max(cfg.TRACKING.SEEDED_PRE_NMS_TOPK, post_nms_topk)
+	num_gt, recalled, num_tracked_gt, tracked_recalled = 0, 0, 0, 0
+	num_untracked_gt, untracked_recalled = 0, 0
+	num_seeds, times = 0, []
+	detected_ids = set()
+
+	with torch.no_grad():
+		for in_images, target in frames:
+			synchronize()
+			start = time.perf_counter()
+			tracker.predict()
+			confirmed = tracker.confirmed_boxes()
+			seed_boxes = [Boxes(torch.from_numpy(confirmed).float())] if seeded else None
+			if seeded and len(confirmed) == 0:
+				topk = (cfg.RPN.PRE_NMS_TOPK_TEST, cfg.RPN.POST_NMS_TOPK_TEST)
+			else:
+				topk = (pre_nms_topk, post_nms_topk)
+			feature_map = model.backbone(in_images)
+			proposals, _ = model.rpn(feature_map, None, in_images.shape[-2:], False, *topk)
+			instances, _ = model.detector(feature_map, proposals, None, False, None, seed_boxes)
+			detections = instances[0].to_numpy(["pred_boxes", "pred_variance"])
+			tracker.update(detections["pred_boxes"], detections["pred_variance"])
+			synchronize()
+			times.append(time.perf_counter() - start)
+
+			num_seeds += model.detector.num_seeds[0]
+			iou = pairwise_iou(target.gt_boxes, instances[0].pred_boxes)
+			hit = (iou >= args.iou).any(dim=1).cpu().numpy() if iou.numel() else np.zeros(len(target), dtype=bool)
+			ids = target.gt_trackid.cpu().numpy()
+			was_detected = np.array([i in detected_ids for i in ids.tolist()], dtype=bool)
+
+			num_gt += len(hit)
+			recalled += hit.sum()
+			num_tracked_gt += was_detected.sum()
+			tracked_recalled += (hit & was_detected).sum()
+			if len(confirmed) == 0:
+				num_untracked_gt += len(hit)
+				untracked_recalled += hit.sum()
+			detected_ids = set(ids[hit].tolist())
+
+	return (recalled/max(num_gt, 1), tracked_recalled/max(num_tracked_gt, 1), untracked_recalled/max(num_untracked_gt, 1),
+			num_seeds/max(len(frames), 1), 1000*np.median(times))
+
+
+print("Sequence {}: {} frames".format(args.sequence, len(frames)))
+print("{:>10} {:>7} {:>8} {:>15} {:>16} {:>7} {:>10}".format("proposals", "seeded", "recall", "tracked recall", "no-track recall", "seeds", "ms/frame"))
+for k in args.post_nms_topk:
+	for seeded in [False, True]:
+		recall, tracked_recall, untracked_recall, seeds, ms = run(k, seeded)
+		print("{:>10d} {:>7} {:>8.4f} {:>15.4f} {:>16.4f} {:>7.1f} {:>10.2f}".format(k, str(seeded), recall, tracked_recall, untracked_recall, seeds, ms))
@@ -0,0 +1,126 @@
+'''
+Time of the detector part of a training step (proposal sampling, box head,
+losses, backward) with and without the detection inference that used to run
+in every training step, on random features and synthetic proposals. The
+batched proposal sampling is also compared with the former per-image loop,
+which must give the same numbers of foreground and background samples.
+
+python train_step_benchmark.py --batch 10 --repeats 10 --device cuda
+'''
+
+import sys
+import time
+import argparse
+import numpy as np
+import torch
+
+## Inserting path of src directory
+sys.path.insert(1, '../..')
+from src.config import Cfg as cfg
+from src.detection import Detector
+from src.utils import Boxes, Instances, pairwise_iou, subsample_labels
+from test_functionality.benchmark_utils import median_ms, random_image_boxes, sync
+
+
+def synthetic_batch(num_images, num_proposals, num_gt, image_size, device, seed=0):
+	g = torch.Generator().manual_seed(seed)
+
+	proposals, targets = [], []
+	for _ in range(num_images):
+		p = Instances(image_size)
+		p.proposal_boxes = Boxes(random_image_boxes(num_proposals, g, image_size).to(device))
+		p.objectness_logits = torch.randn(num_proposals, generator=g).to(device)
+		proposals.append(p)
+
+		t = Instances(image_size)
+		t.gt_boxes = Boxes(random_image_boxes(num_gt, g, image_size).to(device))
+		t.gt_classes = torch.randint(cfg.INPUT.NUM_CLASSES, (num_gt,), generator=g).to(device)
+		targets.append(t)
+	return proposals, targets
+
+
+def per_image_sampling(detector, proposals, targets):
+	"""
+	The former Detector.label_and_sample_proposals: matching and sampling one image
+	at a time. Returns the sampled gt_classes of every image.
+	"""
+	sampled_classes = []
+	for proposals_per_image, targets_per_image in zip(proposals, targets):
+		boxes = proposals_per_image.proposal_boxes
+		if detector.proposal_append_gt:
+			boxes = Boxes(torch.cat([boxes.tensor, targets_per_image.gt_boxes.tensor]))
+		match_quality_matrix = pairwise_iou(targets_per_image.gt_boxes, boxes)
+		matched_idxs, matched_labels = detector.proposal_matcher(match_quality_matrix)
+
+		gt_classes = targets_per_image.gt_classes[matched_idxs]
+		gt_classes[matched_labels == 0] = detector.num_classes
+		gt_classes[matched_labels == -1] = -1
+		sampled_fg_idxs, sampled_bg_idxs = subsample_labels(
+			gt_classes, detector.batch_size_per_image, detector.positive_sample_fraction, detector.num_classes
+		)
+		sampled_classes.append(gt_classes[torch.cat([sampled_fg_idxs, sampled_bg_idxs])])
+	return sampled_classes
+
+
+def batched_sampling(detector, proposals, targets):
+	sampled = detector.label_and_sample_proposals(proposals, targets)
+	return sampled.gt_classes.split(sampled.num_instances)
+
+
+def sample_counts(sampled_classes, num_classes):
+	"""(foreground, background) samples of every image."""
+	return [(int(((c >= 0) & (c < num_classes)).sum()), int((c == num_classes).sum())) for c in sampled_classes]
+
+
+def time_step(detector, features, proposals, targets, return_detections, repeats):
+	device = features.device
+	times = {'sample': [], 'step': []}
+	for _ in range(repeats + 1):
+		sync(device)
+		start = time.perf_counter()
+		detector.label_and_sample_proposals(proposals, targets)
+		sync(device)
+		times['sample'].append(time.perf_counter() - start)
+
+		start = time.perf_counter()
+		_, losses = detector(features, proposals, targets, True, return_detections)
+		sum(losses.values()).backward()
+		sync(device)
+		times['step'].append(time.perf_counter() - start)
+	return {k: 1000*np.median(v[1:]) for k, v in times.items()}
+
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--batch", type=int, default=cfg.TRAIN.BATCH_SIZE)
+ap.add_argument("--proposals", type=int, default=cfg.RPN.POST_NMS_TOPK_TRAIN)
+ap.add_argument("--gt", type=int, default=10, help="gt boxes per image")
+ap.add_argument("--channels", type=int, default=1024)
+ap.add_argument("--repeats", type=int, default=10)
+ap.add_argument("--device", default="cpu")
+args = ap.parse_args()
+
+device = torch.device(args.device)
+image_size = (375, 1242)
+stride = 16
+
+detector = Detector(cfg, stride, args.channels).to(device)
+detector.train()
+features = torch.randn(args.batch, args.channels, image_size[0]//stride, image_size[1]//stride, device=device)
+proposals, targets = synthetic_batch(args.batch, args.proposals, args.gt, image_size, device)
+
+counts_loop = sample_counts(per_image_sampling(detector, proposals, targets), detector.num_classes)
+counts_batched = sample_counts(batched_sampling(detector, proposals, targets), detector.num_classes)
+assert counts_loop == counts_batched, (counts_loop, counts_batched)
+fg, bg = np.sum(counts_loop, axis=0)
+print("samples per batch: {} foreground, {} background, same for both samplers".format(fg, bg))
+
+t_loop = median_ms(lambda: per_image_sampling(detector, proposals, targets), args.repeats, device)
+t_batched = median_ms(lambda: batched_sampling(detector, proposals, targets), args.repeats, device)
+print("{:<26} {:>14.2f}".format("per-image sampling (ms)", t_loop))
+print("{:<26} {:>14.2f} ({:.1f}x)".format("batched sampling (ms)", t_batched, t_loop/t_batched))
+print()
+
+print("{:<26} {:>14} {:>14}".format("", "sampling (ms)", "step (ms)"))
+for name, return_detections in [("losses + inference", True), ("losses only", False)]:
+	t = time_step(detector, features, proposals, targets, return_detections, args.repeats)
+	print("{:<26} {:>14.2f} {:>14.2f}".format(name, t['sample'], t['step']))
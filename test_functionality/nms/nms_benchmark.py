@@ -0,0 +1,101 @@
+'''
+Benchmark of the NMS backends in src/nms/engine.py on RPN sized inputs,
+with an equivalence report against torchvision. Fails if a backend keeps
+every box, i.e. does not suppress anything.
+
+python nms_benchmark.py --counts 6000 12000 --device cpu
+'''
+
+import sys
+import time
+import argparse
+import numpy as np
+import torch
+
+## Inserting path of src directory
+sys.path.insert(1, '../..')
+from src.nms import build_nms_engine
+from src.nms.engine import NMS_BACKENDS
+
+
+def synthetic_proposals(num_boxes, num_objects=30, image_size=(375, 1242), seed=0):
+	"""
+	RPN-like proposals: most boxes are jittered copies of a few objects, the
+	rest is background clutter. Scores are higher for boxes close to an object.
+	"""
+	rng = np.random.RandomState(seed)
+	h, w = image_size
+
+	centers = rng.uniform([0, 0], [w, h], size=(num_objects, 2))
+	sizes = rng.uniform([20, 20], [300, 200], size=(num_objects, 2))
+
+	num_clustered = int(0.7*num_boxes)
+	obj = rng.randint(num_objects, size=num_clustered)
+	jitter = rng.normal(scale=0.15, size=(num_clustered, 4))
+	ctr = centers[obj] + jitter[:, :2]*sizes[obj]
+	wh = sizes[obj]*np.exp(jitter[:, 2:])
+	clustered = np.concatenate([ctr - wh/2, ctr + wh/2], axis=1)
+	clustered_scores = 1.0 - np.abs(jitter).mean(axis=1)
+
+	num_clutter = num_boxes - num_clustered
+	ctr = rng.uniform([0, 0], [w, h], size=(num_clutter, 2))
+	wh = rng.uniform([10, 10], [400, 300], size=(num_clutter, 2))
+	clutter = np.concatenate([ctr - wh/2, ctr + wh/2], axis=1)
+	clutter_scores = rng.uniform(0, 0.5, size=num_clutter)
+
+	boxes = np.concatenate([clustered, clutter], axis=0)
+	boxes[:, 0::2] = boxes[:, 0::2].clip(0, w)
+	boxes[:, 1::2] = boxes[:, 1::2].clip(0, h)
+	scores = np.concatenate([clustered_scores, clutter_scores]) + rng.uniform(0, 1e-3, size=num_boxes)
+
+	return torch.tensor(boxes, dtype=torch.float32), torch.tensor(scores, dtype=torch.float32)
+
+
+def time_engine(engine, boxes, scores, idxs, iou_threshold, max_output, repeats):
+	times = []
+	for _ in range(repeats):
+		if boxes.is_cuda:
+			torch.cuda.synchronize()
+		start = time.perf_counter()
+		keep = engine(boxes, scores, idxs, iou_threshold, max_output=max_output)
+		if boxes.is_cuda:
+			torch.cuda.synchronize()
+		times.append(time.perf_counter() - start)
+	return keep, 1000*np.median(times)
+
+
+def compare(keep, reference):
+	"""
+	Returns (same output, Jaccard index between the kept sets).
+	"""
+	keep, reference = keep.cpu().tolist(), reference.cpu().tolist()
+	union = len(set(keep) | set(reference))
+	jaccard = len(set(keep) & set(reference))/union if union else 1.0
+	return keep == reference, jaccard
+
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--counts", type=int, nargs="+", default=[6000, 12000], help="pre NMS proposal counts")
+ap.add_argument("--iou", type=float, default=0.7, help="NMS threshold (RPN.NMS_THRESH)")
+ap.add_argument("--post-topk", type=int, default=-1, help="max kept boxes, e.g. RPN.POST_NMS_TOPK_TEST")
+ap.add_argument("--repeats", type=int, default=5)
+ap.add_argument("--device", default="cpu")
+args = ap.parse_args()
+
+print("{:<8} {:<12} {:>10} {:>8} {:>10} {:>9}".format("boxes", "backend", "time(ms)", "kept", "identical", "jaccard"))
+for count in args.counts:
+	boxes, scores = synthetic_proposals(count)
+	boxes, scores = boxes.to(args.device), scores.to(args.device)
+	idxs = torch.zeros(count, dtype=torch.int64, device=args.device)
+
+	reference = None
+	for name in NMS_BACKENDS:
+		engine = build_nms_engine(name)
+		keep, ms = time_engine(engine, boxes, scores, idxs, args.iou, args.post_topk, args.repeats)
+		if reference is None:
+			reference = keep
+		identical, jaccard = compare(keep, reference)
+		print("{:<8d} {:<12} {:>10.2f} {:>8d} {:>10} {:>9.4f}".format(count, name, ms, len(keep), str(identical), jaccard))
+
+		uncapped = keep if args.post_topk < 0 else engine(boxes, scores, idxs, args.iou)
+		assert len(uncapped) < count, "{} suppressed nothing".format(name)
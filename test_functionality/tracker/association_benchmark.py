@@ -0,0 +1,69 @@
+'''
+Time of the IoU association of MultiObjTracker between N tracks and N
+detections: the former double loop over pairs with membership scans for the
+unmatched sets, against the vectorized IoU matrix and array set operations.
+Both are checked to give the same matches.
+
+python association_benchmark.py --objects 10 100 500 --repeats 20
+'''
+
+import sys
+import argparse
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+## Inserting path of src directory
+sys.path.insert(1, '../..')
+from src.tracker.track import MultiObjTracker
+from test_functionality.benchmark_utils import median_ms, random_boxes
+
+
+def pair_iou(bb_test, bb_gt):
+	xx1 = np.maximum(bb_test[0], bb_gt[0])
+	yy1 = np.maximum(bb_test[1], bb_gt[1])
+	xx2 = np.minimum(bb_test[2], bb_gt[2])
+	yy2 = np.minimum(bb_test[3], bb_gt[3])
+	wh = np.maximum(0., xx2 - xx1) * np.maximum(0., yy2 - yy1)
+	return wh / ((bb_test[2]-bb_test[0])*(bb_test[3]-bb_test[1]) + (bb_gt[2]-bb_gt[0])*(bb_gt[3]-bb_gt[1]) - wh)
+
+
+def loop_association(detections, trackers, iou_threshold=0.3):
+	iou_matrix = np.zeros((len(detections), len(trackers)))
+	for d, det in enumerate(detections):
+		for t, trk in enumerate(trackers):
+			iou_matrix[d, t] = pair_iou(det, trk)
+	matched_indices = np.stack(linear_sum_assignment(-iou_matrix), axis=1)
+
+	unmatched_detections = [d for d in range(len(detections)) if d not in matched_indices[:, 0]]
+	unmatched_trackers = [t for t in range(len(trackers)) if t not in matched_indices[:, 1]]
+	matches = []
+	for m in matched_indices:
+		if iou_matrix[m[0], m[1]] < iou_threshold:
+			unmatched_detections.append(m[0])
+			unmatched_trackers.append(m[1])
+		else:
+			matches.append(m[[1, 0]])
+	return np.array(matches).reshape(-1, 2), sorted(unmatched_trackers), sorted(unmatched_detections)
+
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--objects", type=int, nargs="+", default=[10, 100, 500])
+ap.add_argument("--repeats", type=int, default=20)
+args = ap.parse_args()
+
+rng = np.random.RandomState(0)
+tracker = MultiObjTracker()
+
+print("{:<8} {:>12} {:>16}".format("objects", "loop (ms)", "vectorized (ms)"))
+for n in args.objects:
+	trackers = random_boxes(n, rng, extent=2000, size=(10, 100))
+	detections = trackers + rng.normal(0, 5, trackers.shape)
+
+	expected = loop_association(detections, trackers)
+	matches, unmatched_trackers, unmatched_detections = tracker.associate_detections_to_trackers(detections, trackers)
+	assert np.array_equal(expected[0][np.argsort(expected[0][:, 0])], matches)
+	assert list(unmatched_trackers) == expected[1] and list(unmatched_detections) == expected[2]
+
+	t_loop = median_ms(lambda: loop_association(detections, trackers), args.repeats)
+	t_vec = median_ms(lambda: tracker.associate_detections_to_trackers(detections, trackers), args.repeats)
+	print("{:<8} {:>12.3f} {:>16.3f}".format(n, t_loop, t_vec))
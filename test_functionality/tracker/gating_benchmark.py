@@ -0,0 +1,47 @@
+'''
+Time of the Mahalanobis gating between N tracks and N detections: one
+`gating_distance` call per track against `gating_distance_batch` of the full
+and decoupled filters. All are checked to give the same distances, and the
+fraction of pairs pruned by the gate is reported.
+
+python gating_benchmark.py --objects 10 100 500 --repeats 20
+'''
+
+import sys
+import argparse
+import numpy as np
+
+## Inserting path of src directory
+sys.path.insert(1, '../..')
+from src.tracker.kalman_filter import KalmanFilter, DecoupledKalmanFilter, chi2inv95
+from test_functionality.benchmark_utils import median_ms, random_boxes
+
+
+def per_track_gating(kf, means, covariances, detections):
+	return np.stack([kf.gating_distance(m, c, detections) for m, c in zip(means, covariances)])
+
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--objects", type=int, nargs="+", default=[10, 100, 500])
+ap.add_argument("--repeats", type=int, default=20)
+args = ap.parse_args()
+
+rng = np.random.RandomState(0)
+full, decoupled = KalmanFilter(), DecoupledKalmanFilter()
+
+print("{:<8} {:>14} {:>14} {:>16} {:>8}".format("objects", "loop (ms)", "batched (ms)", "decoupled (ms)", "pruned"))
+for n in args.objects:
+	boxes, variances = random_boxes(n, rng), rng.uniform(1, 10, (n, 4))
+	means, covariances = full.predict_batch(*full.initiate_batch(boxes, variances))
+	detections = boxes + rng.normal(0, 3, boxes.shape)
+
+	expected = per_track_gating(full, means, covariances, detections)
+	assert np.allclose(expected, full.gating_distance_batch(means, covariances, detections))
+	with_var = full.gating_distance_batch(means, covariances, detections, variances)
+	assert np.allclose(with_var, decoupled.gating_distance_batch(means, covariances, detections, variances))
+
+	t_loop = median_ms(lambda: per_track_gating(full, means, covariances, detections), args.repeats)
+	t_batch = median_ms(lambda: full.gating_distance_batch(means, covariances, detections, variances), args.repeats)
+	t_dec = median_ms(lambda: decoupled.gating_distance_batch(means, covariances, detections, variances), args.repeats)
+	pruned = np.mean(with_var > chi2inv95[4])
+	print("{:<8} {:>14.3f} {:>14.3f} {:>16.3f} {:>8.3f}".format(n, t_loop, t_batch, t_dec, pruned))
@@ -0,0 +1,65 @@
+'''
+Per track cost of the predict and update steps of the full 8x8 Kalman filter
+against the block-structured DecoupledKalmanFilter, for single tracks and
+batches of N tracks. Both filters are checked to give the same states, also
+with time steps other than one frame.
+
+python kalman_filter_benchmark.py --tracks 10 100 500 --repeats 20
+'''
+
+import sys
+import argparse
+import numpy as np
+
+## Inserting path of src directory
+sys.path.insert(1, '../..')
+from src.tracker.kalman_filter import KalmanFilter, DecoupledKalmanFilter
+from test_functionality.benchmark_utils import median_ms, random_boxes
+
+
+def single_steps(kf, means, covariances, detections, variances):
+	out = []
+	for mean, covariance, detection, variance in zip(means, covariances, detections, variances):
+		mean, covariance = kf.predict(mean, covariance)
+		out.append(kf.update(mean, covariance, detection, variance))
+	return out
+
+
+def batched_steps(kf, means, covariances, detections, variances):
+	means, covariances = kf.predict_batch(means, covariances)
+	return kf.update_batch(means, covariances, detections, variances)
+
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--tracks", type=int, nargs="+", default=[10, 100, 500])
+ap.add_argument("--repeats", type=int, default=20)
+args = ap.parse_args()
+
+rng = np.random.RandomState(0)
+filters = [("full", KalmanFilter()), ("decoupled", DecoupledKalmanFilter())]
+
+print("{:<8} {:<10} {:>18} {:>18}".format("tracks", "filter", "single (us/track)", "batched (us/track)"))
+for n in args.tracks:
+	boxes, variances = random_boxes(n, rng), rng.uniform(1, 10, (n, 4))
+	detections = boxes + rng.normal(0, 2, boxes.shape)
+	means, covariances = KalmanFilter().initiate_batch(boxes, variances)
+	# A first step so that the velocities and cross covariances are not zero
+	means, covariances = batched_steps(KalmanFilter(), means, covariances, detections, variances)
+
+	results = {}
+	for name, kf in filters:
+		results[name] = (single_steps(kf, means, covariances, detections, variances),
+			batched_steps(kf, means, covariances, detections, variances))
+	for (full_m, full_c), (dec_m, dec_c) in zip(results["full"][0], results["decoupled"][0]):
+		assert np.allclose(full_m, dec_m) and np.allclose(full_c, dec_c)
+	assert all(np.allclose(a, b) for a, b in zip(results["full"][1], results["decoupled"][1]))
+	# Variable time steps, e.g. from the image timestamps
+	for dt in [0.5, 2.3]:
+		full_m, full_c = KalmanFilter().predict_batch(means, covariances, dt)
+		dec_m, dec_c = DecoupledKalmanFilter().predict_batch(means, covariances, dt)
+		assert np.allclose(full_m, dec_m) and np.allclose(full_c, dec_c)
+
+	for name, kf in filters:
+		t_single = 1000*median_ms(lambda: single_steps(kf, means, covariances, detections, variances), args.repeats)/n
+		t_batch = 1000*median_ms(lambda: batched_steps(kf, means, covariances, detections, variances), args.repeats)/n
+		print("{:<8} {:<10} {:>18.2f} {:>18.2f}".format(n, name, t_single, t_batch))
@@ -0,0 +1,57 @@
+'''
+Tracking with keyframe detection (cfg.TRACKING.KEYFRAME): objects moving at
+constant velocity are detected every --interval frames only, and the tracker
+is predicted on every frame, as in model_node. With --missed, one keyframe
+detects nothing, which the tracks (max_age=1) must survive. Every
+object must end up with one confirmed track, created once, for both
+associations.
+
+python keyframe_tracking_check.py --objects 20 --frames 60 --interval 1 3 5
+'''
+
+import sys
+import argparse
+import numpy as np
+
+## Inserting path of src directory
+sys.path.insert(1, '../..')
+from src.tracker.track import MultiObjTracker, TrackState
+
+
+def run(association, interval, objects, frames, missed=None, seed=0):
+	rng = np.random.RandomState(seed)
+	# Objects on a grid so that they never overlap
+	xy = np.stack(np.meshgrid(np.arange(objects)*150., [100.]), axis=-1).reshape(-1, 2)
+	wh = rng.uniform(60, 90, (objects, 2))
+	velocity = rng.uniform(-4, 4, (objects, 2))
+	variance = np.full((objects, 4), 4.)
+
+	tracker = MultiObjTracker(max_age=1, association=association)
+	for frame in range(frames):
+		tracker.predict()
+		if frame % interval == 0:
+			position = xy + frame*velocity
+			boxes = np.concatenate([position, position + wh], axis=1) + rng.normal(0, 1, (objects, 4))
+			if frame == missed:
+				boxes = boxes[:0]
+			tracker.update(boxes, variance[:len(boxes)])
+
+	confirmed = int((tracker.bank.states[tracker.bank.active_slots()] == TrackState.Confirmed).sum())
+	created = tracker._next_id - 1
+	return confirmed, created
+
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--objects", type=int, default=20)
+ap.add_argument("--frames", type=int, default=60)
+ap.add_argument("--interval", type=int, nargs="+", default=[1, 3, 5], help="frames between two detections")
+ap.add_argument("--missed", type=int, default=6, help="keyframe (index) without detections, negative for none")
+args = ap.parse_args()
+
+print("{:<12} {:>9} {:>7} {:>10} {:>8}".format("association", "interval", "missed", "confirmed", "created"))
+for association in ["iou", "gated"]:
+	for interval in args.interval:
+		for missed in [None, interval*args.missed if args.missed >= 0 else None]:
+			confirmed, created = run(association, interval, args.objects, args.frames, missed)
+			print("{:<12} {:>9} {:>7} {:>10} {:>8}".format(association, interval, str(missed), confirmed, created))
+			assert confirmed == args.objects and created == args.objects, (association, interval, missed)
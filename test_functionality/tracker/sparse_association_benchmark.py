@@ -0,0 +1,53 @@
+'''
+Time of the IoU association of MultiObjTracker with one global assignment
+against the connected component decomposition of src/tracker/sparse_assignment.py,
+on a synthetic crowded scene whose density does not change with the number of
+objects (the scene grows with it). Both are checked to give the same total IoU
+of the matches.
+
+python sparse_association_benchmark.py --objects 10 100 500 2000 --repeats 10
+'''
+
+import sys
+import argparse
+import numpy as np
+
+## Inserting path of src directory
+sys.path.insert(1, '../..')
+from src.tracker.track import MultiObjTracker
+from src.tracker.iou_matching import paired_iou
+from test_functionality.benchmark_utils import median_ms
+
+
+def crowded_scene(n, rng, density=2e-4):
+	side = np.sqrt(n / density)
+	xy = rng.uniform(0, side, (n, 2))
+	boxes = np.concatenate([xy, xy + rng.uniform(20, 80, (n, 2))], axis=1)
+	return boxes, boxes + rng.normal(0, 8, boxes.shape)
+
+
+def total_iou(trackers, detections, matches):
+	return paired_iou(trackers[matches[:, 0]], detections[matches[:, 1]]).sum()
+
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--objects", type=int, nargs="+", default=[10, 100, 500, 2000])
+ap.add_argument("--repeats", type=int, default=10)
+ap.add_argument("--workers", type=int, default=0)
+args = ap.parse_args()
+
+rng = np.random.RandomState(0)
+dense = MultiObjTracker(sparse_association=False)
+sparse = MultiObjTracker(sparse_association=True, association_workers=args.workers)
+
+print("{:<8} {:>12} {:>12} {:>10}".format("objects", "dense (ms)", "sparse (ms)", "matches"))
+for n in args.objects:
+	trackers, detections = crowded_scene(n, rng)
+	dense_out = dense.associate_detections_to_trackers(detections, trackers)
+	sparse_out = sparse.associate_detections_to_trackers(detections, trackers)
+	assert np.isclose(total_iou(trackers, detections, dense_out[0]), total_iou(trackers, detections, sparse_out[0]))
+	assert len(dense_out[0]) == len(sparse_out[0])
+
+	t_dense = median_ms(lambda: dense.associate_detections_to_trackers(detections, trackers), args.repeats)
+	t_sparse = median_ms(lambda: sparse.associate_detections_to_trackers(detections, trackers), args.repeats)
+	print("{:<8} {:>12.3f} {:>12.3f} {:>10}".format(n, t_dense, t_sparse, len(sparse_out[0])))
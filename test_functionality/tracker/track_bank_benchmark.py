@@ -0,0 +1,59 @@
+'''
+Time of the Kalman filter predict and update steps of N tracks, one Track
+object at a time against the batched TrackBank storage of MultiObjTracker.
+Both are checked to give the same states.
+
+python track_bank_benchmark.py --tracks 10 100 500 --repeats 20
+'''
+
+import sys
+import argparse
+import numpy as np
+
+## Inserting path of src directory
+sys.path.insert(1, '../..')
+from src.tracker.kalman_filter import KalmanFilter
+from src.tracker.track import Track
+from src.tracker.track_bank import TrackBank
+from test_functionality.benchmark_utils import median_ms, random_boxes
+
+
+def per_track_step(kf, tracks, detections, variances):
+	for track in tracks:
+		track.predict(kf)
+	for track, detection, variance in zip(tracks, detections, variances):
+		track.update(kf, detection, variance)
+
+
+def batched_step(kf, bank, slots, detections, variances):
+	bank.means[slots], bank.covariances[slots] = kf.predict_batch(bank.means[slots], bank.covariances[slots])
+	bank.means[slots], bank.covariances[slots] = kf.update_batch(
+		bank.means[slots], bank.covariances[slots], detections, variances)
+
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--tracks", type=int, nargs="+", default=[10, 100, 500])
+ap.add_argument("--repeats", type=int, default=20)
+args = ap.parse_args()
+
+rng = np.random.RandomState(0)
+kf = KalmanFilter()
+
+print("{:<8} {:>16} {:>16}".format("tracks", "per track (ms)", "batched (ms)"))
+for n in args.tracks:
+	boxes, variances = random_boxes(n, rng), rng.uniform(1, 10, (n, 4))
+	detections = boxes + rng.normal(0, 2, boxes.shape)
+
+	means, covariances = kf.initiate_batch(boxes, variances)
+	tracks = [Track(m.copy(), c.copy(), i, 3, 30) for i, (m, c) in enumerate(zip(means, covariances))]
+	bank = TrackBank(capacity=n)
+	slots = bank.allocate(means, covariances, np.arange(n), 3, 30)
+
+	per_track_step(kf, tracks, detections, variances)
+	batched_step(kf, bank, slots, detections, variances)
+	assert np.allclose(np.stack([t.mean for t in tracks]), bank.means[slots])
+	assert np.allclose(np.stack([t.covariance for t in tracks]), bank.covariances[slots])
+
+	t_loop = median_ms(lambda: per_track_step(kf, tracks, detections, variances), args.repeats)
+	t_batch = median_ms(lambda: batched_step(kf, bank, slots, detections, variances), args.repeats)
+	print("{:<8} {:>16.3f} {:>16.3f}".format(n, t_loop, t_batch))
@@ -0,0 +1,62 @@
+'''
+Time spent by the caller to log the detections of a frame: the figure rendered
+and saved in the loop (as utils.disk_logger) against AsyncLogger
+(src/utils/async_logger.py), which only queues the arrays and the image path.
+With --policy drop, the number of dropped frames is reported.
+
+python async_logger_benchmark.py --image /path/to/kitti/image.png --frames 50 --workers 2 --policy drop
+'''
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+from PIL import Image
+
+## Inserting path of src directory
+sys.path.insert(1, '../..')
+from src.config import Cfg as cfg
+from src.utils.visualizer import Visualizer
+from src.utils.async_logger import AsyncLogger
+from test_functionality.benchmark_utils import synthetic_instances
+
+
+def sync_save(image_path, instances, direc):
+	visualizer = Visualizer(Image.open(image_path).convert("RGB"), instances, image_path, None, cfg)
+	visualizer.draw_instances()
+	visualizer.draw_projection()
+	visualizer.save(direc)
+
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--image", required=True, help="image of the logged frames")
+ap.add_argument("--frames", type=int, default=50)
+ap.add_argument("--objects", type=int, default=10)
+ap.add_argument("--workers", type=int, default=2)
+ap.add_argument("--queue-size", type=int, default=64)
+ap.add_argument("--policy", default="drop", choices=["drop", "block"])
+args = ap.parse_args()
+
+rng = np.random.RandomState(0)
+frames = [synthetic_instances(args.objects, rng, len(cfg.INPUT.LABELS_TO_TRAIN)) for _ in range(args.frames)]
+
+with tempfile.TemporaryDirectory() as direc:
+	start = time.perf_counter()
+	for instances in frames:
+		sync_save(args.image, instances, direc)
+	t_sync = time.perf_counter() - start
+
+	logger = AsyncLogger(cfg, args.workers, args.queue_size, args.policy)
+	start = time.perf_counter()
+	for instances in frames:
+		logger.save_detections(args.image, instances, args.image, direc)
+	t_async = time.perf_counter() - start
+	start = time.perf_counter()
+	logger.close()
+	t_drain = time.perf_counter() - start
+
+print("{:<10} {:>18} {:>14} {:>10}".format("logger", "caller (ms/frame)", "drain (s)", "dropped"))
+print("{:<10} {:>18.2f} {:>14} {:>10}".format("sync", 1000*t_sync/args.frames, "-", 0))
+print("{:<10} {:>18.2f} {:>14.2f} {:>10}".format("async", 1000*t_async/args.frames, t_drain, logger.dropped))
@@ -0,0 +1,70 @@
+'''
+Time of exporting detections to NumPy and to the bytes of msg/Instances.msg,
+per box (toList, then one struct per box as the generated message code does)
+against the vectorized path (Instances.to_numpy and src/utils/msg_builder.py).
+Both serializations are checked to be identical.
+
+python export_benchmark.py --boxes 50 --repeats 100 --device cuda
+'''
+
+import sys
+import time
+import struct
+import argparse
+import numpy as np
+import torch
+
+## Inserting path of src directory
+sys.path.insert(1, '../..')
+from src.utils import Boxes, Instances
+from src.utils.msg_builder import serialize_instances
+
+
+def random_instances(num_boxes, device):
+	xy = torch.rand(num_boxes, 2)*1000
+	boxes = torch.cat([xy, xy + 10 + torch.rand(num_boxes, 2)*200], dim=1)
+	return Instances((375, 1242), pred_boxes=Boxes(boxes.to(device)),
+		pred_variance=torch.rand(num_boxes, 4, device=device), scores=torch.rand(num_boxes, device=device),
+		pred_classes=torch.randint(2, (num_boxes,), device=device))
+
+
+def per_box_export(instances):
+	instances = Instances(instances.image_size, **instances.get_fields())
+	instances.toList()
+	buff = [struct.pack("<3I", 0, 0, 0), struct.pack("<I", 0)]
+	for name in ["pred_boxes", "pred_variance"]:
+		buff.append(struct.pack("<I", len(instances.get(name))))
+		buff += [struct.pack("<4d", *x) for x in instances.get(name)]
+	buff.append(struct.pack("<I", len(instances.scores)))
+	buff += [struct.pack("<dh", s, c) for s, c in zip(instances.scores, instances.pred_classes)]
+	buff += [struct.pack("<2d", 1242, 375), struct.pack("<I", 0)]
+	return b"".join(buff)
+
+
+def vectorized_export(instances):
+	arrays = instances.to_numpy()
+	return serialize_instances(arrays["pred_boxes"], arrays["pred_variance"], arrays["scores"],
+		arrays["pred_classes"], instances.image_size)
+
+
+def time_it(fn, instances, repeats):
+	times = []
+	for _ in range(repeats):
+		start = time.perf_counter()
+		fn(instances)
+		times.append(time.perf_counter() - start)
+	return 1000*np.median(times)
+
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--boxes", type=int, default=50)
+ap.add_argument("--repeats", type=int, default=100)
+ap.add_argument("--device", default="cpu")
+args = ap.parse_args()
+
+instances = random_instances(args.boxes, torch.device(args.device))
+assert per_box_export(instances) == vectorized_export(instances), "Serializations differ"
+
+print("{:<12} {:>10}".format("", "time (ms)"))
+for name, fn in [("per box", per_box_export), ("vectorized", vectorized_export)]:
+	print("{:<12} {:>10.3f}".format(name, time_it(fn, instances, args.repeats)))
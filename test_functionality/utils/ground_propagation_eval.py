@@ -0,0 +1,53 @@
+'''
+Validation of the ground plane uncertainty propagation of Calibration.propagate
+(src/utils/projection.py) against a high-sample Monte Carlo reference, on
+random box bottoms and pixel variances of a KITTI image. For every mode, the
+error of the mean (m) and the relative error of the covariance (Frobenius norm)
+are reported with the time for all the boxes.
+
+python ground_propagation_eval.py --calib /path/to/kitti_tracking/training/calib/0001.txt --boxes 200 --reference-samples 100000
+'''
+
+import sys
+import time
+import argparse
+import numpy as np
+
+## Inserting path of src directory
+sys.path.insert(1, '../..')
+from src.utils.projection import get_calibration
+
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--calib", required=True, help="KITTI calib file")
+ap.add_argument("--boxes", type=int, default=200)
+ap.add_argument("--reference-samples", type=int, default=100000)
+ap.add_argument("--max-std", type=float, default=8.0, help="largest pixel std of the box bottoms")
+args = ap.parse_args()
+
+rng = np.random.RandomState(0)
+calibration = get_calibration(args.calib)
+
+# Box bottoms well below the horizon, where the projection is defined
+pixel_mean = np.stack([rng.uniform(100, 1142, args.boxes), rng.uniform(220, 370, args.boxes)], axis=1)
+pixel_var = np.square(rng.uniform(0.5, args.max_std, (args.boxes, 2)))
+
+# Reference, a few boxes at a time to bound the memory
+ref_mean, ref_cov = [], []
+for start in range(0, args.boxes, 10):
+	m, c = calibration.propagate(pixel_mean[start:start+10], pixel_var[start:start+10], "sampling", args.reference_samples)
+	ref_mean.append(m)
+	ref_cov.append(c)
+ref_mean, ref_cov = np.concatenate(ref_mean), np.concatenate(ref_cov)
+ref_norm = np.linalg.norm(ref_cov, axis=(1, 2))
+
+print("{:<14} {:>14} {:>14} {:>16} {:>10}".format("mode", "mean err (m)", "max mean err", "cov rel. err", "time (ms)"))
+for mode, num_samples in [("linear", 0), ("unscented", 0), ("sampling", 10), ("sampling", 100)]:
+	start = time.perf_counter()
+	mean, cov = calibration.propagate(pixel_mean, pixel_var, mode, num_samples)
+	elapsed = 1000*(time.perf_counter() - start)
+
+	mean_err = np.linalg.norm(mean - ref_mean, axis=1)
+	cov_err = np.linalg.norm(cov - ref_cov, axis=(1, 2))/ref_norm
+	name = mode if mode != "sampling" else "sampling-{}".format(num_samples)
+	print("{:<14} {:>14.4f} {:>14.4f} {:>16.4f} {:>10.3f}".format(name, mean_err.mean(), mean_err.max(), cov_err.mean(), elapsed))
@@ -0,0 +1,43 @@
+'''
+Ground projection of N boxes x S samples: the calib file read and one
+np.linalg.solve per sample (TwoDtoThreeD_cam0) against the cached Calibration
+and its precomputed inverse homography, checked to give the same points.
+
+python projection_benchmark.py --calib /path/to/kitti_tracking/training/calib/0001.txt --boxes 10 50 200
+'''
+
+import sys
+import argparse
+import numpy as np
+
+## Inserting path of src directory
+sys.path.insert(1, '../..')
+from src.utils.projection import TwoDtoThreeD_cam0, read_matrix, get_calibration
+from test_functionality.benchmark_utils import median_ms
+
+
+def per_sample(path, samples):
+	matrix = read_matrix(path)
+	return np.stack([TwoDtoThreeD_cam0(box_samples, matrix) for box_samples in samples])
+
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--calib", required=True, help="KITTI calib file")
+ap.add_argument("--boxes", type=int, nargs="+", default=[10, 50, 200])
+ap.add_argument("--samples", type=int, default=10)
+ap.add_argument("--repeats", type=int, default=20)
+args = ap.parse_args()
+
+rng = np.random.RandomState(0)
+calibration = get_calibration(args.calib)
+
+print("{:<8} {:>14} {:>14}".format("boxes", "loop (ms)", "batched (ms)"))
+for n in args.boxes:
+	# Bottom centers below the horizon of a 375x1242 image
+	bottoms = np.stack([rng.uniform(0, 1242, n), rng.uniform(200, 375, n)], axis=1)
+	samples = bottoms[:, None, :] + rng.normal(0, 3, (n, args.samples, 2))
+	assert np.allclose(per_sample(args.calib, samples), calibration.to_ground(samples))
+
+	t_loop = median_ms(lambda: per_sample(args.calib, samples), args.repeats)
+	t_batch = median_ms(lambda: get_calibration(args.calib).to_ground(samples), args.repeats)
+	print("{:<8} {:>14.3f} {:>14.3f}".format(n, t_loop, t_batch))
@@ -0,0 +1,51 @@
+'''
+Time to render one frame (boxes, labels, corner ellipses and the bird's eye
+view) with the matplotlib Visualizer against the RasterRenderer
+(src/utils/renderer.py), for a growing number of objects. The projection is
+computed once and given to both.
+
+python renderer_benchmark.py --objects 1 10 50 --repeats 10 --save
+'''
+
+import sys
+import argparse
+import numpy as np
+from PIL import Image
+
+## Inserting path of src directory
+sys.path.insert(1, '../..')
+from src.config import Cfg as cfg
+from src.utils.visualizer import Visualizer
+from src.utils.renderer import RasterRenderer
+from test_functionality.benchmark_utils import median_ms, synthetic_instances
+
+
+def matplotlib_frame(image, instances, projection):
+	visualizer = Visualizer(image, instances, "", None, cfg, projection)
+	visualizer.draw_instances()
+	visualizer.draw_projection()
+	return visualizer.get_image()
+
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--objects", type=int, nargs="+", default=[1, 10, 50])
+ap.add_argument("--repeats", type=int, default=10)
+ap.add_argument("--save", action="store_true", help="write both renderings of the last size")
+args = ap.parse_args()
+
+rng = np.random.RandomState(0)
+image = Image.fromarray(rng.randint(0, 255, (375, 1242, 3), dtype=np.uint8))
+renderer = RasterRenderer(cfg.INPUT.LABELS_TO_TRAIN)
+
+print("{:<8} {:>16} {:>14}".format("objects", "matplotlib (ms)", "raster (ms)"))
+for n in args.objects:
+	instances = synthetic_instances(n, rng, len(cfg.INPUT.LABELS_TO_TRAIN))
+	projection = (np.stack([rng.uniform(-12, 12, n), rng.uniform(5, 45, n)], axis=1), rng.uniform(0.1, 2, (n, 2)))
+
+	t_mpl = median_ms(lambda: matplotlib_frame(image, instances, projection), args.repeats)
+	t_raster = median_ms(lambda: renderer.render(image, instances, projection), args.repeats)
+	print("{:<8} {:>16.2f} {:>14.2f}".format(n, t_mpl, t_raster))
+
+if args.save:
+	Image.fromarray(matplotlib_frame(image, instances, projection)).save("render_matplotlib.png")
+	Image.fromarray(np.ascontiguousarray(renderer.render(image, instances, projection))).save("render_raster.png")
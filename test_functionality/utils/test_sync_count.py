@@ -0,0 +1,120 @@
+'''
+Counts the device to host synchronizations of the detector under every check
+mode of src/utils/checks.py. Host reads are counted at the Python level
+(Tensor.item, bool(), tolist, int(), float()); syncs inside compiled kernels
+such as NMS or nonzero are not counted.
+
+python -m unittest test_sync_count
+'''
+
+import sys
+import unittest
+import contextlib
+import torch
+
+## Inserting path of src directory
+sys.path.insert(1, '../..')
+from src.config import Cfg as cfg
+from src.detection import Detector
+from src.utils import Boxes, Instances, Matcher, Box2BoxXYXYTransform, set_check_mode, flush_checks
+
+
+@contextlib.contextmanager
+def count_syncs():
+	"""
+	Yields a one element list that holds the number of host reads of tensors
+	inside the `with` block.
+	"""
+	counter = [0]
+	names = ["item", "tolist", "__bool__", "__int__", "__float__"]
+	originals = {name: getattr(torch.Tensor, name) for name in names}
+
+	def counting(original):
+		def wrapper(self, *args, **kwargs):
+			counter[0] += 1
+			return original(self, *args, **kwargs)
+		return wrapper
+
+	for name, original in originals.items():
+		setattr(torch.Tensor, name, counting(original))
+	try:
+		yield counter
+	finally:
+		for name, original in originals.items():
+			setattr(torch.Tensor, name, original)
+
+
+def random_boxes(n, image_size=(375, 1242)):
+	h, w = image_size
+	xy = torch.rand(n, 2)*torch.tensor([w*0.8, h*0.8])
+	wh = 10 + torch.rand(n, 2)*torch.tensor([w*0.2, h*0.2])
+	return torch.cat([xy, xy + wh], dim=1)
+
+
+class TestSyncCount(unittest.TestCase):
+
+	def setUp(self):
+		torch.manual_seed(0)
+
+	def tearDown(self):
+		set_check_mode("debug")
+
+	def box_ops(self):
+		transform = Box2BoxXYXYTransform(weights=cfg.ROI_HEADS.BBOX_REG_WEIGHTS)
+		matcher = Matcher([0.5], [0, 1])
+		src, target = random_boxes(100), random_boxes(100)
+		deltas = transform.get_deltas(src, target)
+		transform.apply_deltas(deltas, src)
+		transform.apply_deltas_variance(deltas.abs(), src)
+		matcher(torch.rand(5, 100))
+		Boxes(src.clone()).clip((375, 1242))
+
+	def test_box_ops(self):
+		counts = {}
+		for mode in ["debug", "deferred", "off"]:
+			set_check_mode(mode)
+			with count_syncs() as counter:
+				self.box_ops()
+				flush_checks()
+			counts[mode] = counter[0]
+
+		self.assertEqual(counts["debug"], 5)
+		self.assertEqual(counts["deferred"], 1) # the flush
+		self.assertEqual(counts["off"], 0)
+
+	def test_deferred_failure(self):
+		set_check_mode("deferred")
+		transform = Box2BoxXYXYTransform(weights=cfg.ROI_HEADS.BBOX_REG_WEIGHTS)
+		deltas = torch.zeros(3, 4)
+		deltas[1, 2] = float("nan")
+		transform.apply_deltas(deltas, random_boxes(3))
+		with self.assertRaises(AssertionError):
+			flush_checks()
+
+	def test_detector_inference(self):
+		in_channels, stride, image_size = 64, 16, (375, 1242)
+		detector = Detector(cfg, stride, in_channels).eval()
+		features = torch.randn(2, in_channels, image_size[0]//stride, image_size[1]//stride)
+
+		proposals = []
+		for _ in range(2):
+			p = Instances(image_size)
+			p.proposal_boxes = Boxes(random_boxes(300, image_size))
+			p.objectness_logits = torch.randn(300)
+			proposals.append(p)
+
+		counts = {}
+		with torch.no_grad():
+			for mode in ["debug", "off"]:
+				set_check_mode(mode)
+				with count_syncs() as counter:
+					detector(features, proposals, None, False)
+				counts[mode] = counter[0]
+
+		# The only unavoidable read is the number of detections per image
+		self.assertEqual(counts["off"], 1)
+		self.assertLess(counts["off"], counts["debug"])
+
+
+if __name__ == '__main__':
+	unittest.main()
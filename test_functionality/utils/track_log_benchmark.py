@@ -0,0 +1,61 @@
+'''
+Cost per frame of TrackLogWriter.write (src/utils/track_log.py) against
+appending the frame to an in-memory list, and a round trip through the
+rotated files of the log checked against the written tracks.
+
+python track_log_benchmark.py --frames 10000 --tracks 20 --max-mb 1
+'''
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+import numpy as np
+
+## Inserting path of src directory
+sys.path.insert(1, '../..')
+from src.utils.track_log import TrackLogWriter, read_track_log, log_files
+
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--frames", type=int, default=10000)
+ap.add_argument("--tracks", type=int, default=20)
+ap.add_argument("--max-mb", type=float, default=1.0, help="rotation size of the log files")
+args = ap.parse_args()
+
+rng = np.random.RandomState(0)
+track_ids = np.arange(args.tracks)
+boxes = rng.uniform(0, 1000, (args.frames, args.tracks, 4))
+variances = rng.uniform(1, 10, (args.frames, args.tracks, 4))
+
+output = []
+start = time.perf_counter()
+for frame in range(args.frames):
+	output.append(list(boxes[frame])+list(variances[frame]))
+t_list = time.perf_counter() - start
+
+directory = tempfile.mkdtemp()
+prefix = os.path.join(directory, "track_log")
+try:
+	writer = TrackLogWriter(prefix, max_bytes=int(args.max_mb*2**20))
+	start = time.perf_counter()
+	for frame in range(args.frames):
+		writer.write(frame, 0.1*frame, track_ids, boxes[frame], variances[frame])
+	t_log = time.perf_counter() - start
+	writer.close()
+
+	records = read_track_log(prefix)
+	assert len(records) == args.frames*args.tracks
+	assert np.array_equal(records["frame"], np.repeat(np.arange(args.frames), args.tracks))
+	assert np.array_equal(records["track_id"], np.tile(track_ids, args.frames))
+	assert np.array_equal(records["mean"], boxes.reshape(-1, 4))
+	assert np.array_equal(records["variance"], variances.reshape(-1, 4))
+
+	print("{:<12} {:>14}".format("", "us/frame"))
+	print("{:<12} {:>14.2f}".format("list", 1e6*t_list/args.frames))
+	print("{:<12} {:>14.2f}".format("track log", 1e6*t_log/args.frames))
+	print("{} records in {} files".format(len(records), len(log_files(prefix))))
+finally:
+	shutil.rmtree(directory)